@@ -2,458 +2,619 @@ import os
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
 import os
-import torch
 import cv2
 import numpy as np
-import tempfile
-from ultralytics import YOLO
-import shutil
-
+import itertools
+import logging
+import time
+import uuid
+import torch
+from ultralytics.engine.results import Results
+
+import config
+from model_registry import registry
+from video_io import read_frames, VideoSink
+from pipeline import PipelineStats, ThreadedSink, prefetch
+from stump_cache import stump_cache
+from track_cache import track_cache, file_hash, TrackEntry
+from result_store import ResultStore, result_store, copy_atomic, write_atomic
+from upload_stream import UploadStream
+from trajectory_renderer import TrajectoryRenderer, blend_line
+from ball_tracker import BallTracker
+from frame_scheduler import FrameScheduler
+from frame_transport import get_transport
+from profiling import StageTimer
+from ball_track import BallTrack, Detections, MaskStats
+import decision
+from decision import PitchDetector, analyse_track
+
+logger = logging.getLogger(__name__)
+
+
+class LBWJob:
+    """Mutable decision state for a single video/stump image pair.
+
+    The YOLO weights are shared process-wide through the model registry, so
+    everything that changes while a delivery is processed lives here instead.
+    """
+
+    __slots__ = (
+        'COORDINATES', 'DETECTED_BOXES', 'CROPS', 'STUMP_LAYOUT', 'BELOW_STUMP',
+        'PITCH_BOUNCE', 'PIXEL_VALUES', 'IN_LINE', 'PITCH_POINT',
+        'IMPACT_POINT', 'HITTING_STUMPS', 'RESULT_FRAME', 'VERDICT', 'TIMINGS', 'TRACK',
+        'ANALYSIS', 'LAST_FRAME', 'FRAME_COUNT', 'DETECTIONS',
+    )
 
-class LBWDetectionModel:
     def __init__(self):
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-
-        # Load models
-        self.ball_detection_model = YOLO('ball_segmentation.pt').to(self.device)
-        self.stump_detection_model = YOLO('stump_detection.pt').to(self.device)
-        self.stump_img_path = None
-        self.input_video_path = None
-        self.output_video_path = 'output_video.mp4'
-        self.oops_message_img = 'oops_message.jpeg'
-        #create radoam file name for output image
-        name = "output_image" + str(np.random.randint(0, 1000)) + ".jpg"
-        self.output_image_path = name
-        
         self.COORDINATES = {} # format {'x1': 0, 'y1': 0, 'x2': 0, 'y2': 0}
         self.DETECTED_BOXES = []
         self.CROPS = []
-        self.TEMP_DIR = None
+        self.STUMP_LAYOUT = None
         self.BELOW_STUMP = False
         self.PITCH_BOUNCE = False
-        self.PIXEL_VALUES = []
+        self.PIXEL_VALUES = MaskStats()
         self.IN_LINE = []
         self.PITCH_POINT = None
         self.IMPACT_POINT = None
         self.HITTING_STUMPS = None
         self.RESULT_FRAME = None
+        self.VERDICT = None
+        self.TIMINGS = StageTimer()
+        self.TRACK = BallTrack()
+        self.ANALYSIS = None
+        self.LAST_FRAME = None # annotated last frame, before the predicted path is drawn
+        self.FRAME_COUNT = 0
+        self.DETECTIONS = None # Detections per frame, kept for the track cache
+
+
+class LBWDetectionModel:
+    def __init__(self, batch_size=None, use_roi=None, tracking=None, use_track_cache=None, pipelined=None,
+                 adaptive=None, use_result_store=None, frame_workers=None):
+        self.device = registry.device
+        # Number of frames sent to the ball model in one call
+        self.batch_size = max(1, batch_size or config.BALL_BATCH_SIZE)
+        # Crop frames to the pitch corridor before ball inference
+        self.use_roi = config.BALL_ROI if use_roi is None else use_roi
+        self.ball_roi = None
+        # Follow the ball with Kalman-predicted search windows once it is found
+        self.tracking = config.BALL_TRACKING if tracking is None else tracking
+        self.tracker = None
+        # Run the ball model on every n-th frame while the ball is out of play,
+        # on every frame around the bounce and the impact (takes precedence
+        # over tracking)
+        self.adaptive = config.ADAPTIVE_SAMPLING if adaptive is None else adaptive
+        self.scheduler = None
+        # Decode and encode in their own threads around the inference loop
+        self.pipelined = config.PIPELINE if pipelined is None else pipelined
+        self.queue_depth = max(1, config.PIPELINE_QUEUE_DEPTH)
+        # Decode and run the ball model in this many processes of their own,
+        # frames shared through memory (0 keeps both in this process)
+        self.frame_workers = config.FRAME_WORKERS if frame_workers is None else frame_workers
+        # Reuse stored ball tracks for videos that were already processed
+        self.use_track_cache = config.TRACK_CACHE if use_track_cache is None else use_track_cache
+        # Answer inputs that were decided before from the stored result
+        self.use_result_store = config.RESULT_STORE if use_result_store is None else use_result_store
+        self.extension_factor = decision.EXTENSION_FACTOR
+
+        # Shared models, loaded once per worker process by the registry
+        self.ball_detection_model = registry.ball_model()
+        self.stump_detection_model = registry.stump_model()
+        self.stump_img_path = None
+        self.input_video_path = None
+        # Reader over the video while it is still being uploaded, see get_result
+        self.upload = None
+        self.output_video_path = 'output_video.mp4'
+        self.oops_message_img = 'oops_message.jpeg'
+        # Unique per instance, so callers sharing a directory never overwrite
+        # each other's result; written atomically
+        self.output_image_path = f'output_image_{uuid.uuid4().hex}.jpg'
+        # False skips every per-frame overlay and the annotated video, only the
+        # decision and the final result frame are produced
+        self.render_video = True
+        
+        self.job = LBWJob()
+
+    def stump_layout(self, stump_img, class_name='stumps'):
+        # Stump boxes and crops come from the process-wide cache, keyed by the
+        # stump image content, so the stump model runs once per camera setup
+        if self.job.STUMP_LAYOUT is None:
+            layout = stump_cache.get_or_detect(stump_img, self.stump_detection_model, class_name)
+            self.job.STUMP_LAYOUT = layout
+            self.job.DETECTED_BOXES = list(layout.boxes)
+            self.job.CROPS = layout.crops
+            self.job.IN_LINE = layout.in_line
+        return self.job.STUMP_LAYOUT
 
     def detect_and_crop(self, image, class_name='stumps'):
-        if self.CROPS == [] or self.TEMP_DIR is None:
-            results = self.stump_detection_model(image)[0]
-            results = self.stump_detection_model(image)[0]  # Run inference
-            self.TEMP_DIR = tempfile.mkdtemp()  # Temporary directory for cropped images
-            
-            for i, box in enumerate(results.boxes.xyxy):
-                cls = int(results.boxes.cls[i])
-                class_label = results.names[cls]
-                
-                if class_label == class_name:
-                    x1, y1, x2, y2 = map(int, box)
-                    cropped_img = image[y1:y2, x1:x2]
-                    crop_path = os.path.join(self.TEMP_DIR, f'crop_{i}.png')
-                    cv2.imwrite(crop_path, cropped_img)
-                    self.CROPS.append((crop_path, (x1, y1, x2, y2)))
-            return self.CROPS, self.TEMP_DIR
-        else:
-            return self.CROPS, self.TEMP_DIR
+        return self.stump_layout(image, class_name).crops
 
     def overlay_image(self, background, foreground, coords, alpha=0.8):
         x1, y1, x2, y2 = coords
-        resized_fg = cv2.resize(foreground, (x2 - x1, y2 - y1))
+        if foreground.shape[:2] != (y2 - y1, x2 - x1):
+            foreground = cv2.resize(foreground, (x2 - x1, y2 - y1))
         roi = background[y1:y2, x1:x2]
-        blended = cv2.addWeighted(roi, 1 - alpha, resized_fg, alpha, 0)
+        blended = cv2.addWeighted(roi, 1 - alpha, foreground, alpha, 0)
         background[y1:y2, x1:x2] = blended
 
     def detect_and_draw_boxes_with_overlay(self, image, stump_img, class_name='stumps'):
         annotated_image = image.copy()
-        
-        if not self.DETECTED_BOXES:
-            results = self.stump_detection_model(stump_img)[0]
-            for i, box in enumerate(results.boxes.xyxy):
-                cls = int(results.boxes.cls[i])
-                class_label = results.names[cls]
-                
-                if class_label == class_name:
-                    x1, y1, x2, y2 = map(int, box)
-                    self.DETECTED_BOXES.append((x1, y1, x2, y2))
-        print("Detected boxes:", self.DETECTED_BOXES)
-        if len(self.DETECTED_BOXES) == 2:
-            (x1a, y1a, x2a, y2a), (x1b, y1b, x2b, y2b) = self.DETECTED_BOXES
-            pts = np.array([[x2b, y2b], [x2a, y2a], [x1a, y2a], [x1b, y2b]], np.int32).reshape((-1, 1, 2))
-            self.IN_LINE = [[x2b, y2b], [x2a, y2a], [x1a, y2a], [x1b, y2b]]
-            overlay = np.zeros_like(annotated_image)
-            cv2.fillPoly(overlay, [pts], (128, 128, 128))
+        layout = self.stump_layout(stump_img, class_name)
+        logger.debug("Detected boxes: %s", self.job.DETECTED_BOXES)
+        if len(self.job.DETECTED_BOXES) == 2:
+            (x1a, y1a, x2a, y2a), (x1b, y1b, x2b, y2b) = self.job.DETECTED_BOXES
+            overlay = layout.overlay
+            if overlay.shape != annotated_image.shape:
+                pts = np.array(self.job.IN_LINE, np.int32).reshape((-1, 1, 2))
+                overlay = np.zeros_like(annotated_image)
+                cv2.fillPoly(overlay, [pts], (128, 128, 128))
             cv2.addWeighted(overlay, 0.35, annotated_image, 0.65, 0, annotated_image)
             cv2.line(annotated_image, (x1a, y2a), (x1b, y2b), (128, 128, 128), 1)
             cv2.line(annotated_image, (x2a, y2a), (x2b, y2b), (128, 128, 128), 1)
             
         return annotated_image
 
-    def process_video(self):
-        cap = cv2.VideoCapture(self.input_video_path)
-
-        frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        fps = int(cap.get(cv2.CAP_PROP_FPS))
-
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(self.output_video_path, fourcc, fps, (frame_width, frame_height))
-        object_positions_before_pitch = []
-        object_positions_after_pitch = []
-        previous_positions = []
-        frame_number = 0
-        selected_stump= None
-        seaming = None
-        
-
-        stump_img = cv2.imread(self.stump_img_path)
-
-        while cap.isOpened():
-            print(frame_number , (int(cap.get(cv2.CAP_PROP_FRAME_COUNT))))
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            frame_number += 1
-            current_positions = []
-            results = self.ball_detection_model(frame)
+    def pitch_corridor_roi(self, frame_shape):
+        # Padded box around both stumps, extended to the top of the frame since
+        # the ball comes down through the area above the pitch
+        if len(self.job.DETECTED_BOXES) != 2:
+            return None
+        height, width = frame_shape[:2]
+        x_start = min(box[0] for box in self.job.DETECTED_BOXES)
+        x_end = max(box[2] for box in self.job.DETECTED_BOXES)
+        y_end = max(box[3] for box in self.job.DETECTED_BOXES)
+        pad = int(config.BALL_ROI_PAD * (x_end - x_start))
+        return (max(x_start - pad, 0), 0, min(x_end + pad, width), min(y_end + pad, height))
+
+    def region_imgsz(self, frame_shape, region):
+        # Keep the crop at the scale the full frame would be inferred at, so the
+        # ball looks the same to the model and cost follows the crop area
+        x0, y0, x1, y1 = region
+        scale = config.BALL_IMGSZ / max(frame_shape[:2])
+        return max(32, int(np.ceil(max(x1 - x0, y1 - y0) * scale / 32)) * 32)
+
+    def to_frame_coordinates(self, result, frame_shape, region):
+        # Shift boxes from crop to full-frame coordinates, masks only feed pixel
+        # counts so they can stay in crop space
+        x0, y0 = region[:2]
+        boxes = result.boxes.data.clone()
+        boxes[:, [0, 2]] += x0
+        boxes[:, [1, 3]] += y0
+        result.orig_shape = frame_shape[:2]
+        result.update(boxes=boxes)
+
+    def detect_ball_in_region(self, frames, region=None):
+        # region is (x0, y0, x1, y1) in frame coordinates, None for the full frame
+        verbose = logger.isEnabledFor(logging.DEBUG)
+        with self.job.TIMINGS.stage("ball_inference"):
+            if region is None:
+                return self.ball_detection_model(frames, verbose=verbose)
+            x0, y0, x1, y1 = region
+            crops = [np.ascontiguousarray(frame[y0:y1, x0:x1]) for frame in frames]
+            results = self.ball_detection_model(crops, imgsz=self.region_imgsz(frames[0].shape, region), verbose=verbose)
+            for frame, result in zip(frames, results):
+                self.to_frame_coordinates(result, frame.shape, region)
+            return results
+
+    def corridor_fallback(self, detections):
+        # The corridor crop loses a ball that leaves it, one pitched wide of the
+        # stumps say. A frame where the ball touches a side of the crop that is
+        # not a side of the frame, or vanishes from the crop, is searched again
+        # on the full frame, and so are the ones after it until the ball is back
+        # well inside the crop
+        x0, y0, x1, y1 = self.ball_roi
+        def first_box(result):
+            xyxy = result.xyxy if isinstance(result, Detections) else result.boxes.xyxy
+            return xyxy[0].tolist() if len(xyxy) else None
+
+        def inside(box, shape):
+            height, width = shape[:2]
+            return ((x0 == 0 or box[0] > x0 + 1) and (y0 == 0 or box[1] > y0 + 1) and
+                    (x1 == width or box[2] < x1 - 1) and (y1 == height or box[3] < y1 - 1))
+
+        escaped = seen = False
+        for frame, results in detections:
+            box = first_box(results[0])
+            if escaped or (box is None and seen) or (box is not None and not inside(box, frame.shape)):
+                results = self.detect_ball_in_region([frame])
+                box = first_box(results[0])
+                if box is not None and not escaped:
+                    logger.debug("Ball left the pitch corridor, searching the full frame")
+                escaped = box is not None and not inside(box, frame.shape)
+            seen = box is not None
+            yield frame, results
+
+    def detect_ball_tracked(self, frames_iter):
+        # Full-frame (or corridor) search until the ball is locked, then only a
+        # window around the Kalman prediction. Frames where the locked ball is
+        # briefly missed are held back and, if the track resumes, filled in by
+        # interpolating between the detections on either side of the gap.
+        tracker = self.tracker = BallTracker()
+        pending = []  # (frame, result) held back during a dropout
+        last_box = None
+        for frame in frames_iter:
+            window = tracker.search_window(frame.shape)
+            result = self.detect_ball_in_region([frame], window or self.ball_roi)[0]
+            box = result.boxes.xyxy[0].tolist() if len(result.boxes) else None
+            was_locked = tracker.locked
+            tracker.update(box)
+
+            if box is None and tracker.locked:
+                pending.append((frame, result))
+                continue
+
+            if box is not None and pending and was_locked:
+                for i, (held_frame, held_result) in enumerate(pending, start=1):
+                    t = i / (len(pending) + 1)
+                    filled = [a + (b - a) * t for a, b in zip(last_box, box)]
+                    tracker.filled += 1
+                    yield held_frame, [self.with_filled_box(held_result, filled)]
+            else:
+                # Track lost (or ended), the held frames stay without a ball
+                for held in pending:
+                    yield held[0], [held[1]]
+            pending = []
+
+            if box is not None:
+                last_box = box
+            yield frame, [result]
+
+        for held in pending:
+            yield held[0], [held[1]]
+
+    def with_filled_box(self, result, box):
+        # Gap-filled detections get confidence 0 so they can be told apart
+        cls = result.boxes.cls[:1].tolist() or [0]
+        data = torch.tensor([box + [0.0, cls[0]]], dtype=torch.float32)
+        result.update(boxes=data)
+        return result
+
+    def skipped_result(self, frame, template, box=None):
+        # Stands in for the result of a frame the ball model did not see: the
+        # interpolated box with confidence 0, or no box at all
+        if box is None:
+            data = torch.zeros((0, 6), dtype=torch.float32)
+        else:
+            cls = template.boxes.cls[:1].tolist() or [0]
+            data = torch.tensor([box + [0.0, cls[0]]], dtype=torch.float32)
+        return Results(frame, path=template.path, names=template.names, boxes=data)
+
+    def detect_ball_adaptive(self, frames_iter):
+        # The scheduler picks the frames the ball model sees. Skipped frames are
+        # held back until the next sample, then either interpolated or, if the
+        # sample shows something happened in between, inferred after all.
+        scheduler = self.scheduler = FrameScheduler(self.job.DETECTED_BOXES)
+        def first_box(result):
+            return result.boxes.xyxy[0].tolist() if len(result.boxes) else None
+
+        pending = []
+        number = 0
+        for frame in frames_iter:
+            number += 1
+            if not scheduler.infer_next():
+                pending.append(frame)
+                continue
+
+            result = self.detect_ball_in_region([frame], self.ball_roi)[0]
+            box = first_box(result)
+            if scheduler.refine(number, box, len(pending)):
+                held_results = self.detect_ball_in_region(pending, self.ball_roi)
+                for held_number, held_frame, held_result in zip(itertools.count(number - len(pending)), pending,
+                                                                 held_results):
+                    scheduler.observe(held_number, first_box(held_result))
+                    yield held_frame, [held_result]
+            else:
+                for held_frame, filled in zip(pending, scheduler.interpolate(number, box, len(pending))):
+                    yield held_frame, [self.skipped_result(held_frame, result, filled)]
+            pending = []
+            scheduler.observe(number, box)
+            yield frame, [result]
+
+        if pending:
+            # The stream ended between samples, what the ball did there is unknown
+            if scheduler.present:
+                scheduler.refined += len(pending)
+                for held_frame, held_result in zip(pending, self.detect_ball_in_region(pending, self.ball_roi)):
+                    yield held_frame, [held_result]
+            else:
+                for held_frame in pending:
+                    yield held_frame, [self.skipped_result(held_frame, result)]
+
+    def detect_ball_batched(self, frames_iter):
+        # Collect up to batch_size frames and run the ball model once on all of
+        # them, then hand back (frame, results) one frame at a time in order
+        frames_iter = iter(frames_iter)
+        while True:
+            frames = list(itertools.islice(frames_iter, self.batch_size))
+            if not frames:
+                return
+
+            results = self.detect_ball_in_region(frames, self.ball_roi)
+            for frame, result in zip(frames, results):
+                yield frame, [result]
+
+            if len(frames) < self.batch_size:
+                return
+
+    def collect_detections(self, results, frame_number):
+        # Stage one: box coordinates, mask statistics and the tracked ball for
+        # one frame. Returns all boxes (for drawing), the ball centre (or None)
+        # and the ball's (box area, mask pixels, confidence).
+        all_boxes = []
+        ball = ball_stats = None
+        for result in results:
+            # All boxes of the frame in one host copy, and the segmented pixels
+            # of every mask (mask i belongs to box i) at once. Frame workers
+            # and the track cache send these already extracted
+            detections = result if isinstance(result, Detections) else Detections.from_result(result)
+            if self.job.DETECTIONS is not None:
+                self.job.DETECTIONS.append(detections)
+            xyxy = detections.xyxy
+
+            # Calculate the area from bounding box
+            areas = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+
+            pixels = []
+            if detections.pixels is not None:
+                pixels = detections.pixels
+                self.job.PIXEL_VALUES.append(frame_number, areas[:len(pixels)], pixels)
+            elif len(xyxy):
+                logger.debug("No masks available for this detection.")
+
+            # The first detection of the frame is the one that gets tracked
+            if len(xyxy) and ball is None:
+                x1, y1, x2, y2 = xyxy[0].tolist()
+                ball = ((x1 + x2) // 2, (y1 + y2) // 2)
+                ball_stats = (int(areas[0]), int(pixels[0]) if len(pixels) else 0, float(detections.conf[0]))
+
+            if len(xyxy):
+                x1, y1, x2, y2 = xyxy[-1].tolist()
+                self.job.COORDINATES.update(x1=x1, y1=y1, x2=x2, y2=y2)
+            all_boxes.extend(xyxy.tolist())
+        return all_boxes, ball, ball_stats
+
+    def annotate_frame(self, frame, stump_img, boxes, trajectory):
+        # Per-frame overlays: pitch corridor and stumps, detection boxes and the
+        # ball path tracked so far
+        timings = self.job.TIMINGS
+        with timings.stage("stump_overlay"):
             frame = self.detect_and_draw_boxes_with_overlay(frame, stump_img=stump_img, class_name='stumps')
-            
-            cropped_images, temp_dir = self.detect_and_crop(stump_img, class_name='stumps')
-            for crop_path, coords in cropped_images:
-                cropped_img = cv2.imread(crop_path)
+            for cropped_img, coords in self.detect_and_crop(stump_img, class_name='stumps'):
                 self.overlay_image(frame, cropped_img, coords)
 
-            for result in results:
-                boxes = result.boxes
-                masks = result.masks  # Get the segmentation masks (may be None)
-
-                for box in boxes:
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-                    self.COORDINATES['x1'] = x1
-                    self.COORDINATES['y1'] = y1
-                    self.COORDINATES['x2'] = x2
-                    self.COORDINATES['y2'] = y2
-
-                    # Calculate the area from bounding box
-                    area = (x2 - x1) * (y2 - y1)
-                    
-                    # Check if masks are available before proceeding
-                    if masks is not None:
-                        for mask in masks:
-                            # Access the raw mask data
-                            mask_data = mask.data.cpu().numpy()  # Convert to NumPy array if it's a tensor
-
-                            # Ensure mask is 2D
-                            if mask_data.ndim > 2:  # If the mask has more than 2 dimensions (e.g., multi-channel)
-                                mask_data = np.sum(mask_data, axis=0)  # Sum over the channels to get a single-channel mask
-                            
-                            # Convert to binary mask (threshold > 0.5)
-                            mask_data = (mask_data > 0.5).astype(np.uint8)
-
-                            # Count the segmented pixels
-                            segmented_pixels = np.sum(mask_data)  # Count the segmented pixels
-                            self.PIXEL_VALUES.append((area, segmented_pixels))
-                    else:
-                        print("No masks available for this detection.")
-
-                    # Calculate the center of the bounding box
-                    center_x = (x1 + x2) // 2
-                    center_y = (y1 + y2) // 2
-                    current_positions.append((center_x, center_y))
-
-
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            if self.PITCH_BOUNCE and current_positions and len(object_positions_after_pitch) > 1 and seaming:
-                if seaming == "Right":
-                    if current_positions[0][0] > object_positions_after_pitch[-1][0][0]:
-                        print("seaming opposite side !!")
-                if seaming == "Left":
-                    if current_positions[0][0] < object_positions_after_pitch[-1][0][0]:
-                        print("seaming opposite side !!")
-                        
+        with timings.stage("trajectory_drawing"):
+            for x1, y1, x2, y2 in boxes:
+                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+
+            # Draw connecting lines between consecutive positions of detected objects,
+            # each segment is rasterised once and composited every frame
+            frame = trajectory.render(frame)
+
+            track = self.job.TRACK
+            before, after = track.before(), track.after()
+            if len(after) and len(before):
+                cv2.line(frame, track.point(before[-1]), track.point(after[0]), (0, 0, 255), 7)
+
+            if len(after) > 1:
+                # Connect the first and last detected positions after the pitch (in red)
+                frame = blend_line(frame, track.point(after[0]), track.point(after[-1]), (0, 0, 255), 7, opacity=0.5)
+        return frame
+
+    def draw_extension(self, frame, analysis):
+        # The post-pitch line (in red) and its predicted extension (in blue)
+        if analysis["extension"] is None:
+            return frame
+        first, last, extended = analysis["extension"]
+
+        # Create an overlay
+        overlay = frame.copy()
+        cv2.line(overlay, first, last, (0, 0, 255), 7)
+
+        # Blend the overlay with the original frame
+        opacity = 0.5  # Adjust the opacity level (0.0 to 1.0)
+        frame = cv2.addWeighted(overlay, opacity, frame, 1 - opacity, 0)
+
+        cv2.line(frame, last, extended, (255, 0, 0), 7)
+        frame = cv2.addWeighted(overlay, opacity, frame, 1 - opacity, 0)
+        return frame
+
+    def open_capture(self):
+        if self.upload is None:
+            return cv2.VideoCapture(self.input_video_path)
+        try:
+            # Decodes the bytes as they arrive, needs OpenCV's stream reader API (4.9+)
+            return cv2.VideoCapture(self.upload, cv2.CAP_FFMPEG, [])
+        except (TypeError, cv2.error):
+            logger.warning("OpenCV cannot read from streams, waiting for the whole upload")
+            self.upload.wait_complete()
+            return cv2.VideoCapture(self.input_video_path)
+
+    def process_video(self, cached=None):
+        # ``cached`` are the per-frame Detections of an earlier run of the same
+        # video: it is decoded again only to draw the annotated video, the ball
+        # model does not run
+        cap = self.open_capture()
+        if not cap.isOpened():
+            raise ValueError("Error opening video file.")
+
+        # Only a capacity hint, the end of the stream is what ends the delivery
+        expected_frames = max(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), 1)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30  # Assign default FPS if extraction fails
+
+        # Writing the annotated video is optional, set output_video_path to None
+        # or render_video to False to skip it
+        out = None
+        if self.render_video and self.output_video_path:
+            out = VideoSink(self.output_video_path, fps, timer=self.job.TIMINGS)
+        frame_number = 0
+        trajectory = TrajectoryRenderer(color=(0, 0, 255), thickness=7, opacity=0.5)
 
-            
-            if not selected_stump:  #selected stumps holds the coordinates of the batting stumps
-                selected_stump = min(self.DETECTED_BOXES, key=lambda stump: stump[1])
-            
-            if not self.BELOW_STUMP and current_positions and current_positions[0][1] > selected_stump[1] :
-                print("Ball below stump height !!")
-                self.BELOW_STUMP = True
-            
-            if self.BELOW_STUMP and current_positions and current_positions[0][1] < selected_stump[1]:
-                print("Ball above stump height !!")
-                self.BELOW_STUMP = False
-            
-            if self.BELOW_STUMP and not self.PITCH_BOUNCE and previous_positions and current_positions:
-                if current_positions[0][1] < previous_positions[0][1]:
-                    self.PITCH_POINT = previous_positions[0]
-                    self.PITCH_BOUNCE = True
-                    object_positions_before_pitch = self.remove_extra_detections(object_positions_before_pitch)
-                
-            if self.PITCH_BOUNCE and current_positions:
-                object_positions_after_pitch.append(current_positions)
-            elif current_positions:
-                object_positions_before_pitch.append(current_positions)
-                
-            if self.PITCH_BOUNCE and current_positions and len(object_positions_after_pitch) > 1 and not seaming:
-                if object_positions_after_pitch[-1][0][0] < object_positions_after_pitch[-2][0][0]:
-                    seaming = "Right"
-                elif object_positions_after_pitch[-1][0][0] > object_positions_after_pitch[-2][0][0]:
-                    seaming = "Left"
-                    
-                
-            # Draw connecting lines between consecutive positions of detected objects
-            for i in range(1, len(object_positions_before_pitch)):
-                prev_positions = object_positions_before_pitch[i - 1]
-                curr_positions = object_positions_before_pitch[i]
-                
-                # Ensure both frames have detected positions to connect
-                if prev_positions and curr_positions:
-                    # Use the first detected object in each frame (or modify if there are multiple)
-                    prev_x, prev_y = prev_positions[0]
-                    curr_x, curr_y = curr_positions[0]
-                    
-                    # Create an overlay
-                    overlay = frame.copy()
-                    
-                    # Draw line on the overlay
-                    cv2.line(overlay, (prev_x, prev_y), (curr_x, curr_y), (0, 0, 255), 7)
-                    # Blend the overlay with the original frame
-                    opacity = 0.5  # Adjust the opacity level (0.0 to 1.0)
-                    frame = cv2.addWeighted(overlay, opacity, frame, 1 - opacity, 0)
-            
-            if object_positions_after_pitch and object_positions_before_pitch:
-                cv2.line(frame, object_positions_before_pitch[-1][0], object_positions_after_pitch[0][0], (0, 0, 255), 7)
-
-                
-            if len(object_positions_after_pitch) > 1:
-
-                    # Get the first detected position
-                    first_positions = object_positions_after_pitch[0]
-                    # Get the last detected position
-                    last_positions = object_positions_after_pitch[-1]
-                    
-                    # Ensure both frames have detected positions to connect
-                    if first_positions and last_positions:
-                        # Use the first detected object in the first and last frames 
-                        first_x, first_y = first_positions[0]
-                        last_x, last_y = last_positions[0]
-                        
-                        # Create an overlay
-                        overlay = frame.copy()
-                        
-                        # 1. Draw the line connecting the first and last points (in red)
-                        cv2.line(overlay, (first_x, first_y), (last_x, last_y), (0, 0, 255), 7)
-                        
-                        # Blend the overlay with the original frame
-                        opacity = 0.5  # Adjust the opacity level (0.0 to 1.0)
-                        frame = cv2.addWeighted(overlay, opacity, frame, 1 - opacity, 0)
+        stump_img = cv2.imread(self.stump_img_path)
+        # Every frame is resized in memory to the stump image size, detections
+        # and stump overlays share one coordinate system
+        frame_size = (stump_img.shape[1], stump_img.shape[0])
+
+        self.stump_layout(stump_img, class_name='stumps')
+        # Optional crop to the pitch corridor before ball inference
+        self.ball_roi = self.pitch_corridor_roi(stump_img.shape) if self.use_roi else None
+
+        timings = self.job.TIMINGS
+        # Room for one detection per frame before the buffers have to grow
+        self.job.PIXEL_VALUES = MaskStats(capacity=expected_frames)
+        self.job.TRACK = track = BallTrack(capacity=expected_frames)
+        self.job.DETECTIONS = [] if self.use_track_cache and cached is None else None
+        # Live bounce detection, only used to split the path while drawing
+        live_pitch = PitchDetector(self.job.DETECTED_BOXES)
+
+        stats = None
+        if cached is None and self.frame_workers and not (self.adaptive or self.tracking) and self.upload is None:
+            # Frames are decoded and detected in other processes and arrive
+            # here in order through shared memory, see frame_transport
+            region = self.ball_roi
+            imgsz = self.region_imgsz(stump_img.shape, region) if region is not None else None
+            detections = get_transport(self.frame_workers).detect(self.input_video_path, frame_size, region, imgsz,
+                                                                  timer=timings)
+            if self.pipelined:
+                stats = PipelineStats("inference", "encode")
+        else:
+            frames = read_frames(cap, frame_size, timer=timings)
+            if self.pipelined:
+                # Bounded FIFO queues between the stages, frames keep their order
+                stats = PipelineStats("decode", "inference", "encode")
+                frames = prefetch(frames, self.queue_depth, load=stats["decode"], consumer=stats["inference"])
+            if cached is not None:
+                detections = ((frame, [frame_detections]) for frame, frame_detections in zip(frames, cached))
+            elif self.adaptive:
+                detections = self.detect_ball_adaptive(frames)
+            elif self.tracking:
+                detections = self.detect_ball_tracked(frames)
+            else:
+                detections = self.detect_ball_batched(frames)
+        if self.ball_roi is not None and not self.tracking and cached is None:
+            # The tracker's search window follows the ball out of the corridor
+            # by itself
+            detections = self.corridor_fallback(detections)
+        if stats is not None and out is not None:
+            out = ThreadedSink(out, self.queue_depth, load=stats["encode"], producer=stats["inference"])
+
+        # The annotated video runs one frame behind, so the predicted path can
+        # still be drawn on the last frame once the stream has ended
+        last_frame, last_boxes, held = None, [], None
+        try:
+            for frame, results in detections:
+                frame_number += 1
+                logger.debug("frame %d/%d", frame_number, expected_frames)
+
+                with timings.stage("mask_processing"):
+                    boxes, ball, ball_stats = self.collect_detections(results, frame_number)
+
+                if ball is not None:
+                    if live_pitch.step(frame_number, ball[1]):
+                        track.mark_pitch()
+                        trajectory.reset(track.points(track.before()))
+                    track.append(frame_number, ball[0], ball[1], *ball_stats)
+                    if not track.pitched:
+                        trajectory.append(ball)
+
+                if not self.render_video:
+                    last_frame, last_boxes = frame, boxes
+                    continue
+
+                frame = self.annotate_frame(frame, stump_img, boxes, trajectory)
+                if held is not None and out is not None:
+                    out.write(held)
+                held = frame
+        except BaseException:
+            # Stop the encoder thread before giving up on the video
+            if out is not None:
+                out.release()
+            raise
 
-            
-            if frame_number == int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) :
-                if self.PITCH_BOUNCE == False:
-                    return (False , "Pitch Bounce not detected")
-                if object_positions_after_pitch == []:
-                    return (False , "Pitch Bounce not detected")
-                
-                frame , y_limit = self.prediction_extention_point(self.DETECTED_BOXES,frame,self.PITCH_POINT)
-                self.HITTING_STUMPS = object_positions_after_pitch[-1][0] 
-
-                # Draw connecting lines between consecutive positions of detected objects
-                if len(object_positions_after_pitch) > 1 and self.BELOW_STUMP:
-                    # Get the first detected position
-                    first_positions = object_positions_after_pitch[0]
-                    # Get the last detected position
-                    last_positions = object_positions_after_pitch[-1]
-                    
-                    # Ensure both frames have detected positions to connect
-                    if first_positions and last_positions:
-                        # Use the first detected object in the first and last frames
-                        first_x, first_y = first_positions[0]
-                        last_x, last_y = last_positions[0]
-                        
-                        # Create an overlay
-                        overlay = frame.copy()
-                        
-                        # 1. Draw the line connecting the first and last points (in red)
-                        cv2.line(overlay, (first_x, first_y), (last_x, last_y), (0, 0, 255), 7)
-                        
-                        # Blend the overlay with the original frame
-                        opacity = 0.5  # Adjust the opacity level (0.0 to 1.0)
-                        frame = cv2.addWeighted(overlay, opacity, frame, 1 - opacity, 0)
-                        
-                        # Calculate the slope of the line
-                        if last_y != first_y:  # Avoid division by zero
-                            slope = (last_x - first_x) / (last_y - first_y)
-                        else:
-                            slope = float('inf')  # Vertical line
-
-                        # Calculate the x-coordinate for the y_limit based on the slope
-                        if slope != float('inf'):
-                            extended_x = int(last_x + slope * (y_limit - last_y))
-                        else:
-                            extended_x = last_x  # For a vertical line, x remains constant
-                        
-                        # 2. Draw the extended predicted line to the y_limit (in blue)
-                        cv2.line(frame, (last_x, last_y), (extended_x, y_limit), (255, 0, 0), 7) 
-                        opacity = 0.5  # Adjust the opacity level (0.0 to 1.0)
-                        frame = cv2.addWeighted(overlay, opacity, frame, 1 - opacity, 0)
-                        
-                        self.HITTING_STUMPS = (extended_x, y_limit) 
-                
-
-                self.IMPACT_POINT = object_positions_after_pitch[-1][0]   
-                
-                self.RESULT_FRAME = frame
-                print("Seaming" , seaming)
-                temp = []
-                prev = 0
-                for i in range(len(object_positions_after_pitch)):
-                    if i > 0:
-                        temp.append(abs(prev - object_positions_after_pitch[i][0][0]))
-                    prev = object_positions_after_pitch[i][0][0]
-                print("temp",temp)
-                
-            previous_positions = current_positions 
-            out.write(frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
-        
         cap.release()
-        out.release()
-        cv2.destroyAllWindows()
-        shutil.rmtree(temp_dir)
+        if self.upload is not None:
+            timings.add("upload_wait", self.upload.waited)
+            if self.upload.error is not None:
+                raise self.upload.error
+
+        if held is None and last_frame is not None:
+            held = self.annotate_frame(last_frame, stump_img, last_boxes, trajectory)
+        self.job.LAST_FRAME = held
+        self.job.FRAME_COUNT = frame_number
+
+        # Stage two: the decision, from the track alone
+        self.decide()
+
+        if out is not None:
+            final = self.job.RESULT_FRAME if self.job.RESULT_FRAME is not None else held
+            if final is not None:
+                out.write(final)
+            out.release()
+        if stats is not None:
+            stats.stop(main="inference")
+            timings.utilisation = stats.as_dict()
+        if self.adaptive and self.scheduler is not None and cached is None:
+            timings.sampling = self.scheduler.report()
+
+        return self.outcome()
+
+    def decide(self):
+        analysis = analyse_track(self.job.TRACK.rows(), self.job.DETECTED_BOXES, self.extension_factor)
+        self.job.ANALYSIS = analysis
+        if analysis is None:
+            return None
+        self.job.PITCH_BOUNCE = True
+        self.job.BELOW_STUMP = analysis["below_stump"]
+        self.job.PITCH_POINT = analysis["pitch_point"]
+        self.job.IMPACT_POINT = analysis["impact_point"]
+        self.job.HITTING_STUMPS = analysis["hitting_point"]
+        logger.debug("Seaming %s", analysis["seaming"])
+        logger.debug("temp %s", np.abs(np.diff(analysis["after"]['cx'])).tolist())
+
+        if self.job.LAST_FRAME is not None:
+            with self.job.TIMINGS.stage("trajectory_drawing"):
+                self.job.RESULT_FRAME = self.draw_extension(self.job.LAST_FRAME, analysis)
+        return analysis
+
+    def outcome(self):
+        if self.job.FRAME_COUNT == 0:
+            return (False , "No frames could be decoded")
+        if self.job.ANALYSIS is None:
+            return (False , "Pitch Bounce not detected")
         return (True , "successfully done")
         
-    def remove_extra_detections(self, object_positions):
-        object_positions.reverse()
-        prev = float('inf')
-        for ind , pos in enumerate(object_positions):
-            if pos[0][1] > prev:
-                break
-            prev = pos[0][1]
-        object_positions = object_positions[:ind]
-        object_positions.reverse()
-        return object_positions
-
     def prediction_extention_point(self, detected_boxes,Image,Pitchpoint):
-        # Determine batting and bowling stumps
-        batting_stump = min(detected_boxes, key=lambda stump: stump[1])
-        bowling_stump = max(detected_boxes, key=lambda stump: stump[1])
-
-        # Calculate the 12.42% portion
-        distance_between_stumps = bowling_stump[1] - batting_stump[2]
-        
-        #threshold value to extend the line the deafult value is 0.1242
-        portion_12_42 = int(0.1042 * distance_between_stumps)  
-        y_coordinate_12_42 = batting_stump[1] + portion_12_42
-        
-        # Calculate x-coordinates for the line
-        x_start = min(batting_stump[0], bowling_stump[0])  # Minimum x1
-        x_end = max(batting_stump[2], bowling_stump[2])    # Maximum x2
-        # cv2.line(Image, (x_start, y_coordinate_12_42), (x_end, y_coordinate_12_42), (0, 255, 255), 2)  # Yellow line
-
-        # Calculate the percentage of default value between batting stump bottom and split line
-        ball_pitch_Y_value = Pitchpoint[1]
-        batting_stump_bottom = batting_stump[3]
-        percentage = ((ball_pitch_Y_value - batting_stump_bottom) / (y_coordinate_12_42 - batting_stump_bottom)) * 100
-
-        # Calculate the y-value between batting stump bottom and top using the percentage
-        batting_stump_top = batting_stump[1]
-        range_top_bottom = batting_stump_bottom - batting_stump_top
-        y_value_from_bottom = int(batting_stump_bottom - (percentage / 100) * range_top_bottom)
-        # cv2.line(Image, (x_start, y_value_from_bottom), (x_end, y_value_from_bottom), (0, 255, 255), 2)  # Yellow line
-
-        return Image , y_value_from_bottom
+        return Image , decision.extension_limit(detected_boxes, Pitchpoint)
         
     def check_point_in_polygon(self, detected_boxes, point):
-        detected_boxes = sorted(detected_boxes, key=lambda box: box[1])  # Sort by y1
-
-        # Step 2: Define the polygon using the specified connections
-        (x1a, y1a, x2a, y2a), (x1b, y1b, x2b, y2b) = detected_boxes
-        polygon_points = [
-            [x2a, y1a],  # Upper right of first box
-            [x2b, y2b],  # Lower right of second box
-            [x1b, y2b],  # Lower left of second box
-            [x1a, y1a],  # Upper left of first box
-        ]
-        
-        # Convert polygon points to the required NumPy format
-        polygon = np.array(polygon_points, np.int32).reshape((-1, 1, 2))
-
-        # Step 3: Check if the point lies inside the polygon
-        result = cv2.pointPolygonTest(polygon, point, False)
-        return result >= 0  # True if inside or on the edge, False otherwise
-
+        return decision.point_in_corridor(detected_boxes, point)
 
     def check_point_in_polygon_or_side(self, detected_boxes, point, offside):
-        # Step 1: Sort bounding boxes based on y1 in ascending order
-        detected_boxes = sorted(detected_boxes, key=lambda box: box[1])  # Sort by y1
-
-        # Define the polygon using the edges of the detected boxes
-        (x1a, y1a, x2a, y2a), (x1b, y1b, x2b, y2b) = detected_boxes
-        polygon = [
-            [x2a, y1a],  # Upper right of first box
-            [x2b, y2b],  # Lower right of second box
-            [x1b, y2b],  # Lower left of second box
-            [x1a, y1a],  # Upper left of first box
-        ]
-        # Extract the point's y-coordinate
-        _, y = point
-        x_values = []
-
-        # Check if the y-coordinate intersects the polygon
-        for i in range(len(polygon)):
-            x1, y1 = polygon[i]
-            x2, y2 = polygon[(i + 1) % len(polygon)]  # Wrap around to form a closed polygon
-
-            # Check if the point's y lies within the edge's y range
-            if min(y1, y2) <= y <= max(y1, y2) and y1 != y2:  # Avoid division by zero
-                # Calculate x-coordinate using linear interpolation
-                x = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
-                x_values.append(x)
-
-        # Sort x-values to get boundaries
-        x_values = sorted(x_values)
-        
-        if len(x_values) == 2:
-            if x_values[0] <= point[0] <= x_values[1]:
-                return "In Line"
-            elif point[0] < x_values[0]:
-                return "Outside off"
-            elif point[0] > x_values[1]:
-                return "Outside leg"
-            
-        return False
+        return decision.pitching_side(detected_boxes, point)
 
     def hitting_stumps(self, stump_coordinates, point):
-        # Find the stump with the lowest y1 value
-        selected_stump = min(stump_coordinates, key=lambda stump: stump[1])
-        
-        x1, y1, x2, y2 = selected_stump
-        x, y = point
-        
-        # Check if the point is within the bounds of the selected stump rectangle
-        if x1 <= x <= x2 and y1 <= y <= y2:
-            return "Hitting"
-        return "Not-hitting"
+        return decision.hitting_stumps(stump_coordinates, point)
 
-    def draw_result(self, player):
-        
+    def judge(self, player):
         # Determine impact, pitching, and hitting stumps
-        impact = self.check_point_in_polygon(self.DETECTED_BOXES, self.IMPACT_POINT)
-        if player == "right_handed":
-            pitching = self.check_point_in_polygon_or_side(self.DETECTED_BOXES, self.PITCH_POINT, True)
-            desired_side = "Outside off"
-        else:
-            pitching = self.check_point_in_polygon_or_side(self.DETECTED_BOXES, self.PITCH_POINT, False)
-            desired_side = "Outside leg"
+        checks = decision.judge(self.job.DETECTED_BOXES, self.job.PITCH_POINT,
+                                self.job.IMPACT_POINT, self.job.HITTING_STUMPS, player)
+
+        # Structured form of the same decision, for API clients
+        self.job.VERDICT = {
+            "pitching": checks["pitching"],
+            "impact": checks["impact"],
+            "wickets": checks["wickets"],
+            "pitch_point": list(self.job.PITCH_POINT),
+            "impact_point": list(self.job.IMPACT_POINT),
+            "hitting_point": list(self.job.HITTING_STUMPS),
+        }
+        return checks
+
+    def draw_result(self, player):
         
-        hitting_text = self.hitting_stumps(self.DETECTED_BOXES, self.HITTING_STUMPS)
-        impact_text = "Inside" if impact else "Outside"
-        pitching_text = pitching
+        checks = self.judge(player)
+        hitting_text = checks["wickets"]
+        impact_text = checks["impact"]
+        pitching_text = checks["pitching"]
         
         # Define font and styling attributes
         font = cv2.FONT_HERSHEY_SIMPLEX
@@ -470,9 +631,9 @@ class LBWDetectionModel:
 
         # Define the header-result text pairs
         texts = [
-            ("WICKETS", hitting_text, hitting_text == "Hitting"),  # Green if hitting stumps
-            ("IMPACT", impact_text, impact),                  # Green if impact is "Inside"
-            ("PITCHING", pitching_text,pitching == "In Line" or pitching == desired_side),               # Default color for pitching
+            ("WICKETS", hitting_text, checks["wickets_ok"]),  # Green if hitting stumps
+            ("IMPACT", impact_text, checks["impact_ok"]),    # Green if impact is "Inside"
+            ("PITCHING", pitching_text, checks["pitching_ok"]),  # In line or on the allowed side
         ]
 
         # Box dimensions and layout settings
@@ -500,16 +661,19 @@ class LBWDetectionModel:
             result_bg_color = colors["result_bg_red"] if success else colors["result_bg_green"]
             
             # Draw header box
-            draw_box_with_text(self.RESULT_FRAME, (x_offset, y_offset), box_width, box_height, colors["header_bg"], header, colors["text"])
+            draw_box_with_text(self.job.RESULT_FRAME, (x_offset, y_offset), box_width, box_height, colors["header_bg"], header, colors["text"])
             
             # Draw result box below the header
-            draw_box_with_text(self.RESULT_FRAME, (x_offset, y_offset + box_height), box_width, box_height, result_bg_color, result, colors["text"])
+            draw_box_with_text(self.job.RESULT_FRAME, (x_offset, y_offset + box_height), box_width, box_height, result_bg_color, result, colors["text"])
             
             # Update y_offset for the next pair
             y_offset += 2 * box_height + spacing
 
-        # Save the final image
-        cv2.imwrite(self.output_image_path, self.RESULT_FRAME)
+        # Save the final image, replacing any earlier one in a single rename
+        ok, encoded = cv2.imencode(os.path.splitext(self.output_image_path)[1] or ".jpg", self.job.RESULT_FRAME)
+        if not ok:
+            raise ValueError(f"Could not encode the result image {self.output_image_path}")
+        write_atomic(self.output_image_path, encoded.tobytes())
 
     # def get_result(self,input_video_path,stump_img_path):
     #     try:
@@ -525,86 +689,186 @@ class LBWDetectionModel:
     #     except Exception as e:
     #         return str(e)
     
-    def get_result(self, input_video_path, stump_img_path):
+    def detection_settings(self):
+        # Everything besides the two input files that changes the ball track
+        return {
+            "ball_model": config.BALL_MODEL_PATH, "stump_model": config.STUMP_MODEL_PATH,
+            "backend": config.INFERENCE_BACKEND, "precision": config.INFERENCE_PRECISION,
+            "roi": self.use_roi, "roi_pad": config.BALL_ROI_PAD, "imgsz": config.BALL_IMGSZ,
+            "tracking": self.tracking, "track_window": config.TRACK_WINDOW, "track_max_gap": config.TRACK_MAX_GAP,
+            "adaptive": self.adaptive, "adaptive_stride": config.ADAPTIVE_STRIDE,
+            "adaptive_tolerance": config.ADAPTIVE_TOLERANCE,
+        }
+
+    def result_key(self, track_key, player):
+        # The track key covers the inputs and the detection, the rest is the
+        # decision and the drawing
+        return ResultStore.key(track_key, player=player, extension_factor=self.extension_factor)
+
+    def wants_video(self):
+        return self.render_video and bool(self.output_video_path)
+
+    def restore_result(self, key):
+        # Copies a stored result to the output paths, None if there is none
+        stored = result_store.get(key, video=self.wants_video())
+        if stored is None:
+            return None
         try:
+            if stored.image:
+                copy_atomic(stored.image, self.output_image_path)
+            if self.wants_video():
+                copy_atomic(stored.video, self.output_video_path)
+        except FileNotFoundError:
+            # Evicted since the lookup
+            return None
+        self.job.VERDICT = stored.verdict
+        if stored.image:
+            self.job.PITCH_POINT = tuple(stored.verdict["pitch_point"])
+            self.job.IMPACT_POINT = tuple(stored.verdict["impact_point"])
+            self.job.HITTING_STUMPS = tuple(stored.verdict["hitting_point"])
+            return self.output_image_path
+        return self.oops_message_img
+
+    def store_result(self, key, image):
+        video = self.output_video_path if self.wants_video() and os.path.exists(self.output_video_path) else None
+        result_store.put(key, self.job.VERDICT, image=image, video=video)
+
+    def replay_track(self, entry):
+        # Stage two only, on a track stored by an earlier run of the same video
+        self.job.DETECTED_BOXES = list(entry.stump_boxes)
+        self.job.TRACK = BallTrack.from_rows(entry.rows)
+        self.job.LAST_FRAME = entry.frame
+        self.job.FRAME_COUNT = entry.frames
+        self.decide()
+        return self.outcome()
+
+    def get_result(self, input_video_path, stump_img_path, render_video=True, player="right_handed",
+                   extension_factor=None, streaming=False):
+        """``streaming=True`` starts on a video that is still being uploaded (see
+        upload_stream), frames are decoded and detected as they arrive."""
+        try:
+            self.job = LBWJob()
+            self.render_video = render_video
             self.input_video_path = input_video_path
             self.stump_img_path = stump_img_path
+            self.extension_factor = decision.EXTENSION_FACTOR if extension_factor is None else extension_factor
 
             # Check if stump image exists
             if not os.path.exists(self.stump_img_path):
                 raise FileNotFoundError("Stump image file does not exist. Check the path.")
 
-            # Load the stump image to get dimensions
+            # Make sure the stump image can be decoded
             stump_img = cv2.imread(self.stump_img_path)
             if stump_img is None:
                 raise ValueError("Stump image could not be loaded. It might be corrupted.")
 
-            height, width = stump_img.shape[:2]
-
             # Check if video file exists
             if not os.path.exists(self.input_video_path):
                 raise FileNotFoundError("Input video file does not exist. Check the path.")
-
-            # Open the video file
-            cap = cv2.VideoCapture(self.input_video_path)
-            if not cap.isOpened():
-                raise ValueError("Error opening video file.")
-
-            # Get video FPS
-            fps = cap.get(cv2.CAP_PROP_FPS) or 30  # Assign default FPS if extraction fails
-
-            # Define output video writer
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            output_path_resized = "resized_video.mp4"
-            out = cv2.VideoWriter(output_path_resized, fourcc, fps, (width, height))
-
-            # Process video frames
-            while True:
-                ret, frame = cap.read()
-                if not ret or frame is None:
-                    break  # Exit loop if video ends or frame is empty
-
-                # Resize frame to match stump image size
-                resized_frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
-
-                # Write the resized frame to output video
-                out.write(resized_frame)
-
-            # Release resources
-            cap.release()
-            out.release()
-
-            # Ensure resized video was created
-            if not os.path.exists(output_path_resized):
-                raise RuntimeError("Resized video was not created successfully.")
-
-            # Update the input video path to use the resized version
-            self.input_video_path = output_path_resized
-
-            # Process the resized video
-            result = self.process_video()
-            print("Result:", result)
+            if streaming:
+                self.upload = UploadStream(self.input_video_path, timeout=config.UPLOAD_STREAM_TIMEOUT)
+
+            # A stored result is the answer straight away. A stored track skips
+            # decoding and inference; with the annotated video wanted, its
+            # stored detections skip inference and the video is only decoded
+            # again to draw it. Both are keyed by the content of the inputs,
+            # hashed once
+            key, entry = None, None
+            if (self.use_track_cache or self.use_result_store) and self.upload is None:
+                with self.job.TIMINGS.stage("track_cache" if self.use_track_cache else "result_store"):
+                    key = file_hash(self.input_video_path, self.stump_img_path, settings=self.detection_settings())
+                if self.use_result_store:
+                    with self.job.TIMINGS.stage("result_store"):
+                        restored = self.restore_result(self.result_key(key, player))
+                    if restored is not None:
+                        logger.info("Result store hit for %s", key)
+                        return restored
+                if self.use_track_cache:
+                    with self.job.TIMINGS.stage("track_cache"):
+                        entry = track_cache.get(key)
+                    if entry is not None and self.render_video and entry.detections is None:
+                        # Stored before the detections were kept, only a full pass draws the video
+                        entry = None
+
+            if entry is not None and self.render_video:
+                logger.info("Track cache hit for %s, drawing the video from the stored detections", key)
+                result = self.process_video(cached=entry.detections)
+            elif entry is not None:
+                logger.info("Track cache hit for %s", key)
+                result = self.replay_track(entry)
+            else:
+                # Decode, resize and detect in a single pass over the video
+                result = self.process_video()
+                if (self.use_track_cache or self.use_result_store) and self.upload is not None:
+                    # An uploaded video is keyed once all of it is on disk
+                    with self.job.TIMINGS.stage("track_cache" if self.use_track_cache else "result_store"):
+                        self.upload.wait_complete()
+                        key = file_hash(self.input_video_path, self.stump_img_path,
+                                        settings=self.detection_settings())
+                if key is not None and self.use_track_cache and self.job.FRAME_COUNT:
+                    with self.job.TIMINGS.stage("track_cache"):
+                        track_cache.put(key, TrackEntry(self.job.TRACK.rows(), self.job.DETECTED_BOXES,
+                                                        self.job.LAST_FRAME, self.job.FRAME_COUNT,
+                                                        self.job.DETECTIONS))
+            logger.info("Result: %s", result)
             if result[0] == False:
+                self.job.VERDICT = {"pitching": None, "impact": None, "wickets": None, "reason": result[1]}
+                if key is not None and self.use_result_store:
+                    with self.job.TIMINGS.stage("result_store"):
+                        self.store_result(self.result_key(key, player), None)
                 return self.oops_message_img
 
 
             # Draw result
-            self.draw_result("right_handed")
+            with self.job.TIMINGS.stage("result_rendering"):
+                self.draw_result(player)
+            if key is not None and self.use_result_store:
+                with self.job.TIMINGS.stage("result_store"):
+                    self.store_result(self.result_key(key, player), self.output_image_path)
 
-            print("Device:", self.device)
-            print("Output Image Path:", self.output_image_path)
+            logger.info("Device: %s", self.device)
+            logger.info("Output Image Path: %s", self.output_image_path)
 
             return self.output_image_path
 
         except Exception as e:
             return f"Error: {str(e)}"
+        finally:
+            if self.upload is not None:
+                self.upload.close()
+                self.upload = None
     
+    def process_many(self, videos, stump_img_path, output_dir='batch', workers=None, executor=None, **options):
+        """Decides many clips filmed against one stump image, see batch.process_many.
+
+        Stump detection runs once for all of them and the clips are spread over
+        worker processes with this model's settings. Yields each clip's verdict
+        as it finishes, then a summary with the throughput in clips per minute.
+        """
+        from batch import process_many
+        model_options = {"batch_size": self.batch_size, "use_roi": self.use_roi, "tracking": self.tracking,
+                         "use_track_cache": self.use_track_cache, "pipelined": self.pipelined,
+                         "adaptive": self.adaptive, "use_result_store": self.use_result_store,
+                         "frame_workers": self.frame_workers}
+        return process_many(videos, stump_img_path, output_dir, workers=workers, executor=executor,
+                            model_options=model_options, **options)
+
+    def live(self, source, stump_img=None, **options):
+        """LiveSession over a camera index, stream URL or file, iterate it for one verdict per delivery."""
+        from live import LiveSession
+        return LiveSession(self, source, stump_img, **options)
+
     def check_stumps(self,stump_img_path):
         try:
+            self.job = LBWJob()
             self.stump_img_path = stump_img_path
-            self.detect_and_draw_boxes_with_overlay(stump_img_path, stump_img=stump_img_path, class_name='stumps')
-            print(self.DETECTED_BOXES)
-            if len(self.DETECTED_BOXES) == 2:
+            stump_img = stump_img_path
+            if not isinstance(stump_img, np.ndarray):
+                # PIL images from the API are RGB, the stump cache works on BGR arrays
+                stump_img = cv2.cvtColor(np.array(stump_img.convert('RGB')), cv2.COLOR_RGB2BGR)
+            self.stump_layout(stump_img, class_name='stumps')
+            logger.info("Detected boxes: %s", self.job.DETECTED_BOXES)
+            if len(self.job.DETECTED_BOXES) == 2:
                 return True
             return False
         except Exception as e:
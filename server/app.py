@@ -1,17 +1,39 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse,FileResponse
-from PIL import Image
+import time
+_import_start = time.perf_counter()
+
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+from fastapi.responses import JSONResponse,FileResponse,PlainTextResponse,StreamingResponse
 import numpy as np
-from io import BytesIO
 import shutil
-import tempfile
 import cv2
 import os
 import logging
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+import asyncio
+import hashlib
+import json
+import threading
+from typing import List, Optional
+
+
+from batch import process_many
+from model_registry import registry
+from jobs import job_manager, QueueFull
+from profiling import metrics
+from result_store import evict, write_atomic
+from stump_check import decode_image, stump_checker
+from upload_stream import declare_size, mark_complete, mark_failed, upload_state
+import config
 
+if config.PRELOAD:
+    # Load the models before any worker is forked, see config.PRELOAD
+    import LBWDetection  # noqa: F401
+    registry.load()
 
-from LBWDetection import LBWDetectionModel
+IMPORT_SECONDS = round(time.perf_counter() - _import_start, 3)
 
 app = FastAPI()
 
@@ -28,8 +50,59 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Directory to save uploaded files
-UPLOAD_DIR = "uploads"
+UPLOAD_DIR = config.UPLOAD_DIR
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Checked stump images, a directory of their own since it is evicted
+STUMP_UPLOAD_DIR = os.path.join(UPLOAD_DIR, "stumps")
+os.makedirs(STUMP_UPLOAD_DIR, exist_ok=True)
+
+
+# Progress of the warm-up started with the server, reported by /ready
+startup_state = {"ready": not config.WARMUP_ON_STARTUP, "job_workers": [], "seconds": None, "error": None}
+
+
+def _warm_up():
+    start = time.perf_counter()
+    try:
+        # Workers first: forking after this process has run inference can
+        # leave the children with a locked OpenMP thread pool
+        startup_state["job_workers"] = job_manager.start()
+        stump_checker.warm_up()
+        logger.info(f"Warmed up in {time.perf_counter() - start:.2f}s, stump model on {registry.device}, "
+                    f"{len(startup_state['job_workers'])} job workers")
+    except Exception as e:
+        logger.exception("Warm-up failed")
+        startup_state["error"] = str(e) or type(e).__name__
+    else:
+        startup_state["ready"] = True
+    startup_state["seconds"] = round(time.perf_counter() - start, 3)
+
+
+@app.on_event("startup")
+def load_models():
+    """Warm the server up in the background while it already answers.
+
+    The job workers are started (each loads both models) and the stump model
+    runs once in this process, which serves /check_stumps and never needs the
+    ball model. Poll /ready to know when that is done.
+    """
+    if config.WARMUP_ON_STARTUP:
+        threading.Thread(target=_warm_up, name="warm-up", daemon=True).start()
+
+
+@app.get("/ready")
+def ready():
+    """Readiness probe: 200 once the warm-up is done, 503 until then or if it failed."""
+    content = {
+        "ready": startup_state["ready"],
+        "stump_model": registry.is_loaded('stump'),
+        "job_workers": {"ready": len(startup_state["job_workers"]), "total": job_manager.workers},
+        "import_seconds": IMPORT_SECONDS,
+        "warm_up_seconds": startup_state["seconds"],
+    }
+    if startup_state["error"]:
+        content["error"] = startup_state["error"]
+    return JSONResponse(status_code=200 if startup_state["ready"] else 503, content=content)
 
 @app.get("/")
 def hello():
@@ -37,23 +110,47 @@ def hello():
 
 
 @app.post("/check_stumps")
-async def check_stumps(file: UploadFile = File(...)):
-    """Endpoint to check if stumps are detected in the uploaded image."""
+async def check_stumps(file: UploadFile = File(...), preview: bool = False):
+    """Endpoint to check if stumps are detected in the uploaded image.
+
+    Only the stump model runs, so the app can poll this while the operator
+    frames the shot. Downscaled preview frames are fine, ``boxes`` are in
+    their coordinates with the detection confidence. ``preview=true`` checks
+    at the faster LBW_STUMP_CHECK_IMGSZ and skips storing the image; without
+    it the image is checked as the LBW run will detect its stumps.
+
+    ``image_path`` of a stored image is short-lived: the file is evicted once
+    unused for LBW_UPLOAD_TTL seconds or when the directory outgrows
+    LBW_UPLOAD_MB, so clients should send the image itself to /finalResult
+    rather than keep the path.
+    """
     image_bytes = await file.read()
-    image = Image.open(BytesIO(image_bytes))
+    image = decode_image(image_bytes)
+    if image is None:
+        return JSONResponse(status_code=400, content={"error": "Failed to decode image."})
+
+    check = await run_in_threadpool(stump_checker.check, image, preview)
 
-    model = LBWDetectionModel()
-    result = model.check_stumps(image)
+    if check["result"] and not preview:
+        # Save the uploaded image under its content hash, so clients sending
+        # the same file name never overwrite each other and a resent image is
+        # stored once
+        extension = os.path.splitext(file.filename or "")[1].lower() or ".jpg"
+        image_path = os.path.join(STUMP_UPLOAD_DIR, hashlib.sha1(image_bytes).hexdigest() + extension)
+        await run_in_threadpool(_save_stump_image, image_path, image_bytes)
+        check["image_path"] = image_path
 
-    if result:
-        # Save the uploaded image
-        image_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(image_path, "wb") as buffer:
-            buffer.write(image_bytes)
-        
-        return JSONResponse(content={"result": True, "image_path": image_path}, media_type="application/json")
+    return JSONResponse(content=check, media_type="application/json")
 
-    return JSONResponse(content={"result": False}, media_type="application/json")
+
+def _save_stump_image(path, data):
+    try:
+        # Already stored, touched since eviction goes by last use
+        os.utime(path)
+    except FileNotFoundError:
+        write_atomic(path, data)
+    # Only the images stored here, never other files under UPLOAD_DIR
+    evict(STUMP_UPLOAD_DIR, config.UPLOAD_MB * 1024 * 1024, config.UPLOAD_TTL)
 
 
 @app.post("/test")
@@ -65,30 +162,55 @@ async def receive_files(
     print(f"Received image: {stump_img.filename}, type: {stump_img.content_type}")
     return {"message": "Files received successfully"}
 
-@app.post("/finalResult")
-async def final_result(video: UploadFile = File(...), stump_img: UploadFile = File(...)):
-    """Endpoint to process the uploaded video and stump image."""
-    cache_dir = tempfile.mkdtemp()
-    try:
-        logger.info(f"Received files: Video={video.filename}, Stump Image={stump_img.filename}")
+async def _save_upload(upload, path):
+    # Streaming copy in a worker thread so large uploads do not block the event loop
+    with open(path, "wb") as f:
+        await run_in_threadpool(shutil.copyfileobj, upload.file, f)
+
+
+def _check_request(videos, stump_img, player, extension_factor):
+    if player not in ("right_handed", "left_handed"):
+        raise HTTPException(status_code=400, detail="Invalid player. Use 'right_handed' or 'left_handed'.")
+    if extension_factor is not None and not 0 < extension_factor < 1:
+        raise HTTPException(status_code=400, detail="Invalid extension_factor. It must be between 0 and 1.")
 
-        # Validate file extensions
+    # Validate file extensions
+    for video in videos:
         if not video.filename.endswith(".mp4"):
             raise HTTPException(status_code=400, detail="Invalid video format. Only .mp4 allowed.")
-        if not stump_img.filename.lower().endswith((".png", ".jpg", ".jpeg")):
-            raise HTTPException(status_code=400, detail="Invalid image format. Only PNG/JPG/JPEG allowed.")
+    if not stump_img.filename.lower().endswith((".png", ".jpg", ".jpeg")):
+        raise HTTPException(status_code=400, detail="Invalid image format. Only PNG/JPG/JPEG allowed.")
 
-        # Define file paths
-        video_path = os.path.join(cache_dir, video.filename)
-        stump_image_path = os.path.join(cache_dir, stump_img.filename)
 
-        # Save video (streaming to prevent memory issues)
-        with open(video_path, "wb") as f:
-            shutil.copyfileobj(video.file, f)
+async def _submit_job(video, stump_img, render_video=True, player="right_handed", extension_factor=None,
+                      video_size=None):
+    """Validates and saves the uploads, then queues an LBW job for them.
+
+    Without ``video`` the job starts straight away on a video that is streamed
+    in afterwards with PUT /streams/{job_id}.
+    """
+    streaming = video is None
+    logger.info(f"Received files: Video={'<stream>' if streaming else video.filename}, Stump Image={stump_img.filename}")
 
-        # Save stump image (streaming to prevent memory issues)
-        with open(stump_image_path, "wb") as f:
-            shutil.copyfileobj(stump_img.file, f)
+    _check_request([] if streaming else [video], stump_img, player, extension_factor)
+
+    try:
+        job = job_manager.create()
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=f"Too many jobs in progress, retry later ({e}).")
+
+    try:
+        # Define file paths
+        video_path = os.path.join(job.dir, "video.mp4" if streaming else os.path.basename(video.filename))
+        stump_image_path = os.path.join(job.dir, os.path.basename(stump_img.filename))
+
+        if streaming:
+            open(video_path, "wb").close()
+            if video_size is not None:
+                declare_size(video_path, video_size)
+        else:
+            await _save_upload(video, video_path)
+        await _save_upload(stump_img, stump_image_path)
 
         logger.info("Files saved successfully. Processing...")
 
@@ -97,27 +219,224 @@ async def final_result(video: UploadFile = File(...), stump_img: UploadFile = Fi
         if stump_image is None:
             raise HTTPException(status_code=400, detail="Failed to decode stump image. Ensure it is a valid PNG/JPG file.")
 
-        # Process video and image
-        model = LBWDetectionModel()
-        result = model.get_result(video_path, stump_image_path)
-        
-        logger.info(f"Processing complete. Result: {result}")
+        return job_manager.submit(job, video_path, stump_image_path, render_video, player, extension_factor,
+                                  streaming=streaming)
+    except Exception:
+        job_manager.forget(job.id)
+        raise
+
+
+@app.post("/finalResult")
+async def final_result(
+    video: UploadFile = File(...),
+    stump_img: UploadFile = File(...),
+    render_video: bool = True,
+    format: str = "image",
+    player: str = "right_handed",
+    extension_factor: Optional[float] = None,
+):
+    """Endpoint to process the uploaded video and stump image.
+
+    ``render_video=false`` skips the annotated video and only draws the result
+    frame. A video that was processed before is decided again from its stored
+    ball track, and its annotated video drawn from the stored detections,
+    without inference. ``player`` (right_handed/left_handed) and
+    ``extension_factor`` tune the decision. ``format=json`` returns the verdict
+    as JSON instead of the image, image responses carry it in the
+    ``X-LBW-Verdict`` header.
+    """
+    job = None
+    try:
+        if format not in ("image", "json"):
+            raise HTTPException(status_code=400, detail="Invalid format. Use 'image' or 'json'.")
+
+        job = await _submit_job(video, stump_img, render_video, player, extension_factor)
 
-        # return JSONResponse(content=result)
-        return FileResponse(result, media_type="image/jpeg", filename="output_image.jpg")
+        # The decision runs in the worker pool, the event loop stays free meanwhile
+        output = await asyncio.wrap_future(job.future)
+        logger.info(f"Processing complete. Result: {output}")
+
+        if format == "json":
+            job_manager.forget(job.id)
+            return JSONResponse(content={"verdict": output["verdict"], "timings": output["timings"]})
+
+        headers = {
+            "X-LBW-Verdict": json.dumps(output["verdict"]),
+            "X-LBW-Timings": json.dumps(output["timings"]),
+        }
+        return FileResponse(output["image"], media_type="image/jpeg", filename="output_image.jpg",
+                            headers=headers, background=BackgroundTask(job_manager.forget, job.id))
 
     except HTTPException as e:
         logger.error(f"HTTP error: {e.detail}")
+        if job is not None:
+            job_manager.forget(job.id)
         return JSONResponse(status_code=e.status_code, content={"error": e.detail})
 
     except Exception as e:
         logger.exception("Unexpected error occurred")
+        # The job has finished (failed), its uploads are not needed any more
+        if job is not None:
+            job_manager.forget(job.id)
         return JSONResponse(status_code=500, content={"error": "Internal server error"})
 
-    finally:
-        # Ensure cleanup happens even on failure
-        shutil.rmtree(cache_dir, ignore_errors=True)
-        logger.info("Temporary files cleaned up.")
+
+@app.post("/jobs", status_code=202)
+async def submit_job(video: UploadFile = File(...), stump_img: UploadFile = File(...), render_video: bool = True,
+                     player: str = "right_handed", extension_factor: Optional[float] = None):
+    """Queues an LBW job and returns its id straight away, poll /jobs/{job_id} for progress."""
+    try:
+        job = await _submit_job(video, stump_img, render_video, player, extension_factor)
+    except HTTPException as e:
+        logger.error(f"HTTP error: {e.detail}")
+        return JSONResponse(status_code=e.status_code, content={"error": e.detail})
+    return job.to_dict()
+
+
+@app.post("/streams", status_code=202)
+async def open_stream(stump_img: UploadFile = File(...), size: Optional[int] = None, render_video: bool = True,
+                      player: str = "right_handed", extension_factor: Optional[float] = None):
+    """Starts a job whose video is uploaded afterwards with PUT /streams/{job_id}.
+
+    Detection runs on the frames as the bytes arrive, so the verdict is ready
+    shortly after the upload ends. This needs the moov atom at the front of the
+    MP4 (faststart or fragmented), other files are only decoded once complete.
+    ``size`` (the video length in bytes) lets decoding start before the end.
+    """
+    try:
+        job = await _submit_job(None, stump_img, render_video, player, extension_factor, video_size=size)
+    except HTTPException as e:
+        logger.error(f"HTTP error: {e.detail}")
+        return JSONResponse(status_code=e.status_code, content={"error": e.detail})
+    return job.to_dict()
+
+
+@app.post("/batches")
+async def submit_batch(videos: List[UploadFile] = File(...), stump_img: UploadFile = File(...),
+                       render_video: bool = False, player: str = "right_handed",
+                       extension_factor: Optional[float] = None):
+    """Decides many clips filmed against one stump image, e.g. a whole session from one end.
+
+    Stump detection runs once and the clips are spread over the job workers.
+    The response is newline-delimited JSON: one line per clip as it finishes
+    (``index`` is its position in ``videos``), then a ``summary`` line with the
+    throughput in clips per minute.
+    """
+    try:
+        _check_request(videos, stump_img, player, extension_factor)
+        if len(videos) > config.BATCH_MAX_CLIPS:
+            raise HTTPException(status_code=400, detail=f"At most {config.BATCH_MAX_CLIPS} videos per batch.")
+        try:
+            job = job_manager.create()
+        except QueueFull as e:
+            raise HTTPException(status_code=429, detail=f"Too many jobs in progress, retry later ({e}).")
+    except HTTPException as e:
+        logger.error(f"HTTP error: {e.detail}")
+        return JSONResponse(status_code=e.status_code, content={"error": e.detail})
+
+    try:
+        video_paths = []
+        for index, video in enumerate(videos):
+            # Numbered, clips from different phones often share a file name
+            video_paths.append(os.path.join(job.dir, f"{index}_{os.path.basename(video.filename)}"))
+            await _save_upload(video, video_paths[-1])
+        stump_image_path = os.path.join(job.dir, os.path.basename(stump_img.filename))
+        await _save_upload(stump_img, stump_image_path)
+        if cv2.imread(stump_image_path, cv2.IMREAD_COLOR) is None:
+            job_manager.forget(job.id)
+            return JSONResponse(status_code=400, content={
+                "error": "Failed to decode stump image. Ensure it is a valid PNG/JPG file."})
+    except Exception:
+        job_manager.forget(job.id)
+        raise
+    logger.info(f"Batch {job.id}: {len(video_paths)} clips")
+
+    def verdicts():
+        # Runs in Starlette's thread pool, each line is sent as its clip finishes
+        try:
+            for item in process_many(video_paths, stump_image_path, os.path.join(job.dir, "results"),
+                                     executor=job_manager.executor, render_video=render_video, player=player,
+                                     extension_factor=extension_factor):
+                if "summary" in item:
+                    logger.info(f"Batch {job.id}: {item['summary']}")
+                else:
+                    metrics.observe_job(item.get("timings"), status=item["status"])
+                    # Result files stay on the server and are removed with the batch
+                    item.pop("image", None)
+                yield json.dumps(item) + "\n"
+        except Exception as e:
+            logger.exception("Batch failed")
+            yield json.dumps({"error": str(e) or type(e).__name__}) + "\n"
+        finally:
+            job_manager.forget(job.id)
+
+    return StreamingResponse(verdicts(), media_type="application/x-ndjson")
+
+
+@app.put("/streams/{job_id}")
+async def upload_stream(job_id: str, request: Request, final: bool = True):
+    """Appends the request body to the job's video, written to disk as it arrives.
+
+    Send the video in one request, or in several with ``final=false`` on all
+    but the last. Poll /jobs/{job_id} for the verdict.
+    """
+    job = job_manager.get(job_id)
+    if job is None or job.upload is None:
+        return JSONResponse(status_code=404, content={"error": "Unknown stream id"})
+    if upload_state(job.upload) != "pending":
+        return JSONResponse(status_code=409, content={"error": "Upload already finished"})
+
+    length = request.headers.get("content-length")
+    if final and length is not None and os.path.getsize(job.upload) == 0:
+        # The whole video in this request, its length lets decoding start early
+        declare_size(job.upload, int(length))
+    try:
+        # Unbuffered, the worker decoding the video reads the file as it grows
+        with open(job.upload, "ab", buffering=0) as f:
+            async for chunk in request.stream():
+                if chunk:
+                    f.write(chunk)
+    except ClientDisconnect:
+        mark_failed(job.upload, "client disconnected")
+        return JSONResponse(status_code=400, content={"error": "Upload interrupted"})
+
+    if final:
+        mark_complete(job.upload)
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    """Endpoint to poll the status of a queued job."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Unknown job id"})
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str):
+    """Endpoint to fetch the result image of a finished job."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Unknown job id"})
+    status = job.status
+    if status == "failed":
+        return JSONResponse(status_code=500, content={"error": job.error})
+    if status != "done":
+        return JSONResponse(status_code=409, content={"error": f"Job is still {status}"})
+    return FileResponse(job.result, media_type="image/jpeg", filename="output_image.jpg")
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Per-stage timing histograms of finished jobs, in Prometheus text format."""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.on_event("shutdown")
+def stop_workers():
+    job_manager.shutdown()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,175 @@
+import numpy as np
+
+
+class MaskStats:
+    """Array-backed (frame, box area, mask pixels) rows for one job.
+
+    Preallocated from the expected number of detections and doubled when it
+    runs out, so appending never builds Python tuples.
+    """
+
+    __slots__ = ('_rows', '_size')
+
+    def __init__(self, capacity=256):
+        self._rows = np.zeros((max(capacity, 1), 3), np.int64)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, frame_index, areas, pixels):
+        n = len(pixels)
+        if n == 0:
+            return
+        end = self._size + n
+        if end > len(self._rows):
+            grown = np.zeros((max(end, 2 * len(self._rows)), 3), np.int64)
+            grown[:self._size] = self._rows[:self._size]
+            self._rows = grown
+        rows = self._rows[self._size:end]
+        rows[:, 0] = frame_index
+        rows[:, 1] = areas
+        rows[:, 2] = pixels
+        self._size = end
+
+    def clear(self):
+        self._size = 0
+
+    def as_array(self):
+        """Read-only view of the filled rows: columns frame, area, pixels."""
+        view = self._rows[:self._size]
+        view.flags.writeable = False
+        return view
+
+
+def descent_start(ys):
+    """Index where the ball's final descent starts in a run of y values.
+
+    Walking back from the end, the descent stops at the first point lower
+    than the point after it. When nothing stops it, the oldest point is
+    dropped as well.
+    """
+    ys = np.asarray(ys)[::-1]
+    rises = np.flatnonzero(ys[1:] > ys[:-1])
+    keep = rises[0] + 1 if len(rises) else max(len(ys) - 1, 0)
+    return len(ys) - keep
+
+
+def mask_pixel_counts(mask_data):
+    # Segmented pixels per mask in one batched op on the (N, H, W) masks
+    # tensor, a single host copy of N counts instead of N full masks
+    return (mask_data > 0.5).flatten(1).sum(1).cpu().numpy()
+
+
+class Detections:
+    """What collect_detections reads of a ball model result, as plain arrays.
+
+    ``xyxy`` are the int box corners in frame coordinates, ``conf`` the
+    confidences and ``pixels`` the segmented pixels per mask (None when the
+    model gave no masks). A few hundred bytes per frame, so frame workers
+    send these back instead of results holding the frame and full masks.
+    """
+
+    __slots__ = ('xyxy', 'conf', 'pixels')
+
+    def __init__(self, xyxy, conf, pixels):
+        self.xyxy = xyxy
+        self.conf = conf
+        self.pixels = pixels
+
+    @classmethod
+    def from_result(cls, result, offset=None):
+        """``offset`` (x, y) moves boxes of a crop into frame coordinates."""
+        boxes = result.boxes.xyxy.cpu().numpy()
+        if offset is not None:
+            # In the boxes' own float32, as to_frame_coordinates shifts them
+            boxes = boxes + np.array([offset[0], offset[1], offset[0], offset[1]], dtype=boxes.dtype)
+        pixels = mask_pixel_counts(result.masks.data) if result.masks is not None else None
+        return cls(boxes.astype(int), result.boxes.conf.cpu().numpy(), pixels)
+
+
+class BallTrack:
+    """Ball positions of one delivery in a preallocated structured array.
+
+    One row per frame in which the ball was found (the first detection of the
+    frame). Rows before the pitch come first, then the rows after it, so both
+    phases are contiguous slices: ``before()`` and ``after()`` are O(1) views
+    and trajectory maths runs on whole columns.
+    """
+
+    BEFORE, AFTER, DISCARDED = 0, 1, 2
+    DTYPE = np.dtype([
+        ('frame', np.int32), ('cx', np.int32), ('cy', np.int32), ('area', np.int32),
+        ('pixels', np.int32), ('conf', np.float32), ('phase', np.int8),
+    ])
+
+    __slots__ = ('_rows', '_size', 'before_start', 'after_start')
+
+    def __init__(self, capacity=256):
+        self._rows = np.zeros(max(capacity, 1), self.DTYPE)
+        self._size = 0
+        self.before_start = 0
+        self.after_start = None  # set once the pitch is found
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Rebuilds a track from stored rows, e.g. loaded back with np.load."""
+        track = cls(capacity=len(rows))
+        track._rows[:len(rows)] = rows
+        track._size = len(rows)
+        phase = track._rows['phase'][:track._size]
+        track.before_start = int(np.count_nonzero(phase == cls.DISCARDED))
+        after = np.flatnonzero(phase == cls.AFTER)
+        if len(after):
+            track.after_start = int(after[0])
+        return track
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def pitched(self):
+        return self.after_start is not None
+
+    def append(self, frame, cx, cy, area=0, pixels=0, conf=0.0):
+        if self._size == len(self._rows):
+            grown = np.zeros(2 * len(self._rows), self.DTYPE)
+            grown[:self._size] = self._rows[:self._size]
+            self._rows = grown
+        phase = self.AFTER if self.pitched else self.BEFORE
+        self._rows[self._size] = (frame, cx, cy, area, pixels, conf, phase)
+        self._size += 1
+
+    def mark_pitch(self):
+        """Rows appended from now on are after the pitch.
+
+        The rows before it are cut back to the ball's final descent (see
+        descent_start).
+        """
+        self.after_start = self._size
+        self.before_start += descent_start(self._rows['cy'][self.before_start:self._size])
+        self._rows['phase'][:self.before_start] = self.DISCARDED
+
+    def rows(self):
+        return self._rows[:self._size]
+
+    def before(self):
+        end = self.after_start if self.pitched else self._size
+        return self._rows[self.before_start:end]
+
+    def after(self):
+        if not self.pitched:
+            return self._rows[:0]
+        return self._rows[self.after_start:self._size]
+
+    def last(self):
+        return self._rows[self._size - 1] if self._size else None
+
+    @staticmethod
+    def point(row):
+        return (int(row['cx']), int(row['cy']))
+
+    @staticmethod
+    def points(rows):
+        """(N, 2) array of the rows' centres."""
+        return np.stack([rows['cx'], rows['cy']], axis=1)
@@ -0,0 +1,62 @@
+import config
+from kalmanfilter import KalmanFilter
+
+
+class BallTracker:
+    """Search-window state for one delivery.
+
+    Until the ball is locked every frame is searched in full. After the first
+    detection a Kalman filter predicts where the ball will be next and only a
+    window around that point is searched. The track is dropped, and full-frame
+    search resumes, after ``max_gap`` consecutive misses.
+    """
+
+    def __init__(self, window=None, max_gap=None):
+        self.window = window or config.TRACK_WINDOW
+        self.max_gap = config.TRACK_MAX_GAP if max_gap is None else max_gap
+        self.kalman = None
+        self.box_size = 0
+        self.misses = 0
+        # Counters for reporting how much work the windows saved
+        self.full_searches = 0
+        self.window_searches = 0
+        self.filled = 0
+
+    @property
+    def locked(self):
+        return self.kalman is not None
+
+    def search_window(self, frame_shape):
+        """Region (x0, y0, x1, y1) to search in the next frame, None for a full search."""
+        if not self.locked:
+            self.full_searches += 1
+            return None
+        self.window_searches += 1
+        cx, cy = self.kalman.predict_next()
+        height, width = frame_shape[:2]
+        half = max(self.window, 4 * self.box_size) // 2
+        x0, y0 = max(cx - half, 0), max(cy - half, 0)
+        x1, y1 = min(cx + half, width), min(cy + half, height)
+        if x0 >= x1 or y0 >= y1:
+            # Prediction left the frame, nothing sensible to search
+            self.kalman = None
+            return None
+        return x0, y0, x1, y1
+
+    def update(self, box):
+        """Feeds the first detection of the frame (x1, y1, x2, y2), or None if there was none."""
+        if box is None:
+            if self.locked:
+                self.misses += 1
+                if self.misses > self.max_gap:
+                    self.kalman = None
+            return
+
+        cx, cy = (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+        self.box_size = int(max(box[2] - box[0], box[3] - box[1]))
+        self.misses = 0
+        if self.kalman is None:
+            self.kalman = KalmanFilter()
+            self.kalman.reset(cx, cy)
+        else:
+            self.kalman.correct(cx, cy)
@@ -0,0 +1,122 @@
+import itertools
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import cv2
+
+import config
+from model_registry import init_worker
+
+logger = logging.getLogger(__name__)
+
+# Many deliveries against one stump image, e.g. a session filmed from the same
+# end. The stump model runs once for the whole batch, the clips are spread over
+# worker processes that keep their models loaded, and each verdict is handed
+# back as soon as its clip is done.
+
+
+def detect_stump_boxes(stump_img_path):
+    """Stump boxes of the image, run in a worker so the caller never loads a model."""
+    from model_registry import registry
+    from stump_cache import stump_cache
+
+    stump_img = cv2.imread(stump_img_path)
+    if stump_img is None:
+        raise ValueError("Stump image could not be loaded. It might be corrupted.")
+    return [list(box) for box in stump_cache.get_or_detect(stump_img, registry.stump_model()).boxes]
+
+
+def run_clip(out_dir, video_path, stump_img_path, stump_boxes, model_options, options):
+    """One clip of a batch inside a worker process, with the batch's stump boxes."""
+    from LBWDetection import LBWDetectionModel
+    from stump_cache import stump_cache
+
+    stump_img = cv2.imread(stump_img_path)
+    if stump_img is not None:
+        stump_cache.seed(stump_img, stump_boxes)
+    os.makedirs(out_dir, exist_ok=True)
+    model = LBWDetectionModel(**model_options)
+    model.output_video_path = os.path.join(out_dir, 'output_video.mp4')
+    model.output_image_path = os.path.join(out_dir, 'output_image.jpg')
+    result = model.get_result(video_path, stump_img_path, **options)
+    if result.startswith("Error:"):
+        raise RuntimeError(result)
+    return {"image": result, "verdict": model.job.VERDICT, "timings": model.job.TIMINGS.as_dict()}
+
+
+def process_many(videos, stump_img_path, output_dir, workers=None, executor=None, model_options=None, in_flight=None,
+                 **options):
+    """Decides every video in ``videos`` against one stump image.
+
+    Yields one dict per clip in the order the clips finish (``index`` is its
+    position in ``videos``, ``elapsed`` the seconds since the batch started),
+    then a final ``{"summary": ...}`` with the throughput in clips per minute.
+
+    Clips run on ``executor`` if given (e.g. the server's job pool), otherwise
+    on a pool of ``workers`` processes created for the batch. At most
+    ``in_flight`` clips (default ``workers`` or config.JOB_WORKERS) are
+    submitted at a time, the next one as each finishes, so a large batch
+    never queues ahead of other jobs on a shared pool.
+    ``model_options`` are LBWDetectionModel arguments and ``options`` go to
+    get_result (``render_video`` defaults to False here). Each clip writes its
+    outputs to ``output_dir/<index>/``.
+    """
+    videos = list(videos)
+    model_options = model_options or {}
+    options.setdefault("render_video", False)
+    start = time.perf_counter()
+
+    own_executor = executor is None
+    if own_executor:
+        context = multiprocessing.get_context(config.JOB_START_METHOD)
+        executor = ProcessPoolExecutor(max_workers=max(1, min(workers or config.JOB_WORKERS, len(videos) or 1)),
+                                       mp_context=context, initializer=init_worker)
+    futures = {}
+    queued = enumerate(videos)
+
+    def submit(count):
+        for index, video in itertools.islice(queued, count):
+            future = executor.submit(run_clip, os.path.join(output_dir, str(index)), video, stump_img_path,
+                                     stump_boxes, model_options, options)
+            futures[future] = index
+
+    try:
+        stump_boxes = executor.submit(detect_stump_boxes, stump_img_path).result()
+        logger.info("Batch of %d clips, stumps %s", len(videos), stump_boxes)
+        submit(max(1, in_flight or workers or config.JOB_WORKERS))
+
+        failed = 0
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            # Replaced before the finished ones are handed out, a slow
+            # consumer does not leave the workers idle
+            submit(len(done))
+            for future in done:
+                index = futures.pop(future)
+                clip = {"index": index, "video": os.path.basename(videos[index]), "status": "done",
+                        "elapsed": round(time.perf_counter() - start, 3)}
+                try:
+                    clip.update(future.result())
+                except Exception as e:
+                    failed += 1
+                    clip.update(status="failed", error=str(e) or type(e).__name__)
+                yield clip
+
+        elapsed = time.perf_counter() - start
+        yield {"summary": {
+            "clips": len(videos),
+            "done": len(videos) - failed,
+            "failed": failed,
+            "stump_boxes": stump_boxes,
+            "seconds": round(elapsed, 3),
+            "clips_per_minute": round(len(videos) * 60 / elapsed, 2) if elapsed > 0 else None,
+        }}
+    finally:
+        # Also reached when the consumer stops early, queued clips are dropped
+        for future in futures:
+            future.cancel()
+        if own_executor:
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,181 @@
+"""Parity of an exported inference backend against the torch models on the same frames.
+
+Both ball models see every sampled frame of the video and both stump models
+the stump image. Per frame the first ball box is compared (found or not,
+centre distance, IoU, confidence, mask pixels), then the whole delivery is
+decided on each backend. Exits non-zero when the backends disagree beyond
+the tolerances, so it can gate a change of LBW_INFERENCE_* settings.
+
+Run from the server directory:
+
+    python benchmarks/backend_parity.py --video resized_video.mp4 --stumps stumps.png --backend onnx
+    python benchmarks/backend_parity.py --video resized_video.mp4 --stumps stumps.png --backend openvino --precision int8
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import inference_backend
+from LBWDetection import LBWDetectionModel
+from ball_track import mask_pixel_counts
+from model_registry import registry
+from stump_cache import stump_cache
+
+
+def read_frames(path, limit, stride):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    index = 0
+    while len(frames) < limit:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        if index % stride == 0:
+            frames.append(frame)
+        index += 1
+    cap.release()
+    return frames
+
+
+def first_ball(result):
+    """(box, confidence, mask pixels) of the detection process_video uses, None if there is none."""
+    if not len(result.boxes):
+        return None
+    pixels = mask_pixel_counts(result.masks.data) if result.masks is not None else []
+    return (result.boxes.xyxy[0].tolist(), float(result.boxes.conf[0]), int(pixels[0]) if len(pixels) else 0)
+
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def timed(model, frames):
+    start = time.perf_counter()
+    results = [model(frame, verbose=False)[0] for frame in frames]
+    return results, (time.perf_counter() - start) / max(len(frames), 1)
+
+
+def compare_frames(reference, candidate, frames):
+    ref_results, ref_time = timed(reference, frames)
+    cand_results, cand_time = timed(candidate, frames)
+    found_mismatch, distances, ious, conf_diffs, pixel_ratios = 0, [], [], [], []
+    for ref, cand in zip(ref_results, cand_results):
+        a, b = first_ball(ref), first_ball(cand)
+        if (a is None) != (b is None):
+            found_mismatch += 1
+            continue
+        if a is None:
+            continue
+        (box_a, conf_a, pixels_a), (box_b, conf_b, pixels_b) = a, b
+        centre_a = ((box_a[0] + box_a[2]) / 2, (box_a[1] + box_a[3]) / 2)
+        centre_b = ((box_b[0] + box_b[2]) / 2, (box_b[1] + box_b[3]) / 2)
+        distances.append(float(np.hypot(centre_a[0] - centre_b[0], centre_a[1] - centre_b[1])))
+        ious.append(iou(box_a, box_b))
+        conf_diffs.append(abs(conf_a - conf_b))
+        if pixels_a:
+            pixel_ratios.append(pixels_b / pixels_a)
+    return {
+        "frames": len(frames),
+        "ball_found_mismatch": found_mismatch,
+        "max_centre_px": round(max(distances, default=0.0), 2),
+        "min_iou": round(min(ious, default=1.0), 4),
+        "max_conf_diff": round(max(conf_diffs, default=0.0), 4),
+        "mask_pixel_ratio": [round(min(pixel_ratios, default=1.0), 3), round(max(pixel_ratios, default=1.0), 3)],
+        "ms_per_frame": {"torch": round(ref_time * 1000, 2), "candidate": round(cand_time * 1000, 2)},
+    }
+
+
+def compare_stumps(reference, candidate, stump_img):
+    boxes = []
+    for model in (reference, candidate):
+        result = model(stump_img, verbose=False)[0]
+        boxes.append(sorted(tuple(round(v) for v in box) for box in result.boxes.xyxy.tolist()))
+    same_count = len(boxes[0]) == len(boxes[1])
+    return {
+        "torch": boxes[0],
+        "candidate": boxes[1],
+        "min_iou": round(min((iou(a, b) for a, b in zip(*boxes)), default=1.0), 4) if same_count else 0.0,
+    }
+
+
+def verdict(video, stumps, ball_model, stump_model):
+    registry.register('ball', ball_model)
+    registry.register('stump', stump_model)
+    # Stump detections are cached per image, the other backend's must not be reused
+    stump_cache.clear()
+    model = LBWDetectionModel(use_track_cache=False, use_result_store=False)
+    output = model.get_result(video, stumps, render_video=False)
+    if output.startswith("Error:"):
+        return output
+    return {key: (model.job.VERDICT or {}).get(key) for key in ("pitching", "impact", "wickets")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--video", required=True)
+    parser.add_argument("--stumps", required=True)
+    parser.add_argument("--backend", default="onnx", choices=[b for b in inference_backend.BACKENDS if b != "torch"])
+    parser.add_argument("--precision", default="fp32", choices=inference_backend.PRECISIONS)
+    parser.add_argument("--threads", type=int, default=config.INFERENCE_THREADS)
+    parser.add_argument("--frames", type=int, default=120, help="frames compared one by one")
+    parser.add_argument("--stride", type=int, default=1, help="compare every n-th frame")
+    parser.add_argument("--max-centre-px", type=float, default=2.0)
+    parser.add_argument("--min-iou", type=float, default=0.9)
+    args = parser.parse_args()
+
+    frames = read_frames(args.video, args.frames, args.stride)
+    stump_img = cv2.imread(args.stumps)
+    if not frames or stump_img is None:
+        sys.exit("Could not read the video or the stump image")
+
+    models = {}
+    for name, path in (("ball", config.BALL_MODEL_PATH), ("stump", config.STUMP_MODEL_PATH)):
+        models[name] = (
+            inference_backend.load(path, registry.device, backend="torch", threads=args.threads),
+            inference_backend.load(path, registry.device, backend=args.backend, precision=args.precision,
+                                   threads=args.threads),
+        )
+
+    report = {
+        "backend": args.backend,
+        "precision": args.precision,
+        "ball": compare_frames(*models["ball"], frames),
+        "stumps": compare_stumps(*models["stump"], stump_img),
+        "verdict": {
+            "torch": verdict(args.video, args.stumps, models["ball"][0], models["stump"][0]),
+            "candidate": verdict(args.video, args.stumps, models["ball"][1], models["stump"][1]),
+        },
+    }
+    print(json.dumps(report, indent=1))
+
+    ball = report["ball"]
+    failures = []
+    if ball["ball_found_mismatch"]:
+        failures.append(f"ball found on one backend only in {ball['ball_found_mismatch']} frames")
+    if ball["max_centre_px"] > args.max_centre_px:
+        failures.append(f"ball centre moved up to {ball['max_centre_px']}px")
+    if ball["min_iou"] < args.min_iou:
+        failures.append(f"ball box IoU down to {ball['min_iou']}")
+    if report["stumps"]["min_iou"] < args.min_iou:
+        failures.append("stump boxes differ")
+    if report["verdict"]["torch"] != report["verdict"]["candidate"]:
+        failures.append("verdicts differ")
+    if failures:
+        sys.exit("Parity failed: " + "; ".join(failures))
+    print("Parity ok")
+
+
+if __name__ == "__main__":
+    main()
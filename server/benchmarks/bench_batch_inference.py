@@ -0,0 +1,63 @@
+"""Frames/sec of the ball segmentation model against batch size on CPU.
+
+Run from the server directory:
+
+    python benchmarks/bench_batch_inference.py --video resized_video.mp4 --batch-sizes 1 8 16 32
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+from ultralytics import YOLO
+
+import config
+
+
+def load_frames(video_path, max_frames):
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def run(model, frames, batch_size):
+    start = time.perf_counter()
+    for i in range(0, len(frames), batch_size):
+        model.predict(frames[i:i + batch_size], device='cpu', verbose=False)
+    return len(frames) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--video", required=True)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--max-frames", type=int, default=128)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    frames = load_frames(args.video, args.max_frames)
+    if not frames:
+        sys.exit(f"No frames could be decoded from {args.video}")
+
+    model = YOLO(config.BALL_MODEL_PATH)
+    # Warm-up so predictor setup is not counted against the first batch size
+    model.predict(frames[:1], device='cpu', verbose=False)
+
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}")
+    print(f"{'batch':>6} {'frames/sec':>12}")
+    for batch_size in args.batch_sizes:
+        best = max(run(model, frames, batch_size) for _ in range(args.repeats))
+        print(f"{batch_size:>6} {best:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Time the decision stage alone on a stored or synthetic ball track.
+
+    python benchmarks/bench_decision.py                     # synthetic delivery
+    python benchmarks/bench_decision.py --track track.npy --stumps 300 100 340 160 290 400 350 470
+
+A track file is the array returned by ``job.TRACK.rows()`` saved with np.save.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from ball_track import BallTrack
+from decision import decide
+
+DEFAULT_STUMPS = [(300, 100, 340, 160), (290, 400, 350, 470)]
+
+
+def synthetic_track(before=20, after=15):
+    track = BallTrack()
+    frame = 10
+    for y in np.linspace(80, 350, before + 1):
+        frame += 1
+        track.append(frame, 330 - (y - 80) * 20 / 270, y)
+    for y in np.linspace(350, 140, after + 1)[1:]:
+        frame += 1
+        track.append(frame, 310 + (350 - y) * 8 / 210, y)
+    return track.rows()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--track")
+    parser.add_argument("--stumps", type=int, nargs=8)
+    parser.add_argument("--repeats", type=int, default=10000)
+    args = parser.parse_args()
+
+    rows = np.load(args.track) if args.track else synthetic_track()
+    stumps = [tuple(args.stumps[:4]), tuple(args.stumps[4:])] if args.stumps else DEFAULT_STUMPS
+
+    print(decide(rows, stumps))
+    start = time.perf_counter()
+    for _ in range(args.repeats):
+        decide(rows, stumps)
+    elapsed = (time.perf_counter() - start) / args.repeats
+    print(f"{len(rows)} rows: {elapsed * 1e6:.1f} us per decision")
+
+
+if __name__ == "__main__":
+    main()
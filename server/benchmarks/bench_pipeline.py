@@ -0,0 +1,49 @@
+"""Wall time of process_video run sequentially and as a decode/infer/encode pipeline.
+
+Run from the server directory:
+
+    python benchmarks/bench_pipeline.py --video resized_video.mp4 --stumps stumps.png
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from LBWDetection import LBWDetectionModel
+from model_registry import registry
+
+
+def run(video, stumps, pipelined, depth):
+    model = LBWDetectionModel(pipelined=pipelined, use_track_cache=False, use_result_store=False)
+    model.queue_depth = depth
+    start = time.perf_counter()
+    result = model.get_result(video, stumps)
+    elapsed = time.perf_counter() - start
+    if result.startswith("Error:"):
+        sys.exit(result)
+    return elapsed, model.job
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--video", required=True)
+    parser.add_argument("--stumps", required=True)
+    parser.add_argument("--queue-depth", type=int, default=16)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    registry.warm_up()
+    for pipelined in (False, True):
+        runs = [run(args.video, args.stumps, pipelined, args.queue_depth) for _ in range(args.repeats)]
+        elapsed, job = min(runs, key=lambda r: r[0])
+        print(f"{'pipelined' if pipelined else 'sequential':>10}: {elapsed:.3f}s, {job.FRAME_COUNT} frames, "
+              f"verdict {job.VERDICT}")
+        if job.TIMINGS.utilisation is not None:
+            print(json.dumps(job.TIMINGS.utilisation, indent=1))
+
+
+if __name__ == "__main__":
+    main()
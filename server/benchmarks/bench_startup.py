@@ -0,0 +1,170 @@
+"""Cold start of the API server: import time, time to ready and first-request latency.
+
+Every measurement starts a fresh interpreter. ``import app`` is timed on its
+own, then a server is started and polled: when it first answers, when
+/ready reports it warm (servers without /ready count as ready once they
+answer) and how long the first and second /check_stumps and /finalResult
+requests take. --stub serves the synthetic stand-in models, loaded on
+first use like the weights and shared with the job workers by forking them.
+
+Run from the server directory:
+
+    python benchmarks/bench_startup.py --stub
+    python benchmarks/bench_startup.py --stub --server-dir /path/to/other/checkout/server
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [BENCH_DIR, os.path.dirname(BENCH_DIR)]
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import app
+print(time.perf_counter() - start)
+"""
+
+SERVE_SNIPPET = """
+import sys
+sys.path[:0] = [{server_dir!r}, {bench_dir!r}]
+import app
+if {stub!r}:
+    from model_registry import registry
+    get = registry.get
+
+    def get_stub(name):
+        # Installed on first use like the real weights, importing them pulls in torch
+        if not registry.is_loaded(name):
+            from synthetic import install_stub_models
+            install_stub_models(registry)
+        return get(name)
+
+    registry.get = get_stub
+import uvicorn
+uvicorn.run(app.app, host="127.0.0.1", port={port}, log_level="warning")
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def request(url, files=None, timeout=120):
+    """(status, seconds) of a GET, or of a multipart POST when ``files`` maps field -> (name, bytes)."""
+    data, headers = None, {}
+    if files is not None:
+        boundary = uuid.uuid4().hex
+        parts = []
+        for field, (name, content) in files.items():
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{name}"\r\n'
+                         f'Content-Type: application/octet-stream\r\n\r\n'.encode() + content + b"\r\n")
+        data = b"".join(parts) + f"--{boundary}--\r\n".encode()
+        headers["Content-Type"] = f"multipart/form-data; boundary={boundary}"
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data, headers=headers), timeout=timeout) as r:
+            r.read()
+            status = r.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - start
+
+
+def import_seconds(server_dir, env, repeats):
+    times = []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=tempfile.mkdtemp(prefix="lbw-import-"),
+                             env=dict(env, PYTHONPATH=server_dir), capture_output=True, text=True, check=True)
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return {"min": round(min(times), 3), "median": round(statistics.median(times), 3)}
+
+
+def serve(server_dir, env, stub, video, stumps, timeout):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    code = SERVE_SNIPPET.format(server_dir=server_dir, bench_dir=BENCH_DIR, stub=stub, port=port)
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-c", code], cwd=tempfile.mkdtemp(prefix="lbw-serve-"), env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    report = {}
+    try:
+        while "answering" not in report:
+            if server.poll() is not None:
+                raise RuntimeError(f"server exited with code {server.returncode}")
+            if time.perf_counter() - start > timeout:
+                raise TimeoutError("server did not answer")
+            try:
+                request(base + "/", timeout=1)
+                report["answering"] = round(time.perf_counter() - start, 3)
+            except OSError:
+                time.sleep(0.02)
+        while "ready" not in report:
+            status, _ = request(base + "/ready")
+            if status in (200, 404):
+                report["ready"] = round(time.perf_counter() - start, 3)
+            elif time.perf_counter() - start > timeout:
+                raise TimeoutError("server did not get ready")
+            else:
+                time.sleep(0.02)
+
+        with open(stumps, "rb") as f:
+            stump_bytes = f.read()
+        with open(video, "rb") as f:
+            video_bytes = f.read()
+        for name, path, files in (
+            ("check_stumps", "/check_stumps?preview=true", {"file": ("stumps.png", stump_bytes)}),
+            ("final_result", "/finalResult?format=json&render_video=false",
+             {"video": ("clip.mp4", video_bytes), "stump_img": ("stumps.png", stump_bytes)}),
+        ):
+            runs = [request(base + path, files) for _ in range(2)]
+            report[name] = {"status": runs[0][0], "first": round(runs[0][1], 3), "second": round(runs[1][1], 3)}
+    finally:
+        server.terminate()
+        server.wait()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--server-dir", default=os.path.dirname(BENCH_DIR))
+    parser.add_argument("--stub", action="store_true", help="serve the colour-threshold stand-in models")
+    parser.add_argument("--video", help="clip for /finalResult, a synthetic delivery by default")
+    parser.add_argument("--stumps", help="stump image, the synthetic one by default")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=300)
+    args = parser.parse_args()
+
+    server_dir = os.path.abspath(args.server_dir)
+    video, stumps = args.video, args.stumps
+    if video is None or stumps is None:
+        from synthetic import SCENARIOS
+        synthetic_video, synthetic_stumps = SCENARIOS[0].render(tempfile.mkdtemp(prefix="lbw-clip-"))
+        video, stumps = video or synthetic_video, stumps or synthetic_stumps
+
+    env = dict(os.environ, LBW_TRACK_CACHE="0", LBW_RESULT_STORE="0")
+    if args.stub:
+        # Spawned workers would look for the .pt files, forked ones inherit the stand-ins
+        env["LBW_JOB_START_METHOD"] = "fork"
+    report = {
+        "server_dir": server_dir,
+        "import_app_seconds": import_seconds(server_dir, env, args.repeats),
+        "serve": serve(server_dir, env, args.stub, os.path.abspath(video), os.path.abspath(stumps), args.timeout),
+    }
+    print(json.dumps(report, indent=1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""End-to-end benchmark of the LBW pipeline on synthetic deliveries.
+
+Every scenario in synthetic.SCENARIOS is rendered at each resolution and
+frame rate and run through LBWDetectionModel.get_result in a fresh process,
+so peak RSS belongs to that case alone. Frames/sec, per-stage timings, peak
+RSS and whether the verdict matches the one computed on the exact ball path
+are written as JSON; pass an earlier file with --compare to see regressions.
+
+With --stub, each exported inference backend whose packages are installed is
+also taken through inference_backend's export -> load -> predict on an
+untrained segmentation model built from its config, so an export regression
+shows up without the real weights (--no-export-check skips it).
+
+Run from the server directory (--stub runs without the .pt weights):
+
+    python benchmarks/bench_suite.py --stub --out bench.json
+    python benchmarks/bench_suite.py --stub --sizes 1280x720 --fps 60 --modes default pipelined
+    python benchmarks/bench_suite.py --stub --modes fast workers
+    python benchmarks/bench_suite.py --stub --out new.json --compare bench.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tempfile
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from importlib.util import find_spec
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import SCENARIOS
+
+# LBWDetectionModel options per mode
+MODES = {
+    "default": {},
+    "fast": {"render_video": False},
+    "pipelined": {"pipelined": True},
+    "tracking": {"tracking": True, "render_video": False},
+    "roi": {"use_roi": True, "render_video": False},
+    "adaptive": {"adaptive": True, "render_video": False},
+    "workers": {"frame_workers": 2, "render_video": False},
+}
+
+# Packages each exported backend needs; ultralytics would try to pip install
+# missing ones, so a backend without them is skipped instead
+EXPORT_BACKENDS = {
+    "onnx": ("onnx", "onnxruntime"),
+    "openvino": ("openvino",),
+}
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_case(spec, mode, workdir, stub, repeats):
+    """Runs one delivery in this (fresh) process, returns its result dict."""
+    os.chdir(workdir)
+    from model_registry import registry
+    if stub:
+        from synthetic import install_stub_models
+        install_stub_models(registry)
+        # Spawned frame workers would look for the .pt files, forked ones inherit the stand-ins
+        import config
+        config.JOB_START_METHOD = "fork"
+    from LBWDetection import LBWDetectionModel
+
+    options = dict(MODES[mode])
+    render_video = options.pop("render_video", True)
+    video_path, stumps_path = spec.render(os.path.join(workdir, "videos"))
+    frames = len(spec.path())
+    model = LBWDetectionModel(use_track_cache=False, use_result_store=False, **options)
+    model.output_video_path = os.path.join(workdir, f"{spec.key}_{mode}.mp4")
+    model.output_image_path = os.path.join(workdir, f"{spec.key}_{mode}.jpg")
+    # The first run pays for model setup, it is not measured
+    model.get_result(video_path, stumps_path, render_video=render_video)
+
+    runs = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output = model.get_result(video_path, stumps_path, render_video=render_video)
+        runs.append((time.perf_counter() - start, output, model.job))
+    elapsed, output, job = min(runs, key=lambda run: run[0])
+
+    expected = spec.expected_verdict()
+    verdict = job.VERDICT or {}
+    got = {key: verdict.get(key) for key in ("pitching", "impact", "wickets")}
+    return {
+        "case": f"{spec.key}/{mode}",
+        "scenario": spec.name,
+        "mode": mode,
+        "width": spec.width,
+        "height": spec.height,
+        "fps": spec.fps,
+        "frames": frames,
+        "seconds": round(elapsed, 4),
+        "frames_per_sec": round(frames / elapsed, 2),
+        "timings": job.TIMINGS.as_dict(),
+        "peak_rss_mb": peak_rss_mb(),
+        "expected": expected,
+        "verdict": got if verdict.get("pitching") is not None else None,
+        "error": output if output.startswith("Error:") else None,
+        "correct": expected == (got if verdict.get("pitching") is not None else None),
+    }
+
+
+def run_export_check(backend, workdir):
+    """Exports, loads and runs an untrained model on ``backend`` in this (fresh)
+    process. Returns the check's result dict."""
+    import numpy as np
+    from ultralytics import YOLO
+    import config
+    import inference_backend
+    from ball_track import Detections
+
+    result = {"backend": backend, "status": "ok", "error": None}
+    with tempfile.TemporaryDirectory(dir=workdir) as scratch:
+        # A fresh export directory, so a stale export can't hide a broken one
+        config.EXPORT_DIR = os.path.join(scratch, "exported")
+        weights = os.path.join(scratch, "stub-seg.pt")
+        frame = np.full((480, 640, 3), (40, 110, 40), dtype=np.uint8)
+        try:
+            # Same architecture as the ball model, random weights: no download needed
+            YOLO("yolov8n-seg.yaml").save(weights)
+            reference = inference_backend.load(weights, "cpu", backend="torch").predict(frame, verbose=False)[0]
+
+            start = time.perf_counter()
+            model = inference_backend.load(weights, "cpu", backend=backend, precision="fp32", threads=1)
+            result["load_seconds"] = round(time.perf_counter() - start, 2)
+            exported = inference_backend.exported_path(weights, backend, "fp32")
+            if not os.path.exists(exported):
+                raise RuntimeError(f"export did not produce {exported}")
+            stamp = os.path.getmtime(exported)
+
+            start = time.perf_counter()
+            output = model.predict(frame, verbose=False)[0]
+            result["predict_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            if output.orig_shape != frame.shape[:2]:
+                raise RuntimeError(f"predicted on shape {output.orig_shape}, expected {frame.shape[:2]}")
+            # What LBWDetectionModel reads from every result
+            detections = Detections.from_result(output)
+            if len(detections.xyxy) != len(reference.boxes):
+                raise RuntimeError(f"{len(detections.xyxy)} detections, torch found {len(reference.boxes)}")
+
+            # A second load must reuse the export, not redo it
+            inference_backend.load(weights, "cpu", backend=backend, precision="fp32")
+            if os.path.getmtime(exported) != stamp:
+                raise RuntimeError("second load exported again")
+        except Exception as e:
+            result["status"] = "FAILED"
+            result["error"] = "".join(traceback.format_exception_only(e)).strip()
+    return result
+
+
+def export_checks(workdir, context):
+    checks = []
+    for backend, packages in EXPORT_BACKENDS.items():
+        missing = [package for package in packages if find_spec(package) is None]
+        if missing:
+            checks.append({"backend": backend, "status": "skipped", "error": f"not installed: {', '.join(missing)}"})
+        else:
+            with ProcessPoolExecutor(1, mp_context=context) as pool:
+                checks.append(pool.submit(run_export_check, backend, workdir).result())
+        check = checks[-1]
+        detail = check["error"] or f"load {check['load_seconds']:.1f} s, {check['predict_ms']:.1f} ms/frame"
+        print(f"{'export/' + backend:<44} {check['status']:<8} {detail}", flush=True)
+    return checks
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SERVER_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {case["case"]: case for case in json.load(f)["cases"]}
+    print(f"\nAgainst {baseline_path}:")
+    print(f"{'case':<44} {'fps before':>10} {'fps now':>10} {'change':>8}  verdict")
+    for case in results:
+        old = baseline.get(case["case"])
+        if old is None:
+            print(f"{case['case']:<44} {'-':>10} {case['frames_per_sec']:>10.1f} {'new':>8}")
+            continue
+        change = case["frames_per_sec"] / old["frames_per_sec"] - 1 if old["frames_per_sec"] else 0.0
+        flag = "same" if case["correct"] == old["correct"] else ("FIXED" if case["correct"] else "BROKEN")
+        print(f"{case['case']:<44} {old['frames_per_sec']:>10.1f} {case['frames_per_sec']:>10.1f} "
+              f"{change:>+8.1%}  {flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stub", action="store_true", help="use the colour-threshold stand-in models")
+    parser.add_argument("--sizes", nargs="+", default=["640x480", "1280x720"])
+    parser.add_argument("--fps", type=int, nargs="+", default=[30, 60])
+    parser.add_argument("--modes", nargs="+", default=["default", "fast"], choices=sorted(MODES))
+    parser.add_argument("--scenarios", nargs="+", help="names from synthetic.SCENARIOS, default all")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--workdir", default=os.path.join("benchmarks", "work"))
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--no-export-check", action="store_true",
+                        help="with --stub, skip the export -> load -> predict check of the exported backends")
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir)
+    os.makedirs(workdir, exist_ok=True)
+    specs = [spec for spec in SCENARIOS if not args.scenarios or spec.name in args.scenarios]
+    cases = []
+    for spec in specs:
+        for size in args.sizes:
+            width, height = map(int, size.lower().split("x"))
+            for fps in args.fps:
+                for mode in args.modes:
+                    cases.append((spec.with_format(width, height, fps), mode))
+
+    # One process per case, started fresh so each peak RSS is its own (frame
+    # worker processes not included). Not a Pool: its daemonic processes
+    # could not start the frame workers
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for spec, mode in cases:
+        with ProcessPoolExecutor(1, mp_context=context) as pool:
+            result = pool.submit(run_case, spec, mode, workdir, args.stub, args.repeats).result()
+        results.append(result)
+        mark = "ok" if result["correct"] else "WRONG"
+        print(f"{result['case']:<44} {result['frames_per_sec']:>8.1f} fps {result['peak_rss_mb']:>8.1f} MB  {mark}",
+              flush=True)
+    checks = export_checks(workdir, context) if args.stub and not args.no_export_check else []
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "stub_models": args.stub,
+            "repeats": args.repeats,
+        },
+        "scenarios": [spec.to_dict() for spec in specs],
+        "cases": results,
+        "export_checks": checks,
+        "summary": {
+            "cases": len(results),
+            "correct": sum(case["correct"] for case in results),
+            "mean_frames_per_sec": round(sum(case["frames_per_sec"] for case in results) / max(len(results), 1), 2),
+            "max_peak_rss_mb": max((case["peak_rss_mb"] for case in results), default=0),
+            "export_failures": sum(check["status"] == "FAILED" for check in checks),
+        },
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=1)
+    print(f"\n{report['summary']['correct']}/{len(results)} verdicts correct, results in {args.out}")
+
+    if args.compare:
+        compare(results, args.compare)
+    if report["summary"]["export_failures"]:
+        sys.exit(f"{report['summary']['export_failures']} exported backend(s) failed the export check")
+
+
+if __name__ == "__main__":
+    main()
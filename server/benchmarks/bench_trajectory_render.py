@@ -0,0 +1,66 @@
+"""Per-frame trajectory rendering cost against track length.
+
+Compares the old full-frame copy + blend per segment with TrajectoryRenderer:
+
+    python benchmarks/bench_trajectory_render.py --width 1920 --height 1080
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+import numpy as np
+
+from trajectory_renderer import TrajectoryRenderer
+
+
+def render_full_frame(frame, points):
+    # The per-segment loop process_video used before TrajectoryRenderer
+    for i in range(1, len(points)):
+        overlay = frame.copy()
+        cv2.line(overlay, points[i - 1], points[i], (0, 0, 255), 7)
+        frame = cv2.addWeighted(overlay, 0.5, frame, 0.5, 0)
+    return frame
+
+
+def track(length, width, height):
+    ys = np.linspace(height * 0.1, height * 0.8, length)
+    xs = width / 2 + width * 0.05 * np.sin(np.linspace(0, 3, length))
+    return [(int(x), int(y)) for x, y in zip(xs, ys)]
+
+
+def time_per_frame(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 25, 50, 100, 200])
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    frame = np.random.default_rng(0).integers(0, 256, (args.height, args.width, 3), dtype=np.uint8)
+    print(f"{'track':>6} {'full-frame ms':>14} {'incremental ms':>15} {'same':>5}")
+    for length in args.lengths:
+        points = track(length, args.width, args.height)
+        renderer = TrajectoryRenderer()
+        for point in points:
+            renderer.append(point)
+        renderer.render(frame.copy())  # rasterises the layer once
+
+        same = np.array_equal(render_full_frame(frame.copy(), points), renderer.render(frame.copy()))
+        old_ms = time_per_frame(lambda: render_full_frame(frame.copy(), points), args.repeats)
+        new_ms = time_per_frame(lambda: renderer.render(frame.copy()), args.repeats)
+        print(f"{length:>6} {old_ms:>14.2f} {new_ms:>15.2f} {str(same):>5}")
+
+
+if __name__ == "__main__":
+    main()
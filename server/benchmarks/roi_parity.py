@@ -0,0 +1,93 @@
+"""Parity of ball detection on the pitch corridor (LBW_BALL_ROI) against the full frame.
+
+Each delivery is run with and without the corridor crop, once per detection
+mode, and the pitch, impact and hitting points and the verdict must come out
+the same. Unlike bench_suite, which only checks verdicts against the exact
+path, this catches a crop that loses the ball but still lands on the same
+verdict strings. Exits non-zero on any difference.
+
+Run from the server directory (--stub runs the synthetic deliveries without
+the .pt weights):
+
+    python benchmarks/roi_parity.py --stub
+    python benchmarks/roi_parity.py --video resized_video.mp4 --stumps stumps.png
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [BENCH_DIR, os.path.dirname(BENCH_DIR)]
+
+import config
+from model_registry import registry
+
+# LBWDetectionModel options per detection mode, each run with and without the crop
+MODES = {
+    "batched": {},
+    "tracking": {"tracking": True},
+    "adaptive": {"adaptive": True},
+    "workers": {"frame_workers": 2},
+}
+
+
+def points(video, stumps, use_roi, options):
+    from LBWDetection import LBWDetectionModel
+    model = LBWDetectionModel(use_roi=use_roi, use_track_cache=False, use_result_store=False, **options)
+    model.output_image_path = os.path.join(tempfile.gettempdir(), "roi_parity.jpg")
+    output = model.get_result(video, stumps, render_video=False)
+    if output.startswith("Error:"):
+        return {"error": output}
+    job = model.job
+    return {
+        "pitch": list(job.PITCH_POINT) if job.PITCH_POINT is not None else None,
+        "impact": list(job.IMPACT_POINT) if job.IMPACT_POINT is not None else None,
+        "hitting": list(job.HITTING_STUMPS) if job.HITTING_STUMPS is not None else None,
+        "verdict": {key: (job.VERDICT or {}).get(key) for key in ("pitching", "impact", "wickets")},
+        "region": list(model.ball_roi) if model.ball_roi is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stub", action="store_true", help="use the colour-threshold stand-in models")
+    parser.add_argument("--video", help="clip to compare on, the synthetic deliveries by default")
+    parser.add_argument("--stumps", help="stump image of --video")
+    parser.add_argument("--scenarios", nargs="+", help="names from synthetic.SCENARIOS, default all")
+    parser.add_argument("--modes", nargs="+", default=sorted(MODES), choices=sorted(MODES))
+    args = parser.parse_args()
+
+    if args.stub:
+        from synthetic import install_stub_models
+        install_stub_models(registry)
+        # Spawned frame workers would look for the .pt files, forked ones inherit the stand-ins
+        config.JOB_START_METHOD = "fork"
+    if args.video:
+        if not args.stumps:
+            sys.exit("--video needs --stumps")
+        clips = {os.path.basename(args.video): (args.video, args.stumps)}
+    else:
+        from synthetic import SCENARIOS
+        workdir = tempfile.mkdtemp(prefix="lbw-roi-parity-")
+        clips = {spec.key: spec.render(workdir) for spec in SCENARIOS
+                 if not args.scenarios or spec.name in args.scenarios}
+
+    report, failures = {}, []
+    for name, (video, stumps) in clips.items():
+        for mode in args.modes:
+            full = points(video, stumps, False, MODES[mode])
+            roi = points(video, stumps, True, MODES[mode])
+            same = {key: full.get(key) == roi.get(key) for key in ("pitch", "impact", "hitting", "verdict")}
+            report[f"{name}/{mode}"] = {"full_frame": full, "roi": roi}
+            if not all(same.values()):
+                failures.append(f"{name}/{mode}: {', '.join(key for key, ok in same.items() if not ok)} differ")
+    print(json.dumps(report, indent=1))
+    if failures:
+        sys.exit("Parity failed: " + "; ".join(failures))
+    print("Parity ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Synthetic deliveries and stand-in models for the benchmark suite.
+
+A delivery is drawn on a plain pitch: two white stumps and an orange ball
+following a parametric bounce path (gravity before the pitch, a straighter
+rise to the pad after it), at any resolution, frame rate and length. The
+stub models find those colours with a threshold and answer like the YOLO
+models do, so the whole pipeline runs without the ``.pt`` weights.
+"""
+import os
+
+import cv2
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+from ball_track import BallTrack
+from decision import decide
+
+PITCH_BGR = (40, 110, 40)
+STUMP_BGR = (255, 255, 255)
+BALL_BGR = (0, 128, 255)
+# Colour ranges the stub models look for, a little wider than what is drawn
+# so compression noise does not matter
+BALL_RANGE = ((0, 100, 220), (40, 160, 255))
+STUMP_RANGE = ((230, 230, 230), (255, 255, 255))
+
+
+class DeliverySpec:
+    """One synthetic delivery. Points are fractions of the frame size.
+
+    ``release``, ``pitch`` and ``impact`` are where the ball is released,
+    bounces and meets the pad; the ball takes ``flight`` seconds to the pitch
+    and ``rise`` seconds from it to the pad. ``idle`` seconds without the
+    ball pad the clip on both ends.
+    """
+
+    __slots__ = ('name', 'width', 'height', 'fps', 'release', 'pitch', 'impact', 'flight', 'rise', 'idle')
+
+    def __init__(self, name, width=640, height=480, fps=30, release=(0.516, 0.167), pitch=(0.484, 0.729),
+                 impact=(0.497, 0.292), flight=0.65, rise=0.5, idle=0.35):
+        self.name = name
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.release = release
+        self.pitch = pitch
+        self.impact = impact
+        self.flight = flight
+        self.rise = rise
+        self.idle = idle
+
+    @property
+    def key(self):
+        return f"{self.name}_{self.width}x{self.height}_{self.fps}fps"
+
+    def with_format(self, width, height, fps):
+        spec = DeliverySpec(self.name)
+        for name in self.__slots__:
+            setattr(spec, name, getattr(self, name))
+        spec.width, spec.height, spec.fps = width, height, fps
+        return spec
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def stump_boxes(self):
+        """Batting stump (far, higher up) and bowling stump (near, lower down)."""
+        w, h = self.width, self.height
+        batting = (int(0.469 * w), int(0.208 * h), int(0.531 * w), int(0.333 * h))
+        bowling = (int(0.453 * w), int(0.833 * h), int(0.547 * w), int(0.979 * h))
+        return [batting, bowling]
+
+    def ball_radius(self):
+        return max(3, round(0.011 * self.width))
+
+    def path(self):
+        """Ball centre per frame in pixels, None for the frames without the ball."""
+        w, h = self.width, self.height
+        (rx, ry), (px, py), (ix, iy) = self.release, self.pitch, self.impact
+        idle = [None] * round(self.idle * self.fps)
+        n_flight = max(2, round(self.flight * self.fps))
+        n_rise = max(2, round(self.rise * self.fps))
+
+        points = []
+        for i in range(n_flight + 1):
+            t = i / n_flight
+            # Horizontal drift is linear, the drop accelerates
+            points.append(((rx + (px - rx) * t) * w, (ry + (py - ry) * t * t) * h))
+        for i in range(1, n_rise + 1):
+            t = i / n_rise
+            # After the bounce the ball slows down as it rises
+            ease = 1 - (1 - t) ** 1.5
+            points.append(((px + (ix - px) * t) * w, (py + (iy - py) * ease) * h))
+        return idle + [(int(round(x)), int(round(y))) for x, y in points] + idle
+
+    def background(self):
+        img = np.full((self.height, self.width, 3), PITCH_BGR, np.uint8)
+        for x1, y1, x2, y2 in self.stump_boxes():
+            cv2.rectangle(img, (x1, y1), (x2, y2), STUMP_BGR, -1)
+        return img
+
+    def ideal_rows(self):
+        """The exact ball track, as BallTrack rows numbered like process_video does."""
+        track = BallTrack()
+        for frame_number, point in enumerate(self.path(), start=1):
+            if point is not None:
+                track.append(frame_number, point[0], point[1])
+        return track.rows()
+
+    def expected_verdict(self, player="right_handed"):
+        """What the decision logic says on the exact track, None if it finds no pitch."""
+        verdict = decide(self.ideal_rows(), self.stump_boxes(), player)
+        if verdict is None:
+            return None
+        return {key: verdict[key] for key in ("pitching", "impact", "wickets")}
+
+    def render(self, directory):
+        """Writes ``<key>.mp4`` and ``<key>_stumps.png`` (once), returns both paths."""
+        os.makedirs(directory, exist_ok=True)
+        video_path = os.path.join(directory, f"{self.key}.mp4")
+        stumps_path = os.path.join(directory, f"{self.key}_stumps.png")
+        background = self.background()
+        if not os.path.exists(stumps_path):
+            cv2.imwrite(stumps_path, background)
+        if not os.path.exists(video_path):
+            writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'mp4v'), self.fps,
+                                     (self.width, self.height))
+            radius = self.ball_radius()
+            for point in self.path():
+                frame = background.copy()
+                if point is not None:
+                    cv2.circle(frame, point, radius, BALL_BGR, -1)
+                writer.write(frame)
+            writer.release()
+        return video_path, stumps_path
+
+
+# Deliveries the suite runs by default, one per kind of verdict
+SCENARIOS = (
+    DeliverySpec("straight"),
+    DeliverySpec("missing_leg", impact=(0.562, 0.292)),
+    DeliverySpec("full_hitting", pitch=(0.5, 0.3), impact=(0.49, 0.24), rise=0.2),
+    DeliverySpec("pitched_outside", pitch=(0.62, 0.729), impact=(0.53, 0.292)),
+    # Pitches and meets the pad outside the padded stump corridor of --modes roi
+    DeliverySpec("pitched_wide", pitch=(0.70, 0.729), impact=(0.72, 0.292)),
+)
+
+
+def _components(image, colour_range, min_area):
+    mask = cv2.inRange(image, *colour_range)
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(mask)
+    return [(labels, i, stats[i]) for i in range(1, n) if stats[i][4] >= min_area]
+
+
+class StubBallModel:
+    """Stands in for the ball segmentation model: orange blobs as boxes with masks."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def _one(self, image):
+        boxes, masks = [], []
+        for labels, i, (x, y, w, h, _) in _components(image, BALL_RANGE, 10):
+            boxes.append([x, y, x + w, y + h, 0.9, 0])
+            masks.append((labels == i).astype(np.float32))
+        if not boxes:
+            return Results(image, path='', names={0: 'ball'}, boxes=torch.zeros((0, 6)))
+        return Results(image, path='', names={0: 'ball'}, boxes=torch.tensor(boxes, dtype=torch.float32),
+                       masks=torch.tensor(np.stack(masks)))
+
+    def __call__(self, source, **kwargs):
+        self.calls += 1
+        images = source if isinstance(source, list) else [source]
+        return [self._one(image) for image in images]
+
+    predict = __call__
+
+
+class StubStumpModel:
+    """Stands in for the stump detection model: white blobs as 'stumps' boxes."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def _one(self, image):
+        boxes = [[x, y, x + w, y + h, 0.95, 0] for _, _, (x, y, w, h, _) in _components(image, STUMP_RANGE, 50)]
+        return Results(image, path='', names={0: 'stumps'},
+                       boxes=torch.tensor(boxes, dtype=torch.float32).reshape(-1, 6))
+
+    def __call__(self, source, **kwargs):
+        self.calls += 1
+        images = source if isinstance(source, list) else [source]
+        return [self._one(image) for image in images]
+
+    predict = __call__
+
+
+def install_stub_models(registry):
+    registry.register('ball', StubBallModel())
+    registry.register('stump', StubStumpModel())
@@ -0,0 +1,137 @@
+import os
+
+# Settings for the LBW server. Everything can be overridden with environment
+# variables so worker containers can be tuned without code changes.
+
+
+def _env_bool(name, default):
+    return os.environ.get(name, "1" if default else "0").lower() in ("1", "true", "yes")
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _env_float(name, default):
+    return float(os.environ.get(name, default))
+
+
+# Model weights (relative to the server directory, like before)
+BALL_MODEL_PATH = os.environ.get("LBW_BALL_MODEL", "ball_segmentation.pt")
+STUMP_MODEL_PATH = os.environ.get("LBW_STUMP_MODEL", "stump_detection.pt")
+
+# Inference backend for both models: "torch" runs the .pt checkpoints, "onnx"
+# (ONNX Runtime) and "openvino" run an export of them made on first load into
+# EXPORT_DIR. PRECISION is fp32, fp16 or int8 (exported backends only, int8
+# calibrates on the images of the ultralytics dataset yaml in
+# CALIBRATION_DATA). THREADS caps the intra-op threads per worker process,
+# 0 leaves the runtime default of one per core.
+INFERENCE_BACKEND = os.environ.get("LBW_INFERENCE_BACKEND", "torch")
+INFERENCE_PRECISION = os.environ.get("LBW_INFERENCE_PRECISION", "fp32")
+INFERENCE_THREADS = _env_int("LBW_INFERENCE_THREADS", 0)
+INFERENCE_CALIBRATION_DATA = os.environ.get("LBW_INFERENCE_CALIBRATION_DATA")
+EXPORT_DIR = os.environ.get("LBW_EXPORT_DIR", "exported")
+
+# Run a dummy inference through both models when the server starts. It runs
+# in the background, /ready answers 503 until it is done
+WARMUP_ON_STARTUP = _env_bool("LBW_WARMUP", True)
+# Load both models when the app is imported, before any worker process is
+# forked, so the job workers (and gunicorn --preload workers) share the
+# weights copy-on-write instead of each loading them. Job workers are then
+# forked rather than spawned unless LBW_JOB_START_METHOD says otherwise
+PRELOAD = _env_bool("LBW_PRELOAD", False)
+
+# Inference size of /check_stumps?preview=true, smaller is faster on the framing
+# previews. The final capture is checked at the size the LBW run uses
+STUMP_CHECK_IMGSZ = _env_int("LBW_STUMP_CHECK_IMGSZ", 320)
+
+# Frames per ball-segmentation call in process_video (1 = frame by frame)
+BALL_BATCH_SIZE = _env_int("LBW_BALL_BATCH_SIZE", 8)
+
+# Number of stump images whose detections are kept in memory
+STUMP_CACHE_SIZE = _env_int("LBW_STUMP_CACHE_SIZE", 32)
+
+# Background job queue for /finalResult and /jobs
+JOB_WORKERS = _env_int("LBW_JOB_WORKERS", 2)  # worker processes running LBW jobs
+JOB_QUEUE_DEPTH = _env_int("LBW_JOB_QUEUE_DEPTH", 16)  # jobs allowed to wait beyond the running ones
+JOB_HISTORY = _env_int("LBW_JOB_HISTORY", 256)  # finished jobs kept for polling
+JOB_DIR = os.environ.get("LBW_JOB_DIR", "jobs")
+JOB_START_METHOD = os.environ.get("LBW_JOB_START_METHOD", "fork" if PRELOAD else "spawn")
+# Most clips accepted by one /batches request
+BATCH_MAX_CLIPS = _env_int("LBW_BATCH_MAX_CLIPS", 100)
+
+# Run ball detection only on the pitch corridor between the stumps (and the
+# area above it), padded on each side by this fraction of the corridor width.
+# A ball that leaves the corridor is followed on the full frame
+BALL_ROI = _env_bool("LBW_BALL_ROI", False)
+BALL_ROI_PAD = _env_float("LBW_BALL_ROI_PAD", 0.5)
+# Inference size the ball model uses for a full frame (ultralytics default)
+BALL_IMGSZ = _env_int("LBW_BALL_IMGSZ", 640)
+
+# Kalman-guided tracking: once the ball is found only a window around the
+# predicted position is searched, full-frame search resumes after
+# TRACK_MAX_GAP missed frames
+BALL_TRACKING = _env_bool("LBW_BALL_TRACKING", False)
+TRACK_WINDOW = _env_int("LBW_TRACK_WINDOW", 192)
+TRACK_MAX_GAP = _env_int("LBW_TRACK_MAX_GAP", 3)
+
+# Adaptive frame sampling: while the ball is out of play the ball model only
+# runs on every ADAPTIVE_STRIDE-th frame and the frames in between are
+# interpolated; a sample that deviates by more than ADAPTIVE_TOLERANCE ball
+# sizes from the interpolated path (or shows the ball appearing, leaving or
+# bouncing) has the frames before it inferred after all, and every frame is
+# inferred from the bounce to the impact. A larger stride or tolerance skips
+# more inference at the cost of accuracy, stride 1 infers every frame.
+ADAPTIVE_SAMPLING = _env_bool("LBW_ADAPTIVE_SAMPLING", False)
+ADAPTIVE_STRIDE = _env_int("LBW_ADAPTIVE_STRIDE", 3)
+ADAPTIVE_TOLERANCE = _env_float("LBW_ADAPTIVE_TOLERANCE", 1.5)
+
+# On-disk cache of ball tracks keyed by the video and stump image content, so
+# a delivery that is decided again (other batsman hand, extension factor)
+# skips decoding and inference
+TRACK_CACHE = _env_bool("LBW_TRACK_CACHE", True)
+TRACK_CACHE_PATH = os.environ.get("LBW_TRACK_CACHE_PATH", os.path.join("cache", "tracks.sqlite"))
+TRACK_CACHE_MB = _env_int("LBW_TRACK_CACHE_MB", 256)
+
+# Content-addressed store of finished results (verdict, result image and the
+# annotated video if rendered) keyed by the inputs and every setting that
+# shapes them, so a duplicate submission is answered without running the
+# models. Entries unused for RESULT_STORE_TTL seconds are dropped, then the
+# least recently used ones until the store fits in RESULT_STORE_MB
+RESULT_STORE = _env_bool("LBW_RESULT_STORE", True)
+RESULT_STORE_DIR = os.environ.get("LBW_RESULT_STORE_DIR", os.path.join("cache", "results"))
+RESULT_STORE_MB = _env_int("LBW_RESULT_STORE_MB", 512)
+RESULT_STORE_TTL = _env_int("LBW_RESULT_STORE_TTL", 7 * 24 * 3600)
+
+# Stump images kept by /check_stumps, named by their content in the stumps/
+# subdirectory and bounded the same way as the result store
+UPLOAD_DIR = os.environ.get("LBW_UPLOAD_DIR", "uploads")
+UPLOAD_MB = _env_int("LBW_UPLOAD_MB", 64)
+UPLOAD_TTL = _env_int("LBW_UPLOAD_TTL", 24 * 3600)
+
+# Pipelined process_video: decoding and encoding run in their own threads,
+# connected to the inference loop by queues of this many frames
+PIPELINE = _env_bool("LBW_PIPELINE", False)
+PIPELINE_QUEUE_DEPTH = _env_int("LBW_PIPELINE_QUEUE_DEPTH", 16)
+
+# Decoding and ball inference in processes of their own (frame_transport.py):
+# a decoder process fills a ring of FRAME_RING_SLOTS shared-memory frame slots
+# and FRAME_WORKERS inference processes run the ball model on them in place,
+# per job worker. 0 keeps both in the job process. Not used with tracking or
+# adaptive sampling (both decide a frame from the one before) or on streamed
+# uploads
+FRAME_WORKERS = _env_int("LBW_FRAME_WORKERS", 0)
+FRAME_RING_SLOTS = _env_int("LBW_FRAME_RING_SLOTS", 16)
+
+# Streamed uploads (/streams): decoding waits this long for the upload to
+# grow before giving up on it
+UPLOAD_STREAM_TIMEOUT = _env_float("LBW_UPLOAD_STREAM_TIMEOUT", 60)
+
+# Live mode (live.py): frames kept behind the camera, missed frames that end a
+# delivery, longest delivery and fewest ball detections that count as one
+LIVE_RING_SIZE = _env_int("LBW_LIVE_RING_SIZE", 120)
+LIVE_END_GAP = _env_int("LBW_LIVE_END_GAP", 5)
+LIVE_MAX_DELIVERY_FRAMES = _env_int("LBW_LIVE_MAX_DELIVERY_FRAMES", 240)
+LIVE_MIN_POINTS = _env_int("LBW_LIVE_MIN_POINTS", 4)
+# Seconds from the last frame of a delivery to its verdict, slower ones are logged
+LIVE_LATENCY_BUDGET = _env_float("LBW_LIVE_LATENCY_BUDGET", 1.0)
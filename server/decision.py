@@ -0,0 +1,215 @@
+"""Stage two of the LBW pipeline: from a ball track and stump boxes to a verdict.
+
+Everything here is a pure function of its arguments (NumPy arrays and
+tuples), so decisions can be re-run, benchmarked and unit-tested on stored
+tracks without decoding any video.
+"""
+import cv2
+import numpy as np
+
+from ball_track import descent_start
+
+# Portion of the stump-to-stump distance used to extend the line after impact
+EXTENSION_FACTOR = 0.1042
+
+
+def batting_stump(stump_boxes):
+    # The batting stump is the one further up the image
+    return min(stump_boxes, key=lambda stump: stump[1])
+
+
+def bowling_stump(stump_boxes):
+    return max(stump_boxes, key=lambda stump: stump[1])
+
+
+class PitchDetector:
+    """Streaming bounce detection over ball positions.
+
+    The ball is "below stump height" once it drops under the top of the
+    batting stump. The pitch is the last point before the ball starts rising
+    again while below stump height, provided both points come from
+    consecutive frames.
+    """
+
+    __slots__ = ('batting_top', 'below_stump', 'pitched', '_last_frame', '_last_y')
+
+    def __init__(self, stump_boxes):
+        self.batting_top = batting_stump(stump_boxes)[1]
+        self.below_stump = False
+        self.pitched = False
+        self._last_frame = None
+        self._last_y = None
+
+    def step(self, frame, cy):
+        """Feeds one ball position, returns True if the ball bounced just before it."""
+        bounced = False
+        if not self.below_stump and cy > self.batting_top:
+            self.below_stump = True
+        elif self.below_stump and cy < self.batting_top:
+            self.below_stump = False
+
+        if (self.below_stump and not self.pitched and self._last_frame == frame - 1
+                and cy < self._last_y):
+            self.pitched = True
+            bounced = True
+
+        self._last_frame = frame
+        self._last_y = cy
+        return bounced
+
+
+def extension_limit(stump_boxes, pitch_point, extension_factor=EXTENSION_FACTOR):
+    """Height (y) the post-impact line is extended to, based on how far up the pitch the ball bounced."""
+    batting = batting_stump(stump_boxes)
+    bowling = bowling_stump(stump_boxes)
+
+    distance_between_stumps = bowling[1] - batting[2]
+    y_split = batting[1] + int(extension_factor * distance_between_stumps)
+
+    # Percentage of the way from the batting stump bottom to the split line
+    batting_bottom = batting[3]
+    percentage = ((pitch_point[1] - batting_bottom) / (y_split - batting_bottom)) * 100
+
+    # Same percentage applied between the batting stump bottom and top
+    range_top_bottom = batting_bottom - batting[1]
+    return int(batting_bottom - (percentage / 100) * range_top_bottom)
+
+
+def extend_line(first, last, y_limit):
+    """x where the line through first and last reaches y_limit."""
+    (first_x, first_y), (last_x, last_y) = first, last
+    if last_y == first_y:
+        return last_x  # Horizontal in image space, keep x
+    slope = (last_x - first_x) / (last_y - first_y)
+    return int(last_x + slope * (y_limit - last_y))
+
+
+def _point(row):
+    return (int(row['cx']), int(row['cy']))
+
+
+def analyse_track(rows, stump_boxes, extension_factor=EXTENSION_FACTOR):
+    """Finds pitch, impact and the extended path in a track's rows.
+
+    ``rows`` is a BallTrack structured array in frame order. Returns None when
+    no bounce was found, otherwise a dict with the before/after rows and the
+    key points.
+    """
+    detector = PitchDetector(stump_boxes)
+    after_start = None
+    for i, (frame, cy) in enumerate(zip(rows['frame'].tolist(), rows['cy'].tolist())):
+        if detector.step(frame, cy) and after_start is None:
+            after_start = i
+    if after_start is None:
+        return None
+
+    before = rows[:after_start]
+    before = before[descent_start(before['cy']):]
+    after = rows[after_start:]
+
+    pitch_point = _point(rows[after_start - 1])
+    impact_point = _point(after[-1])
+    y_limit = extension_limit(stump_boxes, pitch_point, extension_factor)
+
+    # The line from the first to the last post-pitch point is extended up to
+    # y_limit, only while the ball is still below stump height
+    hitting_point = impact_point
+    extension = None
+    if len(after) > 1 and detector.below_stump:
+        first = _point(after[0])
+        hitting_point = (extend_line(first, impact_point, y_limit), y_limit)
+        extension = (first, impact_point, hitting_point)
+
+    # First sideways movement after the bounce
+    steps = np.diff(after['cx'])
+    steps = steps[steps != 0]
+    seaming = None if not len(steps) else ("Right" if steps[0] < 0 else "Left")
+
+    return {
+        "before": before,
+        "after": after,
+        "pitch_point": pitch_point,
+        "impact_point": impact_point,
+        "hitting_point": hitting_point,
+        "extension": extension,
+        "y_limit": y_limit,
+        "below_stump": detector.below_stump,
+        "seaming": seaming,
+    }
+
+
+def corridor_polygon(stump_boxes):
+    (x1a, y1a, x2a, y2a), (x1b, y1b, x2b, y2b) = sorted(stump_boxes, key=lambda box: box[1])
+    return [
+        [x2a, y1a],  # Upper right of first box
+        [x2b, y2b],  # Lower right of second box
+        [x1b, y2b],  # Lower left of second box
+        [x1a, y1a],  # Upper left of first box
+    ]
+
+
+def point_in_corridor(stump_boxes, point):
+    polygon = np.array(corridor_polygon(stump_boxes), np.int32).reshape((-1, 1, 2))
+    # True if inside or on the edge, False otherwise
+    return cv2.pointPolygonTest(polygon, (float(point[0]), float(point[1])), False) >= 0
+
+
+def pitching_side(stump_boxes, point):
+    """"In Line", "Outside off" or "Outside leg" for a pitch point, False if its height misses the corridor."""
+    polygon = corridor_polygon(stump_boxes)
+    _, y = point
+    x_values = []
+    for i in range(len(polygon)):
+        x1, y1 = polygon[i]
+        x2, y2 = polygon[(i + 1) % len(polygon)]  # Wrap around to form a closed polygon
+        if min(y1, y2) <= y <= max(y1, y2) and y1 != y2:
+            x_values.append(x1 + (y - y1) * (x2 - x1) / (y2 - y1))
+
+    x_values = sorted(x_values)
+    if len(x_values) == 2:
+        if x_values[0] <= point[0] <= x_values[1]:
+            return "In Line"
+        elif point[0] < x_values[0]:
+            return "Outside off"
+        elif point[0] > x_values[1]:
+            return "Outside leg"
+    return False
+
+
+def hitting_stumps(stump_boxes, point):
+    x1, y1, x2, y2 = batting_stump(stump_boxes)
+    x, y = point
+    if x1 <= x <= x2 and y1 <= y <= y2:
+        return "Hitting"
+    return "Not-hitting"
+
+
+def judge(stump_boxes, pitch_point, impact_point, hitting_point, player="right_handed"):
+    """The three LBW checks for the key points of a delivery."""
+    pitching = pitching_side(stump_boxes, pitch_point)
+    desired_side = "Outside off" if player == "right_handed" else "Outside leg"
+    impact = point_in_corridor(stump_boxes, impact_point)
+    wickets = hitting_stumps(stump_boxes, hitting_point)
+    return {
+        "pitching": pitching,
+        "impact": "Inside" if impact else "Outside",
+        "wickets": wickets,
+        "pitching_ok": pitching == "In Line" or pitching == desired_side,
+        "impact_ok": bool(impact),
+        "wickets_ok": wickets == "Hitting",
+    }
+
+
+def decide(rows, stump_boxes, player="right_handed", extension_factor=EXTENSION_FACTOR):
+    """Track rows plus stump boxes to a verdict dict, None when there was no bounce."""
+    analysis = analyse_track(rows, stump_boxes, extension_factor)
+    if analysis is None:
+        return None
+    verdict = judge(stump_boxes, analysis["pitch_point"], analysis["impact_point"],
+                    analysis["hitting_point"], player)
+    verdict.update(
+        pitch_point=list(analysis["pitch_point"]),
+        impact_point=list(analysis["impact_point"]),
+        hitting_point=list(analysis["hitting_point"]),
+    )
+    return verdict
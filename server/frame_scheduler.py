@@ -0,0 +1,131 @@
+import config
+from decision import batting_stump
+
+
+class FrameScheduler:
+    """Decides which frames of a delivery the ball model runs on.
+
+    Out of play the ball is looked for on every ``stride``-th frame only, the
+    frames in between are filled in by interpolating between the detections
+    on either side. A sample that does not agree with that shortcut has the
+    skipped frames before it inferred after all ("refined"):
+
+    - the ball appeared or disappeared, so its first and last positions are
+      exact rather than up to ``stride - 1`` frames off;
+    - the ball rose again while below stump height, i.e. it pitched in the
+      gap. From then on every frame is inferred, since the bounce and the
+      path to the impact are what the decision is made from;
+    - the ball is more than ``tolerance`` ball sizes away from where its
+      last speed would have taken it.
+
+    Full rate ends once the ball has been missing for ``stride`` frames.
+    Frame numbers are the 1-based positions in the video, as in process_video.
+    """
+
+    def __init__(self, stump_boxes, stride=None, tolerance=None):
+        self.stride = max(1, stride or config.ADAPTIVE_STRIDE)
+        self.tolerance = config.ADAPTIVE_TOLERANCE if tolerance is None else tolerance
+        self.batting_top = batting_stump(stump_boxes)[1] if len(stump_boxes) == 2 else None
+        self.full_rate = False
+        self.present = False  # ball found in the last inferred frame
+        self.misses = 0
+        self.last_frame = None  # frame number, box and centre of the last detection
+        self.last_box = None
+        self.last_centre = None
+        self.velocity = None  # (vx, vy) per frame between the last two detections
+        self._gap = self.stride - 1  # the first frame is always a sample
+        # Counters for the sampling report
+        self.frames = 0
+        self.sampled = 0
+        self.refined = 0
+        self.interpolated = 0
+
+    def infer_next(self):
+        """Called once per frame in order, True if the ball model should see it."""
+        self.frames += 1
+        if self.full_rate or self._gap + 1 >= self.stride:
+            self._gap = 0
+            self.sampled += 1
+            return True
+        self._gap += 1
+        return False
+
+    def refine(self, frame, box, skipped):
+        """True if the ``skipped`` frames before the sample ``frame`` (ball ``box``, or None)
+        have to be inferred instead of interpolated."""
+        if not skipped:
+            return False
+        if self._must_refine(frame, box):
+            self.refined += skipped
+            return True
+        return False
+
+    def _must_refine(self, frame, box):
+        if (box is None) == self.present:
+            return True
+        if box is None:
+            return False
+        cx, cy, size = _centre(box)
+        last_x, last_y = self.last_centre
+        if self._pitched(cy, last_y):
+            return True
+        if self.velocity is None:
+            return False
+        steps = frame - self.last_frame
+        dx = cx - (last_x + self.velocity[0] * steps)
+        dy = cy - (last_y + self.velocity[1] * steps)
+        return (dx * dx + dy * dy) ** 0.5 > self.tolerance * max(size, 1)
+
+    def interpolate(self, frame, box, skipped):
+        """Boxes for the ``skipped`` frames before ``frame``, None where the ball is not known."""
+        if box is None or not self.present:
+            return [None] * skipped
+        self.interpolated += skipped
+        span = frame - self.last_frame
+        boxes = []
+        for number in range(frame - skipped, frame):
+            t = (number - self.last_frame) / span
+            boxes.append([a + (b - a) * t for a, b in zip(self.last_box, box)])
+        return boxes
+
+    def observe(self, frame, box):
+        """Feeds the first detection (x1, y1, x2, y2) of an inferred frame, None if there was none."""
+        if box is None:
+            self.present = False
+            self.misses += 1
+            if self.misses >= self.stride:
+                self.full_rate = False
+                self.velocity = None
+            return
+
+        cx, cy, _ = _centre(box)
+        if self.present:
+            last_x, last_y = self.last_centre
+            steps = frame - self.last_frame
+            self.velocity = ((cx - last_x) / steps, (cy - last_y) / steps)
+            if self._pitched(cy, last_y):
+                self.full_rate = True
+        self.present = True
+        self.misses = 0
+        self.last_frame = frame
+        self.last_box = list(box[:4])
+        self.last_centre = (cx, cy)
+
+    def _pitched(self, cy, last_y):
+        # Rising again while below stump height, as decision.PitchDetector sees a bounce
+        return self.batting_top is not None and cy > self.batting_top and cy < last_y
+
+    def report(self):
+        return {
+            "stride": self.stride,
+            "frames": self.frames,
+            "inferred": self.sampled + self.refined,
+            "skipped": self.frames - self.sampled - self.refined,
+            "interpolated": self.interpolated,
+            "refined": self.refined,
+        }
+
+
+def _centre(box):
+    x1, y1, x2, y2 = box[:4]
+    return (x1 + x2) / 2, (y1 + y2) / 2, max(x2 - x1, y2 - y1)
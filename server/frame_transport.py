@@ -0,0 +1,360 @@
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import time
+from multiprocessing import resource_tracker, shared_memory, util
+
+import cv2
+import numpy as np
+
+import config
+from ball_track import Detections
+from profiling import StageTimer
+from video_io import read_frames
+
+logger = logging.getLogger(__name__)
+
+# Decoding and ball inference of process_video in processes of their own, so
+# the Python parts of the job process (detections, drawing) no longer share a
+# GIL with them. Frames travel through a ring of shared-memory slots, nothing
+# but slot numbers and the few boxes of each frame goes through the queues:
+#
+#   decoder --ready--> inference workers --results--> job process
+#      ^                                                    |
+#      +------------------------free------------------------+
+#
+# A slot is taken from ``free`` by the decoder, filled, and handed to whichever
+# inference worker is idle. The job process puts the detections back in frame
+# order and returns the slot to ``free`` once it is done with the frame. When
+# every slot is in use the decoder waits, so a slow consumer bounds memory to
+# the ring instead of letting decoded frames pile up.
+
+_POLL = 0.5
+_STOP = "stop"
+
+# Every message about a frame carries the header of its video:
+# (seq, generation, ring name, slots, slot bytes, region, imgsz). ``seq``
+# numbers the videos, ``generation`` the rings, so slots of a video that was
+# given up on or of a ring that was replaced are told apart from current ones.
+
+
+class FrameRing:
+    """``slots`` fixed-size frame buffers in one shared-memory block.
+
+    Created by the job process; the decoder and the inference workers attach
+    to it by name. ``view`` is a NumPy array over a slot, frames are never
+    copied out of it.
+    """
+
+    def __init__(self, slots, slot_bytes, name=None):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        # Only the process that created the block unlinks it, not forked copies
+        self.owner = os.getpid() if name is None else None
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def view(self, slot, shape):
+        return np.ndarray(shape, np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def close(self):
+        try:
+            self.shm.close()
+        except BufferError:
+            # A view is still referenced, the mapping goes with the process
+            pass
+        if self.owner == os.getpid():
+            self.shm.unlink()
+
+
+class _Attached:
+    # The ring a child process last attached to, replaced when the job
+    # process grows the ring for larger frames
+    def __init__(self):
+        self.ring = None
+
+    def get(self, name, slots, slot_bytes):
+        if self.ring is None or self.ring.name != name:
+            if self.ring is not None:
+                self.ring.close()
+            self.ring = FrameRing(slots, slot_bytes, name=name)
+        return self.ring
+
+
+def _decode_loop(tasks, free, ready, results, active):
+    # Decoder process: one task per video, frames go into free slots in order
+    attached = _Attached()
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        video, path, size = task
+        seq, generation, ring_name, slots, slot_bytes = video[:5]
+        ring = attached.get(ring_name, slots, slot_bytes)
+        timer = StageTimer()
+        count = 0
+        cap = cv2.VideoCapture(path)
+        try:
+            if not cap.isOpened():
+                raise ValueError("Error opening video file.")
+            for frame in read_frames(cap, size, timer=timer):
+                if frame.nbytes > slot_bytes:
+                    raise ValueError(f"Frame of {frame.nbytes} bytes does not fit a {slot_bytes} byte slot")
+                while True:
+                    # Backpressure: waits until the job process recycles a slot.
+                    # Slots of a ring that was replaced since are dropped
+                    slot_generation, slot = free.get()
+                    if slot_generation == generation:
+                        break
+                if active.value != seq:
+                    # The job process gave up on this video
+                    free.put((slot_generation, slot))
+                    break
+                np.copyto(ring.view(slot, frame.shape), frame)
+                count += 1
+                ready.put((video, count, slot, frame.shape))
+        except Exception as e:
+            results.put((seq, "error", (generation, None, f"{type(e).__name__}: {e}")))
+        finally:
+            cap.release()
+        results.put((seq, "end", (count, dict(timer.totals))))
+
+
+def _infer_loop(ready, results, batch_size):
+    # Inference process: runs the ball model on the slots straight from shared
+    # memory, up to batch_size frames of the same video per call
+    from model_registry import registry
+
+    model = registry.ball_model()
+    if config.WARMUP_ON_STARTUP:
+        model(np.zeros((config.BALL_IMGSZ, config.BALL_IMGSZ, 3), np.uint8), verbose=False)
+    attached = _Attached()
+    carry = None
+    while True:
+        item = carry if carry is not None else ready.get()
+        carry = None
+        if item == _STOP:
+            return
+        batch = [item]
+        while len(batch) < batch_size:
+            try:
+                following = ready.get_nowait()
+            except queue.Empty:
+                break
+            if following == _STOP or following[0] != item[0]:
+                carry = following
+                break
+            batch.append(following)
+
+        video = item[0]
+        seq, generation, ring_name, slots, slot_bytes, region, imgsz = video
+        try:
+            ring = attached.get(ring_name, slots, slot_bytes)
+            start = time.perf_counter()
+            frames = [ring.view(slot, shape) for _, _, slot, shape in batch]
+            if region is None:
+                detected = model(frames, verbose=False)
+                offset = None
+            else:
+                x0, y0, x1, y1 = region
+                crops = [np.ascontiguousarray(frame[y0:y1, x0:x1]) for frame in frames]
+                detected = model(crops, imgsz=imgsz, verbose=False)
+                offset = (x0, y0)
+            seconds = (time.perf_counter() - start) / len(batch)
+            for (_, number, slot, shape), result in zip(batch, detected):
+                detections = Detections.from_result(result, offset)
+                results.put((seq, "frame", (generation, slot, number, shape, detections, seconds)))
+        except Exception as e:
+            for _, _, slot, _ in batch:
+                results.put((seq, "error", (generation, slot, f"{type(e).__name__}: {e}")))
+
+
+class FrameTransport:
+    """Decoder and ball inference processes of one job process, see the top of this module.
+
+    ``workers`` inference processes and the decoder are started once (by
+    ``start`` or the first ``detect``) and kept for every video; each loads
+    the ball model itself. The ring has ``slots`` slots sized for the largest
+    frame seen so far and is replaced by a larger one when a video needs it.
+    """
+
+    def __init__(self, workers=None, slots=None, batch_size=None):
+        self.workers = max(1, workers or config.FRAME_WORKERS)
+        self.slots = max(2, slots or config.FRAME_RING_SLOTS)
+        self.batch_size = max(1, batch_size or config.BALL_BATCH_SIZE)
+        self.ring = None
+        self._generation = 0
+        self._seq = itertools.count(1)
+        self._held = None  # slot of the last frame handed out
+        self._processes = []
+        self._pid = None
+
+    def start(self):
+        if self._processes:
+            return
+        context = multiprocessing.get_context(config.JOB_START_METHOD)
+        # Started before the children so they share it: attaching registers
+        # the ring too, a tracker of their own would unlink it when they exit
+        resource_tracker.ensure_running()
+        self._tasks = context.Queue()
+        self._free = context.Queue()
+        self._ready = context.Queue()
+        self._results = context.Queue()
+        self._active = context.Value('q', 0, lock=False)
+        self._processes = [context.Process(target=_decode_loop, name="frame-decoder", daemon=True,
+                                           args=(self._tasks, self._free, self._ready, self._results, self._active))]
+        for i in range(self.workers):
+            self._processes.append(context.Process(target=_infer_loop, name=f"frame-inference-{i}", daemon=True,
+                                                   args=(self._ready, self._results, self.batch_size)))
+        for process in self._processes:
+            process.start()
+        self._pid = os.getpid()
+        # Unlike atexit, also run when a job worker process exits
+        util.Finalize(None, self.close, exitpriority=10)
+        logger.info("Started a frame decoder and %d inference processes", self.workers)
+
+    def release(self, slot, generation=None):
+        """Hands a slot back to the decoder."""
+        self._free.put((self._generation if generation is None else generation, slot))
+
+    def _release_held(self):
+        if self._held is not None:
+            self.release(*self._held)
+            self._held = None
+
+    def _ring_for(self, frame_bytes):
+        if self.ring is not None and self.ring.slot_bytes >= frame_bytes:
+            return self.ring
+        # Larger frames than before: a new ring, the decoder drops the old
+        # ring's slots as they come back
+        if self.ring is not None:
+            self.ring.close()
+        self._generation += 1
+        self._held = None
+        self.ring = FrameRing(self.slots, frame_bytes)
+        for slot in range(self.slots):
+            self.release(slot)
+        logger.info("Frame ring of %d x %d bytes", self.slots, frame_bytes)
+        return self.ring
+
+    def _message(self):
+        while True:
+            try:
+                return self._results.get(timeout=_POLL)
+            except queue.Empty:
+                dead = [process.name for process in self._processes if not process.is_alive()]
+                if dead:
+                    self.close()
+                    raise RuntimeError(f"Frame worker process died: {', '.join(dead)}")
+
+    def detect(self, path, size, region=None, imgsz=None, timer=None):
+        """Decodes the video at ``path`` resized to ``size`` (width, height) and
+        runs the ball model on every frame, on ``region`` at ``imgsz`` if given.
+
+        Yields ``(frame, [Detections])`` in frame order. ``frame`` is a view of
+        its slot: it stays valid until the next frame is taken, the last one
+        until the next video. Decode, resize and inference seconds go to
+        ``timer``.
+        """
+        self.start()
+        self._release_held()
+        width, height = size
+        ring = self._ring_for(width * height * 3)
+        seq = next(self._seq)
+        self._active.value = seq
+        self._tasks.put(((seq, self._generation, ring.name, ring.slots, ring.slot_bytes, region, imgsz), path, size))
+
+        pending = {}
+        number, total = 1, None
+        try:
+            while total is None or number <= total:
+                if number in pending:
+                    slot, shape, detections = pending.pop(number)
+                    # The previous frame is done with, its slot can be refilled
+                    self._release_held()
+                    self._held = (slot, self._generation)
+                    yield ring.view(slot, shape), [detections]
+                    number += 1
+                    continue
+
+                message_seq, kind, payload = self._message()
+                if message_seq != seq:
+                    # Left over from a video that was given up on
+                    if kind != "end" and payload[1] is not None:
+                        self.release(payload[1], payload[0])
+                    continue
+                if kind == "frame":
+                    _, slot, frame_number, shape, detections, seconds = payload
+                    pending[frame_number] = (slot, shape, detections)
+                    if timer is not None:
+                        timer.add("ball_inference", seconds)
+                elif kind == "end":
+                    total, totals = payload
+                    if timer is not None:
+                        for stage, seconds in totals.items():
+                            timer.add(stage, seconds)
+                else:
+                    _, slot, error = payload
+                    if slot is not None:
+                        self.release(slot)
+                    raise RuntimeError(error)
+        finally:
+            if total is None or number <= total:
+                # Stopped early: the decoder stops at its next frame, frames
+                # still on their way are recycled when the next video reads them
+                self._active.value = 0
+            for slot, _, _ in pending.values():
+                self.release(slot)
+
+    def close(self):
+        if not self._processes:
+            return
+        if self._pid != os.getpid():
+            # Inherited by a fork, the processes and the ring are the parent's
+            self._processes = []
+            self.ring = None
+            return
+        self._tasks.put(None)
+        for _ in range(self.workers):
+            self._ready.put(_STOP)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+        self._held = None
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+
+_transport = None
+
+
+def _forget_transport():
+    global _transport
+    _transport = None
+
+
+# A forked job worker starts processes of its own on first use
+os.register_at_fork(after_in_child=_forget_transport)
+
+
+def get_transport(workers=None):
+    """The transport of this process, started with the first clip that uses it.
+    Asking for another number of inference ``workers`` replaces it."""
+    global _transport
+    workers = max(1, workers or config.FRAME_WORKERS)
+    if _transport is None or _transport.workers != workers:
+        if _transport is not None:
+            _transport.close()
+        _transport = FrameTransport(workers)
+    return _transport
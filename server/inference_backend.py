@@ -0,0 +1,124 @@
+import logging
+import os
+# Same as LBWDetection, the registry can load the models before it is imported
+os.environ.setdefault("KMP_DUPLICATE_LIB_OK", "TRUE")
+import shutil
+import tempfile
+from functools import partial
+
+import numpy as np
+import torch
+from ultralytics import YOLO
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Backends the registry can run the ball and stump models on. 'torch' is the
+# .pt checkpoint through ultralytics as before; the others run an export of
+# it made once into config.EXPORT_DIR, still behind the ultralytics predictor
+# so results, masks and NMS stay the same objects the pipeline reads.
+BACKENDS = ("torch", "onnx", "openvino")
+PRECISIONS = ("fp32", "fp16", "int8")
+_QUANTIZE = {"fp32": None, "fp16": 16, "int8": 8}
+
+
+def exported_path(weights, backend, precision):
+    """Where the export of ``weights`` for a backend and precision lives."""
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    name = f"{stem}_{precision}"
+    if backend == "onnx":
+        return os.path.join(config.EXPORT_DIR, name + ".onnx")
+    # ultralytics recognises OpenVINO models by this directory suffix
+    return os.path.join(config.EXPORT_DIR, name + "_openvino_model")
+
+
+def export(weights, backend, precision, imgsz=None):
+    """Exports ``weights`` unless an export at least as new exists, returns its path.
+
+    The export runs in a scratch directory and is moved into place when it is
+    complete, so worker processes starting together never load a half written
+    model; if two of them export at once the first one to finish wins.
+    """
+    target = exported_path(weights, backend, precision)
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(weights):
+        return target
+    if precision == "int8" and not config.INFERENCE_CALIBRATION_DATA:
+        raise ValueError("INT8 export needs calibration images, set LBW_INFERENCE_CALIBRATION_DATA "
+                         "to an ultralytics dataset yaml")
+
+    os.makedirs(config.EXPORT_DIR, exist_ok=True)
+    scratch = tempfile.mkdtemp(prefix="export-", dir=config.EXPORT_DIR)
+    try:
+        # ultralytics writes the export next to the weights it was given
+        source = shutil.copy(weights, scratch)
+        options = {"format": backend, "dynamic": True, "imgsz": imgsz or config.BALL_IMGSZ}
+        if _QUANTIZE[precision] is not None:
+            options["quantize"] = _QUANTIZE[precision]
+        if precision == "int8":
+            options["data"] = config.INFERENCE_CALIBRATION_DATA
+        logger.info("Exporting %s to %s (%s)", weights, backend, precision)
+        produced = YOLO(source).export(**options)
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        elif os.path.exists(target):
+            os.remove(target)
+        os.replace(produced.rstrip(os.sep), target)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return target
+
+
+def load(weights, device, backend=None, precision=None, threads=None):
+    """YOLO model for ``weights`` on the configured inference backend."""
+    backend = backend or config.INFERENCE_BACKEND
+    precision = precision or config.INFERENCE_PRECISION
+    threads = config.INFERENCE_THREADS if threads is None else threads
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown inference precision {precision!r}, expected one of {', '.join(PRECISIONS)}")
+
+    if backend == "torch":
+        if precision != "fp32":
+            logger.warning("The torch backend runs %s in fp32, %s needs the onnx or openvino backend",
+                           weights, precision)
+        if threads > 0:
+            torch.set_num_threads(threads)
+        return YOLO(weights).to(device)
+
+    path = export(weights, backend, precision)
+    model = YOLO(path)
+    if threads > 0:
+        # The predictor and its runtime session are built on the first call
+        model(np.zeros((64, 64, 3), dtype=np.uint8), verbose=False)
+        set_threads(model, backend, path, threads)
+    return model
+
+
+def set_threads(model, backend, path, threads):
+    """Rebuilds the runtime session of the model exported at ``path`` with ``threads`` intra-op threads.
+
+    ultralytics creates the ONNX Runtime session and the OpenVINO compiled
+    model with the runtime's defaults (one thread per core), which
+    oversubscribes the node when several job workers share it.
+    """
+    runtime = getattr(getattr(model.predictor, "model", None), "backend", None)
+    if backend == "onnx" and hasattr(runtime, "session"):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        runtime.session = onnxruntime.InferenceSession(
+            path, options, providers=runtime.session.get_providers())
+    elif backend == "openvino" and hasattr(runtime, "ov_compiled_model"):
+        import openvino as ov
+
+        core = ov.Core()
+        compile_config = {"PERFORMANCE_HINT": "LATENCY", "INFERENCE_NUM_THREADS": threads}
+        runtime.compile_model = partial(core.compile_model, device_name="CPU", config=compile_config)
+        xml = next(name for name in os.listdir(path) if name.endswith(".xml"))
+        runtime.ov_compiled_model = runtime.compile_model(core.read_model(os.path.join(path, xml)))
+    else:
+        logger.warning("Cannot set the thread count of this %s model, keeping the runtime default", backend)
@@ -0,0 +1,180 @@
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import config
+from model_registry import init_worker
+from profiling import metrics
+from upload_stream import upload_state
+
+
+class QueueFull(Exception):
+    pass
+
+
+def run_lbw_job(job_dir, video_path, stump_image_path, render_video=True, player="right_handed",
+                extension_factor=None, streaming=False):
+    """Runs one LBW decision inside a worker process.
+
+    Returns the result image path, the structured verdict and per-stage timings.
+    """
+    # Imported here, torch and ultralytics are only needed in the workers
+    from LBWDetection import LBWDetectionModel
+
+    model = LBWDetectionModel()
+    # Keep outputs inside the job directory so parallel jobs never share files
+    model.output_video_path = os.path.join(job_dir, 'output_video.mp4')
+    model.output_image_path = os.path.join(job_dir, 'output_image.jpg')
+    result = model.get_result(video_path, stump_image_path, render_video=render_video, player=player,
+                              extension_factor=extension_factor, streaming=streaming)
+    if result.startswith("Error:"):
+        raise RuntimeError(result)
+    return {"image": result, "verdict": model.job.VERDICT, "timings": model.job.TIMINGS.as_dict()}
+
+
+class Job:
+    __slots__ = ('id', 'dir', 'future', 'created', 'finished', 'result', 'verdict', 'timings', 'error', 'upload')
+
+    def __init__(self, job_id, job_dir):
+        self.id = job_id
+        self.dir = job_dir
+        self.future = None
+        self.created = time.time()
+        self.finished = None
+        self.result = None
+        self.verdict = None
+        self.timings = None
+        self.error = None
+        self.upload = None  # path of the video while it is streamed in, see /streams
+
+    @property
+    def status(self):
+        if self.future is None:
+            return "queued"
+        if not self.future.done():
+            return "running" if self.future.running() else "queued"
+        return "failed" if self.error else "done"
+
+    def to_dict(self):
+        info = {
+            "job_id": self.id,
+            "status": self.status,
+            "created": self.created,
+            "finished": self.finished,
+            "error": self.error,
+            "verdict": self.verdict,
+            "timings": self.timings,
+        }
+        if self.upload:
+            info["upload"] = upload_state(self.upload)
+        return info
+
+
+class JobManager:
+    """Bounded pool of worker processes running LBW jobs, with polling by job id.
+
+    Everything lives in this process: no broker, no database. At most
+    ``workers + queue_depth`` jobs are accepted at once, further submissions
+    raise QueueFull.
+    """
+
+    def __init__(self, workers, queue_depth, root, history):
+        self.workers = workers
+        self.max_active = workers + queue_depth
+        self.root = root
+        self.history = history
+        self._executor = None
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            context = multiprocessing.get_context(config.JOB_START_METHOD)
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=context, initializer=init_worker
+            )
+        return self._executor
+
+    def start(self):
+        """Starts the worker processes now instead of with the first job.
+
+        Blocks until workers have run their initializer (and loaded the models),
+        returns the pids of those that answered.
+        """
+        futures = [self.executor.submit(os.getpid) for _ in range(self.workers)]
+        return sorted({future.result() for future in futures})
+
+    def active_count(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.finished is None)
+
+    def is_full(self):
+        return self.active_count() >= self.max_active
+
+    def create(self):
+        """Reserves a job id and directory for the uploads, raises QueueFull when at capacity."""
+        with self._lock:
+            active = sum(1 for job in self._jobs.values() if job.finished is None)
+            if active >= self.max_active:
+                raise QueueFull(f"{active} jobs already queued or running")
+            job_id = uuid.uuid4().hex
+            job = Job(job_id, os.path.join(self.root, job_id))
+            os.makedirs(job.dir)
+            self._jobs[job_id] = job
+        return job
+
+    def submit(self, job, video_path, stump_image_path, render_video=True, player="right_handed",
+               extension_factor=None, streaming=False):
+        """Queues the job. With ``streaming`` the video is still being uploaded,
+        the worker decodes it as it arrives (and is held by the job meanwhile)."""
+        if streaming:
+            job.upload = video_path
+        job.future = self.executor.submit(run_lbw_job, job.dir, video_path, stump_image_path, render_video,
+                                          player, extension_factor, streaming)
+        job.future.add_done_callback(lambda future: self._finish(job, future))
+        return job
+
+    def _finish(self, job, future):
+        try:
+            output = future.result()
+            job.result = output["image"]
+            job.verdict = output["verdict"]
+            job.timings = output["timings"]
+        except Exception as e:
+            job.error = str(e) or type(e).__name__
+        job.finished = time.time()
+        metrics.observe_job(job.timings, status="failed" if job.error else "done")
+        self._prune()
+
+    def _prune(self):
+        with self._lock:
+            finished = [job for job in self._jobs.values() if job.finished is not None]
+            expired = finished[:max(0, len(finished) - self.history)]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            shutil.rmtree(job.dir, ignore_errors=True)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def forget(self, job_id):
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+        if job is not None:
+            shutil.rmtree(job.dir, ignore_errors=True)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+job_manager = JobManager(config.JOB_WORKERS, config.JOB_QUEUE_DEPTH, config.JOB_DIR, config.JOB_HISTORY)
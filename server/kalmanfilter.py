@@ -3,14 +3,26 @@ import numpy as np
 
 
 class KalmanFilter:
-    kf = cv2.KalmanFilter(4, 2)
-    kf.measurementMatrix = np.array([[1, 0, 0, 0], [0, 1, 0, 0]], np.float32)
-    kf.transitionMatrix = np.array([[1, 0, 1, 0], [0, 1, 0, 1], [0, 0, 1, 0], [0, 0, 0, 1]], np.float32)
+    # Constant-velocity model, state (x, y, vx, vy), measurement (x, y).
+    # The filter is created per instance so every tracked ball has its own state.
+    def __init__(self):
+        self.kf = cv2.KalmanFilter(4, 2)
+        self.kf.measurementMatrix = np.array([[1, 0, 0, 0], [0, 1, 0, 0]], np.float32)
+        self.kf.transitionMatrix = np.array([[1, 0, 1, 0], [0, 1, 0, 1], [0, 0, 1, 0], [0, 0, 0, 1]], np.float32)
 
+    def reset(self, coordX, coordY):
+        # Start from a known position with no velocity
+        self.kf.statePost = np.array([[coordX], [coordY], [0], [0]], np.float32)
+        self.kf.errorCovPost = np.eye(4, dtype=np.float32)
 
-    def predict(self, coordX, coordY):
+    def correct(self, coordX, coordY):
         measured = np.array([[np.float32(coordX)], [np.float32(coordY)]])
         self.kf.correct(measured)
+
+    def predict_next(self):
         predicted = self.kf.predict()
-        x, y = int(predicted[0]), int(predicted[1])
-        return x, y
\ No newline at end of file
+        return int(predicted[0, 0]), int(predicted[1, 0])
+
+    def predict(self, coordX, coordY):
+        self.correct(coordX, coordY)
+        return self.predict_next()
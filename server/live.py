@@ -0,0 +1,379 @@
+"""Live mode: one LBW verdict per delivery from a continuous frame source.
+
+A capture thread keeps the most recent frames of a camera, stream URL or a
+local file replayed at real-time speed in a ring buffer. The detector takes
+whatever frames are waiting (up to one batch), so it never falls further
+behind the camera than the ring is long. A segmenter cuts the ball
+detections into deliveries, and each delivery is decided and drawn like a
+recorded video.
+
+Run from the server directory:
+
+    python live.py --source 0 --stumps stumps.png
+    python live.py --source rtsp://camera/stream --render-dir deliveries
+    python live.py --source resized_video.mp4 --realtime
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+
+import cv2
+
+import config
+from LBWDetection import LBWDetectionModel, LBWJob
+from ball_track import BallTrack
+from decision import PitchDetector
+from trajectory_renderer import TrajectoryRenderer
+
+logger = logging.getLogger(__name__)
+
+
+class FrameRing:
+    """The most recent ``capacity`` frames of a live source, numbered from 0.
+
+    One thread writes, one reads in order. A reader more than ``capacity``
+    frames behind skips to the oldest frame still held, the frames it missed
+    are counted in ``dropped``. Writers that can wait (a file read as fast
+    as possible) pass ``wait=True`` to put and are held back instead.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = max(1, capacity)
+        self._frames = [None] * self.capacity
+        self._times = [0.0] * self.capacity
+        self._written = 0
+        self._read = 0
+        self._cond = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+
+    def __len__(self):
+        return self._written
+
+    def put(self, frame, timestamp, wait=False):
+        with self._cond:
+            if wait:
+                self._cond.wait_for(lambda: self._written - self._read < self.capacity or self.closed)
+            slot = self._written % self.capacity
+            self._frames[slot] = frame
+            self._times[slot] = timestamp
+            self._written += 1
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def read(self, start, max_count, timeout=None):
+        """Frames from number ``start`` on, at most ``max_count``, waiting for at least one.
+
+        Returns ``(first, frames, timestamps)``. ``first`` is past ``start``
+        when frames were overwritten, ``frames`` is empty once the source has
+        ended (or on timeout).
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._written > start or self.closed, timeout)
+            first = max(start, self._written - self.capacity)
+            self.dropped += first - start
+            end = min(self._written, first + max_count)
+            self._read = end
+            self._cond.notify_all()
+            slots = [n % self.capacity for n in range(first, end)]
+            return first, [self._frames[s] for s in slots], [self._times[s] for s in slots]
+
+
+class FrameSource:
+    """Capture thread feeding a FrameRing from ``cv2.VideoCapture``.
+
+    ``source`` is a device index, a stream URL or a file. Files are replayed
+    at their own frame rate when ``realtime`` is set, as a camera would
+    deliver them, otherwise as fast as the detector takes them, without
+    dropping frames.
+    """
+
+    def __init__(self, source, ring, realtime=False):
+        self.source = int(source) if str(source).isdigit() else source
+        self.ring = ring
+        self.realtime = realtime
+        self.lossless = not realtime and isinstance(self.source, str) and os.path.isfile(self.source)
+        self.cap = cv2.VideoCapture(self.source)
+        if not self.cap.isOpened():
+            raise ValueError(f"Could not open live source {source!r}")
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="capture", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        started = time.perf_counter()
+        count = 0
+        try:
+            while not self._stop.is_set():
+                ret, frame = self.cap.read()
+                if not ret or frame is None:
+                    break
+                if self.realtime:
+                    delay = started + count / self.fps - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                self.ring.put(frame, time.perf_counter(), wait=self.lossless)
+                count += 1
+        finally:
+            self.cap.release()
+            self.ring.close()
+
+    def stop(self):
+        self._stop.set()
+        self.ring.close()
+        self._thread.join()
+
+
+class DeliverySegmenter:
+    """Cuts a stream of per-frame ball positions into deliveries.
+
+    A delivery starts when the ball appears and ends when it has been missing
+    for more than ``end_gap`` frames (after the impact it leaves the frame or
+    is hidden by the batsman), or after ``max_frames``. A ball still in view
+    after that, e.g. lying on the pitch, has to disappear before the next
+    delivery can start. Deliveries with fewer than ``min_points`` detections
+    are dropped as noise.
+    """
+
+    IDLE, ACTIVE, COOLDOWN = "idle", "active", "cooldown"
+
+    def __init__(self, stump_boxes, end_gap, max_frames, min_points):
+        self.stump_boxes = stump_boxes
+        self.end_gap = end_gap
+        self.max_frames = max_frames
+        self.min_points = min_points
+        self.state = self.IDLE
+        self.track = None
+        self.first_frame = None
+        self._pitch = None
+        self._missed = 0
+
+    def step(self, frame_number, ball, stats=(0, 0, 0.0)):
+        """Feeds one frame, returns the finished delivery's BallTrack when this frame ends it."""
+        if self.state == self.COOLDOWN:
+            self._missed = self._missed + 1 if ball is None else 0
+            if self._missed > self.end_gap:
+                self.state = self.IDLE
+            return None
+
+        if self.state == self.IDLE:
+            if ball is None:
+                return None
+            self.state = self.ACTIVE
+            self.track = BallTrack()
+            self._pitch = PitchDetector(self.stump_boxes)
+            self.first_frame = frame_number
+            self._missed = 0
+
+        if ball is not None:
+            self._missed = 0
+            if self._pitch.step(frame_number, ball[1]):
+                self.track.mark_pitch()
+            self.track.append(frame_number, ball[0], ball[1], *stats)
+        else:
+            self._missed += 1
+
+        if self._missed > self.end_gap:
+            return self._end(self.IDLE)
+        if frame_number - self.first_frame + 1 >= self.max_frames:
+            return self._end(self.COOLDOWN)
+        return None
+
+    def flush(self):
+        """Ends the delivery in progress when the source ends, returns its track like step."""
+        if self.state != self.ACTIVE:
+            return None
+        return self._end(self.IDLE)
+
+    def _end(self, state):
+        track, self.track = self.track, None
+        self.state = state
+        self._missed = 0
+        if len(track) < self.min_points:
+            return None
+        return track
+
+
+class Delivery:
+    __slots__ = ('index', 'first_frame', 'last_frame', 'verdict', 'image', 'latency')
+
+    def __init__(self, index, first_frame, last_frame, verdict, image, latency):
+        self.index = index
+        self.first_frame = first_frame
+        self.last_frame = last_frame
+        self.verdict = verdict
+        self.image = image
+        self.latency = latency  # seconds from capture of the last frame to the verdict
+
+    def to_dict(self):
+        return {
+            "delivery": self.index,
+            "first_frame": self.first_frame,
+            "last_frame": self.last_frame,
+            "verdict": self.verdict,
+            "image": self.image,
+            "latency_seconds": round(self.latency, 4),
+        }
+
+
+class LiveSession:
+    """Runs an LBWDetectionModel over a live source, yielding a Delivery per delivery.
+
+    The stump boxes come from ``stump_img`` (a path or BGR array) or, without
+    one, from the first frame, the camera being fixed. With ``render_dir``
+    each verdict is also drawn, like get_result does, on the delivery's last
+    frame with the ball in it.
+    """
+
+    def __init__(self, model, source, stump_img=None, realtime=False, render_dir=None, player="right_handed",
+                 ring_size=None, end_gap=None, max_frames=None, min_points=None):
+        self.model = model
+        self.source = source
+        self.stump_img = cv2.imread(stump_img) if isinstance(stump_img, str) else stump_img
+        self.realtime = realtime
+        self.render_dir = render_dir
+        self.player = player
+        self.ring = FrameRing(ring_size or config.LIVE_RING_SIZE)
+        self.end_gap = config.LIVE_END_GAP if end_gap is None else end_gap
+        self.max_frames = max_frames or config.LIVE_MAX_DELIVERY_FRAMES
+        self.min_points = config.LIVE_MIN_POINTS if min_points is None else min_points
+        self.latency_budget = config.LIVE_LATENCY_BUDGET
+        self.processed = 0
+        self.deliveries = 0
+        self.late = 0
+        self.started = None
+        self._capture = None
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.started if self.started else 0.0
+        return {
+            "captured": len(self.ring),
+            "processed": self.processed,
+            "dropped": self.ring.dropped,
+            "deliveries": self.deliveries,
+            "late": self.late,
+            "processed_fps": round(self.processed / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+
+    def stop(self):
+        if self._capture is not None:
+            self._capture.stop()
+
+    def __iter__(self):
+        model = self.model
+        self._capture = FrameSource(self.source, self.ring, self.realtime).start()
+        self.started = time.perf_counter()
+        try:
+            first, frames, _ = self.ring.read(0, 1)
+            if not frames:
+                return
+            if self.stump_img is None:
+                self.stump_img = frames[0]
+            size = (self.stump_img.shape[1], self.stump_img.shape[0])
+
+            model.job = LBWJob()
+            model.stump_layout(self.stump_img)
+            stump_boxes = list(model.job.DETECTED_BOXES)
+            if len(stump_boxes) != 2:
+                raise ValueError(f"Expected 2 stumps in the stump image, found {len(stump_boxes)}")
+            model.ball_roi = model.pitch_corridor_roi(self.stump_img.shape) if model.use_roi else None
+            segmenter = DeliverySegmenter(stump_boxes, self.end_gap, self.max_frames, self.min_points)
+
+            last_seen = None  # (frame, boxes) of the latest frame with the ball
+            next_frame = 0
+            while True:
+                first, frames, times = self.ring.read(next_frame, model.batch_size)
+                if not frames:
+                    track = segmenter.flush()
+                    if track is not None:
+                        yield self._decide(track, segmenter.first_frame, next_frame - 1, last_seen,
+                                           time.perf_counter())
+                    return
+                # Same coordinate system as the stump image, like read_frames does for files
+                frames = [cv2.resize(f, size, interpolation=cv2.INTER_AREA) if (f.shape[1], f.shape[0]) != size
+                          else f for f in frames]
+                results = model.detect_ball_in_region(frames, model.ball_roi)
+                for offset, (frame, result, captured) in enumerate(zip(frames, results, times)):
+                    frame_number = first + offset
+                    boxes, ball, ball_stats = model.collect_detections([result], frame_number)
+                    if ball is not None:
+                        last_seen = (frame, boxes)
+                    track = segmenter.step(frame_number, ball, ball_stats or (0, 0, 0.0))
+                    if track is not None:
+                        yield self._decide(track, segmenter.first_frame, frame_number, last_seen, captured)
+                self.processed += len(frames)
+                next_frame = first + len(frames)
+                # Mask statistics are per delivery, do not let them grow for the whole session
+                model.job.PIXEL_VALUES.clear()
+        finally:
+            self.stop()
+
+    def _decide(self, track, first_frame, frame_number, last_seen, captured):
+        model = self.model
+        model.job = job = LBWJob()
+        model.stump_layout(self.stump_img)
+        job.TRACK = track
+        job.FRAME_COUNT = frame_number - first_frame + 1
+        if self.render_dir and last_seen is not None:
+            frame, boxes = last_seen
+            trajectory = TrajectoryRenderer(color=(0, 0, 255), thickness=7, opacity=0.5)
+            trajectory.reset(track.points(track.before()))
+            job.LAST_FRAME = model.annotate_frame(frame.copy(), self.stump_img, boxes, trajectory)
+        model.decide()
+        ok, reason = model.outcome()
+
+        self.deliveries += 1
+        image = None
+        if not ok:
+            job.VERDICT = {"pitching": None, "impact": None, "wickets": None, "reason": reason}
+        elif job.RESULT_FRAME is not None:
+            os.makedirs(self.render_dir, exist_ok=True)
+            image = model.output_image_path = os.path.join(self.render_dir, f"delivery_{self.deliveries:04d}.jpg")
+            model.draw_result(self.player)
+        else:
+            model.judge(self.player)
+        delivery = Delivery(self.deliveries, first_frame, frame_number, job.VERDICT, image,
+                            time.perf_counter() - captured)
+        logger.info("Delivery %d: %s", delivery.index, delivery.verdict)
+        if delivery.latency > self.latency_budget:
+            self.late += 1
+            logger.warning("Delivery %d took %.2fs, over the %.2fs budget", delivery.index, delivery.latency,
+                           self.latency_budget)
+        return delivery
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", required=True, help="camera index, stream URL or video file")
+    parser.add_argument("--stumps", help="stump image, defaults to the first frame")
+    parser.add_argument("--realtime", action="store_true", help="replay a file at its own frame rate")
+    parser.add_argument("--render-dir", help="write a result image per delivery here")
+    parser.add_argument("--player", default="right_handed", choices=["right_handed", "left_handed"])
+    args = parser.parse_args()
+
+    session = LiveSession(LBWDetectionModel(), args.source, stump_img=args.stumps, realtime=args.realtime,
+                          render_dir=args.render_dir, player=args.player)
+    try:
+        for delivery in session:
+            print(json.dumps(delivery.to_dict()), flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        session.stop()
+        print(json.dumps(session.stats()), flush=True)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,87 @@
+import threading
+
+import numpy as np
+
+import config
+
+
+class ModelRegistry:
+    """Loads each YOLO network once per process and hands out the shared instance.
+
+    Loading the weights and moving them to the device used to happen on every
+    request. The registry does it lazily on first use (or eagerly through
+    ``warm_up``) and every ``LBWDetectionModel`` reuses the same objects.
+    Models run on ``config.INFERENCE_BACKEND``, see inference_backend.
+
+    Importing this module does not import torch or ultralytics (about a
+    second), they are only loaded with the first model.
+    """
+
+    def __init__(self):
+        self._device = None
+        self._paths = {
+            'ball': config.BALL_MODEL_PATH,
+            'stump': config.STUMP_MODEL_PATH,
+        }
+        self._models = {}
+        self._lock = threading.Lock()
+
+    @property
+    def device(self):
+        if self._device is None:
+            import torch
+            self._device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        return self._device
+
+    def get(self, name):
+        model = self._models.get(name)
+        if model is None:
+            with self._lock:
+                # Another thread may have loaded it while we waited
+                model = self._models.get(name)
+                if model is None:
+                    import inference_backend
+                    model = inference_backend.load(self._paths[name], self.device)
+                    self._models[name] = model
+        return model
+
+    def ball_model(self):
+        return self.get('ball')
+
+    def stump_model(self):
+        return self.get('stump')
+
+    def register(self, name, model):
+        # Swap in an already built model, e.g. the stand-ins the benchmarks use
+        with self._lock:
+            self._models[name] = model
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def load(self):
+        # Weights only, no inference: safe before forking workers, which then
+        # share the loaded models copy-on-write (see config.PRELOAD)
+        for name in self._paths:
+            self.get(name)
+
+    def warm_up(self, size=640):
+        # A first inference pays for predictor setup and kernel selection,
+        # do it here instead of inside the first user request
+        dummy = np.zeros((size, size, 3), dtype=np.uint8)
+        for name in self._paths:
+            self.get(name)(dummy, verbose=False)
+
+
+# One registry per worker process
+registry = ModelRegistry()
+
+
+def init_worker():
+    # Initializer of the job and batch worker pools: each worker process loads
+    # the models once and keeps them for every job it runs
+    if config.WARMUP_ON_STARTUP:
+        registry.warm_up()
+        if config.FRAME_WORKERS:
+            from frame_transport import get_transport
+            get_transport().start()
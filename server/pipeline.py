@@ -0,0 +1,176 @@
+import queue
+import threading
+import time
+
+# Decode, inference and encode of process_video can run as three threads
+# connected by bounded FIFO queues. OpenCV and torch release the GIL while they
+# work, so the stages overlap; one producer and one consumer per queue keep
+# the frame order (and so every decision) exactly as in the sequential loop,
+# and memory is bounded by the queue depths.
+
+_DONE = object()
+_POLL = 0.1
+
+
+class _Failure:
+    __slots__ = ('error',)
+
+    def __init__(self, error):
+        self.error = error
+
+
+class StageLoad:
+    """Busy and waiting time of one pipeline stage."""
+
+    __slots__ = ('name', 'busy', 'starved', 'blocked')
+
+    def __init__(self, name):
+        self.name = name
+        self.busy = 0.0
+        self.starved = 0.0  # waiting on an empty input queue
+        self.blocked = 0.0  # waiting on a full output queue
+
+
+class PipelineStats:
+    """Per-stage utilisation of a pipelined run: busy time over the pipeline wall time."""
+
+    def __init__(self, *names):
+        self.stages = {name: StageLoad(name) for name in names}
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def __getitem__(self, name):
+        return self.stages[name]
+
+    def stop(self, main=None):
+        """Ends the run. The ``main`` stage runs on the calling thread, it was
+        busy whenever it was not waiting on a queue."""
+        self.finished = time.perf_counter()
+        if main is not None:
+            load = self.stages[main]
+            load.busy = max(self.finished - self.started - load.starved - load.blocked, 0.0)
+
+    def as_dict(self):
+        wall = (self.finished or time.perf_counter()) - self.started
+        report = {}
+        for name, load in self.stages.items():
+            report[name] = {
+                "busy_seconds": round(load.busy, 6),
+                "starved_seconds": round(load.starved, 6),
+                "blocked_seconds": round(load.blocked, 6),
+                "utilisation": round(load.busy / wall, 3) if wall > 0 else 0.0,
+            }
+        return {"wall_seconds": round(wall, 6), "stages": report}
+
+
+def _put(q, item, stop):
+    # Blocking put that gives up once the consumer has gone away
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_POLL)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def prefetch(iterable, depth, load=None, consumer=None, name="decoder"):
+    """Iterates ``iterable`` in a background thread, ``depth`` items ahead.
+
+    Items come out in order, an exception raised by the producer is re-raised
+    in the consumer. ``load`` and ``consumer`` (StageLoad) receive the
+    producer's busy and blocked time and the consumer's starved time.
+    """
+    items = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+    clock = time.perf_counter
+
+    def produce():
+        try:
+            iterator = iter(iterable)
+            while not stop.is_set():
+                start = clock()
+                item = next(iterator, _DONE)
+                if load is not None:
+                    load.busy += clock() - start
+                if item is _DONE:
+                    break
+                start = clock()
+                if not _put(items, item, stop):
+                    return
+                if load is not None:
+                    load.blocked += clock() - start
+        except BaseException as e:
+            _put(items, _Failure(e), stop)
+            return
+        _put(items, _DONE, stop)
+
+    worker = threading.Thread(target=produce, name=name, daemon=True)
+    worker.start()
+    try:
+        while True:
+            start = clock()
+            item = items.get()
+            if consumer is not None:
+                consumer.starved += clock() - start
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        # Also reached when the consumer stops early, unblock and reap the producer
+        stop.set()
+        worker.join()
+
+
+class ThreadedSink:
+    """Runs a sink's ``write`` calls in a background thread behind a bounded queue.
+
+    ``load`` receives the writer thread's busy and starved time, ``producer``
+    the time the caller was blocked on a full queue. ``release`` drains the
+    queue, releases the wrapped sink and re-raises the first write error, if
+    any.
+    """
+
+    def __init__(self, sink, depth, load=None, producer=None, name="encoder"):
+        self.sink = sink
+        self.load = load
+        self.producer = producer
+        self._frames = queue.Queue(maxsize=max(1, depth))
+        self._stop = threading.Event()
+        self._error = None
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def _run(self):
+        clock = time.perf_counter
+        while True:
+            start = clock()
+            frame = self._frames.get()
+            if self.load is not None:
+                self.load.starved += clock() - start
+            if frame is _DONE:
+                return
+            if self._error is not None:
+                continue  # keep draining so the producer never blocks
+            start = clock()
+            try:
+                self.sink.write(frame)
+            except Exception as e:
+                self._error = e
+            if self.load is not None:
+                self.load.busy += clock() - start
+
+    def write(self, frame):
+        start = time.perf_counter()
+        _put(self._frames, frame, self._stop)
+        if self.producer is not None:
+            self.producer.blocked += time.perf_counter() - start
+
+    def release(self):
+        _put(self._frames, _DONE, self._stop)
+        self._worker.join()
+        self.sink.release()
+        if self._error is not None:
+            raise self._error
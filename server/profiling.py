@@ -0,0 +1,137 @@
+import threading
+import time
+from collections import defaultdict
+
+
+# Stages of the LBW pipeline, in the order they run for a frame
+STAGES = (
+    "decode", "resize", "ball_inference", "mask_processing", "stump_overlay",
+    "trajectory_drawing", "encode", "result_rendering", "track_cache", "result_store",
+    "upload_wait",  # streamed uploads only, also counted in decode
+)
+
+
+class _Stage:
+    __slots__ = ('timer', 'name', 'start')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class StageTimer:
+    """Accumulated wall time per pipeline stage for a single job.
+
+    Only a perf_counter pair and a dict update per measurement, cheap enough
+    to stay on for every frame. Pipelined runs add from several threads, and
+    attach their per-stage utilisation report as ``utilisation``; adaptive
+    sampling attaches its count of inferred and skipped frames as ``sampling``.
+    """
+
+    __slots__ = ('totals', 'calls', 'created', 'utilisation', 'sampling', '_lock')
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.created = time.perf_counter()
+        self.utilisation = None
+        self.sampling = None
+        self._lock = threading.Lock()
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.totals[name] += seconds
+            self.calls[name] += 1
+
+    def as_dict(self):
+        with self._lock:
+            stages = {name: {"seconds": round(self.totals[name], 6), "calls": self.calls[name]}
+                      for name in self.totals}
+        report = {"stages": stages, "total_seconds": round(time.perf_counter() - self.created, 6)}
+        if self.utilisation is not None:
+            report["utilisation"] = self.utilisation
+        if self.sampling is not None:
+            report["sampling"] = self.sampling
+        return report
+
+
+class Histogram:
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+    def __init__(self):
+        self.counts = [0] * len(self.BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Process-wide histograms of per-job stage timings, exposed on /metrics."""
+
+    def __init__(self):
+        self._stages = defaultdict(Histogram)
+        self._jobs = defaultdict(int)
+        self._sampled_frames = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def observe_job(self, timings, status="done"):
+        with self._lock:
+            self._jobs[status] += 1
+            if not timings:
+                return
+            if "sampling" in timings:
+                for kind in ("inferred", "skipped"):
+                    self._sampled_frames[kind] += timings["sampling"][kind]
+            for name, stage in timings["stages"].items():
+                self._stages[name].observe(stage["seconds"])
+            self._stages["total"].observe(timings["total_seconds"])
+
+    def render_prometheus(self):
+        lines = [
+            "# HELP lbw_jobs_total LBW jobs finished, by status.",
+            "# TYPE lbw_jobs_total counter",
+        ]
+        with self._lock:
+            for status, count in sorted(self._jobs.items()):
+                lines.append(f'lbw_jobs_total{{status="{status}"}} {count}')
+            if self._sampled_frames:
+                lines += [
+                    "# HELP lbw_sampled_frames_total Frames of adaptively sampled jobs, by whether the ball model ran.",
+                    "# TYPE lbw_sampled_frames_total counter",
+                ]
+                for kind, count in sorted(self._sampled_frames.items()):
+                    lines.append(f'lbw_sampled_frames_total{{kind="{kind}"}} {count}')
+            lines += [
+                "# HELP lbw_stage_seconds Time spent per job in each pipeline stage.",
+                "# TYPE lbw_stage_seconds histogram",
+            ]
+            for name, hist in sorted(self._stages.items()):
+                cumulative = 0
+                for bound, count in zip(Histogram.BUCKETS, hist.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'lbw_stage_seconds_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+                lines.append(f'lbw_stage_seconds_sum{{stage="{name}"}} {hist.sum}')
+                lines.append(f'lbw_stage_seconds_count{{stage="{name}"}} {hist.count}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Leftovers of writers that died halfway are removed after this many seconds
+_STALE_TEMP = 600
+# mkstemp files are private, the renamed ones get the mode open() would give
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def write_atomic(path, data):
+    """Writes ``data`` to ``path`` through a temporary file and a rename, readers
+    see the old file or the new one, never a partial write."""
+    directory = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, 0o666 & ~_UMASK)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def copy_atomic(src, dst):
+    directory = os.path.dirname(dst) or "."
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    os.close(fd)
+    try:
+        shutil.copyfile(src, tmp)
+        os.chmod(tmp, 0o666 & ~_UMASK)
+        os.replace(tmp, dst)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _size(path):
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def _remove(path):
+    try:
+        if not os.path.isdir(path):
+            os.unlink(path)
+            return
+        # Renamed away first, a reader never sees an entry with files missing
+        trash = os.path.join(os.path.dirname(path), ".trash-" + uuid.uuid4().hex)
+        os.rename(path, trash)
+    except FileNotFoundError:
+        return
+    shutil.rmtree(trash, ignore_errors=True)
+
+
+def evict(root, max_bytes, ttl):
+    """Bounds a directory whose entries (files or directories) are used by touching them.
+
+    Entries not touched for ``ttl`` seconds are removed, then the least
+    recently touched ones until the rest fits in ``max_bytes``. Returns the
+    number of entries removed.
+    """
+    now = time.time()
+    entries = []
+    removed = 0
+    for entry in os.scandir(root):
+        try:
+            mtime = entry.stat().st_mtime
+            if entry.name.startswith("."):
+                if now - mtime > _STALE_TEMP:
+                    _remove(entry.path)
+                continue
+            if ttl and now - mtime > ttl:
+                _remove(entry.path)
+                removed += 1
+                continue
+            entries.append((mtime, _size(entry.path), entry.path))
+        except FileNotFoundError:
+            # Removed by another process meanwhile
+            continue
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        _remove(path)
+        total -= size
+        removed += 1
+    return removed
+
+
+class StoredResult:
+    """A finished result out of the store. ``image`` and ``video`` are paths
+    inside the entry, None where the entry has no such file."""
+
+    __slots__ = ('key', 'verdict', 'image', 'video')
+
+    def __init__(self, key, verdict, image, video):
+        self.key = key
+        self.verdict = verdict
+        self.image = image
+        self.video = video
+
+
+class ResultStore:
+    """Finished LBW results on disk, keyed by the content of the inputs and the settings.
+
+    Each entry is a directory holding ``result.json`` (the verdict), the
+    result image and, if it was rendered, the annotated video. An entry is
+    assembled in a temporary directory and renamed into place, so parallel
+    jobs (in any worker process) never see or clobber half-written results;
+    when two of them finish the same key the first one stays. Lookups touch
+    the entry and every put evicts the ones unused for longest, see
+    config.RESULT_STORE_*.
+    """
+
+    def __init__(self, root, max_bytes, ttl):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(track_key, **settings):
+        """Entry key from the track cache key (video, stump image, detection
+        settings) and the settings of the decision and the drawing."""
+        return hashlib.sha1((track_key + json.dumps(settings, sort_keys=True)).encode()).hexdigest()
+
+    def _meta(self, key):
+        try:
+            with open(os.path.join(self.root, key, "result.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def get(self, key, video=False):
+        """The stored result, None if there is none (or it has no video while ``video`` is wanted)."""
+        path = os.path.join(self.root, key)
+        meta = self._meta(key)
+        if meta is None or (video and not meta["video"]):
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return StoredResult(key, meta["verdict"],
+                            os.path.join(path, "image.jpg") if meta["image"] else None,
+                            os.path.join(path, "video.mp4") if meta["video"] else None)
+
+    def put(self, key, verdict, image=None, video=None):
+        """Stores copies of the ``image`` and ``video`` files with the verdict."""
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, key)
+        meta = self._meta(key)
+        if meta is not None and (meta["video"] or not video):
+            return
+        tmp = tempfile.mkdtemp(dir=self.root, prefix=".tmp-")
+        try:
+            if image:
+                shutil.copyfile(image, os.path.join(tmp, "image.jpg"))
+            if video:
+                shutil.copyfile(video, os.path.join(tmp, "video.mp4"))
+            with open(os.path.join(tmp, "result.json"), "w") as f:
+                json.dump({"verdict": verdict, "image": bool(image), "video": bool(video), "created": time.time()}, f)
+            if meta is not None:
+                # An entry without the video, replaced by this one that has it
+                _remove(path)
+            try:
+                os.rename(tmp, path)
+            except OSError:
+                # Another job stored the same result first
+                shutil.rmtree(tmp, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        removed = evict(self.root, self.max_bytes, self.ttl)
+        if removed:
+            logger.debug("Evicted %d stored results", removed)
+
+    def _entries(self):
+        if not os.path.isdir(self.root):
+            return []
+        return [entry.path for entry in os.scandir(self.root) if not entry.name.startswith(".")]
+
+    def stats(self):
+        entries = self._entries()
+        return {"entries": len(entries), "bytes": sum(_size(path) for path in entries),
+                "hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        for path in self._entries():
+            _remove(path)
+
+
+result_store = ResultStore(config.RESULT_STORE_DIR, config.RESULT_STORE_MB * 1024 * 1024, config.RESULT_STORE_TTL)
@@ -0,0 +1,104 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+import config
+
+
+def image_hash(image):
+    """Content hash of a decoded image, shape included."""
+    digest = hashlib.sha1(str(image.shape).encode())
+    digest.update(np.ascontiguousarray(image).data)
+    return digest.hexdigest()
+
+
+class StumpLayout:
+    """Everything derived from one stump image, computed once and shared read-only.
+
+    ``boxes`` are the stump boxes (x1, y1, x2, y2), ``crops`` pairs each box
+    with its crop already sized for blending, and ``overlay`` is the grey
+    pitch-corridor fill (None unless exactly two stumps were found).
+    """
+
+    __slots__ = ('boxes', 'crops', 'in_line', 'overlay')
+
+    def __init__(self, stump_img, boxes):
+        self.boxes = tuple(boxes)
+        self.crops = []
+        for x1, y1, x2, y2 in self.boxes:
+            crop = cv2.resize(stump_img[y1:y2, x1:x2], (x2 - x1, y2 - y1))
+            crop.flags.writeable = False
+            self.crops.append((crop, (x1, y1, x2, y2)))
+
+        self.in_line = []
+        self.overlay = None
+        if len(self.boxes) == 2:
+            (x1a, y1a, x2a, y2a), (x1b, y1b, x2b, y2b) = self.boxes
+            self.in_line = [[x2b, y2b], [x2a, y2a], [x1a, y2a], [x1b, y2b]]
+            pts = np.array(self.in_line, np.int32).reshape((-1, 1, 2))
+            self.overlay = np.zeros_like(stump_img)
+            cv2.fillPoly(self.overlay, [pts], (128, 128, 128))
+            self.overlay.flags.writeable = False
+
+
+class StumpCache:
+    """In-process LRU of StumpLayout keyed by the stump image content hash.
+
+    Repeat submissions from the same camera setup skip stump inference.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._layouts = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_detect(self, stump_img, model, class_name='stumps'):
+        key = (image_hash(stump_img), class_name)
+        with self._lock:
+            layout = self._layouts.get(key)
+            if layout is not None:
+                self._layouts.move_to_end(key)
+                self.hits += 1
+                return layout
+
+        layout = StumpLayout(stump_img, detect_stumps(stump_img, model, class_name))
+
+        with self._lock:
+            self.misses += 1
+            self._store(key, layout)
+        return layout
+
+    def seed(self, stump_img, boxes, class_name='stumps'):
+        """Stores boxes detected elsewhere (e.g. by another worker) for this stump image."""
+        layout = StumpLayout(stump_img, [tuple(map(int, box)) for box in boxes])
+        with self._lock:
+            self._store((image_hash(stump_img), class_name), layout)
+        return layout
+
+    def _store(self, key, layout):
+        self._layouts[key] = layout
+        self._layouts.move_to_end(key)
+        while len(self._layouts) > self.maxsize:
+            self._layouts.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._layouts.clear()
+
+
+def detect_stumps(stump_img, model, class_name='stumps'):
+    results = model(stump_img)[0]
+    boxes = []
+    for i, box in enumerate(results.boxes.xyxy):
+        cls = int(results.boxes.cls[i])
+        if results.names[cls] == class_name:
+            boxes.append(tuple(map(int, box)))
+    return boxes
+
+
+stump_cache = StumpCache(config.STUMP_CACHE_SIZE)
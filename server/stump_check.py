@@ -0,0 +1,56 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import config
+from model_registry import registry
+
+
+def decode_image(data):
+    """BGR array from encoded image bytes, None if they are not an image."""
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+class StumpChecker:
+    """Stump detection alone, for checking the camera framing before a delivery.
+
+    Only the stump model is loaded, on the first check (or by warm_up), never
+    the ball model. Preview frames are inferred at ``imgsz`` whatever their
+    size, so a downscaled preview costs the same as a full photo. Any other
+    image is the capture the LBW run will use, it is checked the way that run
+    detects stumps, so both find the same boxes. Boxes come back in the
+    coordinates of the frame that was sent.
+    """
+
+    def __init__(self, imgsz=None, class_name='stumps'):
+        self.imgsz = imgsz or config.STUMP_CHECK_IMGSZ
+        self.class_name = class_name
+        # The ultralytics predictor is not safe to call from several threads
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        self.check(np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8), preview=True)
+
+    def check(self, image, preview=False):
+        """``result`` is True when exactly two stumps are in the frame, as for a full LBW run."""
+        start = time.perf_counter()
+        # At the model's own size otherwise, like stump_cache.detect_stumps
+        options = {"imgsz": self.imgsz} if preview else {}
+        with self._lock:
+            result = registry.stump_model()(image, verbose=False, **options)[0]
+        boxes = []
+        for box, conf, cls in zip(result.boxes.xyxy.tolist(), result.boxes.conf.tolist(), result.boxes.cls.tolist()):
+            if result.names[int(cls)] == self.class_name:
+                boxes.append({"box": [int(v) for v in box], "confidence": round(conf, 3)})
+        return {
+            "result": len(boxes) == 2,
+            "boxes": boxes,
+            "width": image.shape[1],
+            "height": image.shape[0],
+            "inference_ms": round((time.perf_counter() - start) * 1000, 1),
+        }
+
+
+stump_checker = StumpChecker()
@@ -0,0 +1,202 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import config
+from ball_track import BallTrack, Detections
+
+logger = logging.getLogger(__name__)
+
+_CHUNK = 1 << 20
+# One row per box of a frame's detections, pixels is -1 when the frame had no masks
+_DETECTIONS_DTYPE = np.dtype([('frame', np.int32), ('xyxy', np.int32, 4), ('conf', np.float32),
+                              ('pixels', np.int64)])
+
+
+def file_hash(*paths, settings=None):
+    """sha1 over the bytes of every file, plus the detection settings that shape the track."""
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(_CHUNK), b""):
+                digest.update(chunk)
+        digest.update(b"\0")
+    if settings is not None:
+        digest.update(json.dumps(settings, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def pack_detections(per_frame):
+    """One array from the Detections of every frame (frame numbers from 1)."""
+    parts = []
+    for frame_number, detections in enumerate(per_frame, start=1):
+        n = len(detections.xyxy)
+        if not n:
+            continue
+        part = np.zeros(n, _DETECTIONS_DTYPE)
+        part['frame'] = frame_number
+        part['xyxy'] = detections.xyxy
+        part['conf'] = detections.conf
+        part['pixels'] = -1
+        if detections.pixels is not None:
+            part['pixels'][:len(detections.pixels)] = detections.pixels
+        parts.append(part)
+    return np.concatenate(parts) if parts else np.zeros(0, _DETECTIONS_DTYPE)
+
+
+def unpack_detections(packed, frames):
+    """Detections of each of ``frames`` frames, as pack_detections got them."""
+    bounds = np.searchsorted(packed['frame'], np.arange(1, frames + 2))
+    per_frame = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        part = packed[start:end]
+        pixels = part['pixels'][part['pixels'] >= 0]
+        per_frame.append(Detections(part['xyxy'].astype(int), part['conf'], pixels if len(pixels) else None))
+    return per_frame
+
+
+class TrackEntry:
+    """Stage-one output of one delivery, enough to re-run the decision and draw the result.
+
+    ``frame`` is the annotated last frame before the predicted path is drawn
+    on it, None if no frame could be decoded. ``detections`` are the
+    Detections of every frame, so the annotated video can be drawn again
+    without inference (None for entries stored before they were kept).
+    """
+
+    __slots__ = ('rows', 'stump_boxes', 'frame', 'frames', 'detections')
+
+    def __init__(self, rows, stump_boxes, frame, frames, detections=None):
+        self.rows = rows
+        self.stump_boxes = [tuple(box) for box in stump_boxes]
+        self.frame = frame
+        self.frames = frames
+        self.detections = detections
+
+
+class TrackCache:
+    """On-disk cache of ball tracks keyed by the video and stump image content.
+
+    Entries live in one SQLite file so every worker process shares them, the
+    least recently used ones are evicted once the stored bytes exceed
+    ``max_bytes``.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        # Opened lazily and per process, SQLite connections do not survive a fork
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tracks ("
+                " key TEXT PRIMARY KEY, rows BLOB NOT NULL, stump_boxes TEXT NOT NULL,"
+                " frame BLOB, frames INTEGER NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS tracks_last_used ON tracks (last_used)")
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(tracks)")]
+            if "detections" not in columns:
+                # Cache files from before the per-frame detections were kept
+                with conn:
+                    conn.execute("ALTER TABLE tracks ADD COLUMN detections BLOB")
+            self._conn = conn
+        return self._conn
+
+    def get(self, key):
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT rows, stump_boxes, frame, frames, detections FROM tracks WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            with conn:
+                conn.execute("UPDATE tracks SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+
+        rows_blob, boxes_json, frame_blob, frames, detections_blob = row
+        rows = np.load(io.BytesIO(rows_blob), allow_pickle=False).astype(BallTrack.DTYPE, copy=False)
+        frame = None
+        if frame_blob is not None:
+            frame = cv2.imdecode(np.frombuffer(frame_blob, np.uint8), cv2.IMREAD_COLOR)
+        detections = None
+        if detections_blob is not None:
+            packed = np.load(io.BytesIO(detections_blob), allow_pickle=False).astype(_DETECTIONS_DTYPE, copy=False)
+            detections = unpack_detections(packed, frames)
+        return TrackEntry(rows, json.loads(boxes_json), frame, frames, detections)
+
+    def put(self, key, entry):
+        buffer = io.BytesIO()
+        np.save(buffer, np.ascontiguousarray(entry.rows), allow_pickle=False)
+        rows_blob = buffer.getvalue()
+        frame_blob = None
+        if entry.frame is not None:
+            # PNG keeps the result frame lossless, the cached decision draws on it
+            # exactly as the uncached run would
+            ok, encoded = cv2.imencode(".png", entry.frame)
+            if ok:
+                frame_blob = encoded.tobytes()
+        detections_blob = None
+        if entry.detections is not None:
+            buffer = io.BytesIO()
+            np.save(buffer, pack_detections(entry.detections), allow_pickle=False)
+            detections_blob = buffer.getvalue()
+        boxes_json = json.dumps([list(map(int, box)) for box in entry.stump_boxes])
+        size = len(rows_blob) + len(frame_blob or b"") + len(boxes_json) + len(detections_blob or b"")
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO tracks (key, rows, stump_boxes, frame, frames, size, last_used, detections)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, rows_blob, boxes_json, frame_blob, entry.frames, size, time.time(), detections_blob),
+                )
+                self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM tracks").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM tracks ORDER BY last_used").fetchall():
+            conn.execute("DELETE FROM tracks WHERE key = ?", (key,))
+            total -= size
+            logger.debug("Evicted track %s", key)
+            if total <= self.max_bytes:
+                break
+
+    def stats(self):
+        with self._lock:
+            conn = self._connect()
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM tracks").fetchone()
+        return {"entries": count, "bytes": total, "hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM tracks")
+
+
+track_cache = TrackCache(config.TRACK_CACHE_PATH, config.TRACK_CACHE_MB * 1024 * 1024)
@@ -0,0 +1,108 @@
+import cv2
+import numpy as np
+
+
+def _line_roi(shape, p1, p2, thickness):
+    # Bounding box of a thick line, clipped to the frame
+    pad = thickness // 2 + 2
+    x0 = max(min(p1[0], p2[0]) - pad, 0)
+    y0 = max(min(p1[1], p2[1]) - pad, 0)
+    x1 = min(max(p1[0], p2[0]) + pad + 1, shape[1])
+    y1 = min(max(p1[1], p2[1]) + pad + 1, shape[0])
+    return x0, y0, x1, y1
+
+
+def blend_line(frame, p1, p2, color, thickness, opacity=0.5):
+    """Draws a semi-transparent line, blending only the line's bounding box.
+
+    Same pixels as copying the whole frame, drawing on the copy and blending
+    the two full frames, since untouched pixels blend with themselves.
+    """
+    x0, y0, x1, y1 = _line_roi(frame.shape, p1, p2, thickness)
+    if x0 >= x1 or y0 >= y1:
+        return frame
+    roi = frame[y0:y1, x0:x1]
+    overlay = roi.copy()
+    cv2.line(overlay, (p1[0] - x0, p1[1] - y0), (p2[0] - x0, p2[1] - y0), color, thickness)
+    cv2.addWeighted(overlay, opacity, roi, 1 - opacity, 0, roi)
+    return frame
+
+
+class TrajectoryRenderer:
+    """Persistent trajectory layer for the pre-pitch ball path.
+
+    The old renderer blended every segment onto a full copy of the frame,
+    for every frame, which is O(n^2) full-frame work over a clip. Here each
+    segment is drawn once into a per-pixel coverage count. A pixel covered by
+    k segments has been blended with the line colour k times. The composite
+    looks that result up in a table built by repeating cv2.addWeighted, so
+    rounding matches the old output exactly.
+    """
+
+    MAX_COVERAGE = 255
+
+    def __init__(self, color=(0, 0, 255), thickness=7, opacity=0.5):
+        self.color = color
+        self.thickness = thickness
+        self.opacity = opacity
+        self.points = []
+        self._coverage = None
+        self._bbox = None  # x0, y0, x1, y1 of every covered pixel
+        self._table = self._blend_table()
+
+    def _blend_table(self):
+        # table[k, v, c] = channel value v after k blends with color[c]
+        values = np.repeat(np.arange(256, dtype=np.uint8)[None, :, None], 3, axis=2)
+        line = np.empty_like(values)
+        line[:] = np.array(self.color, np.uint8)
+        table = np.empty((self.MAX_COVERAGE + 1, 256, 3), np.uint8)
+        table[0] = values[0]
+        for k in range(1, self.MAX_COVERAGE + 1):
+            values = cv2.addWeighted(line, self.opacity, values, 1 - self.opacity, 0)
+            table[k] = values[0]
+        return table
+
+    def reset(self, points=()):
+        """Starts again from ``points``, e.g. after the track was trimmed."""
+        self.points = []
+        self._bbox = None
+        if self._coverage is not None:
+            self._coverage[:] = 0
+        for point in points:
+            self.append(point)
+
+    def append(self, point):
+        point = (int(point[0]), int(point[1]))
+        if self.points and self._coverage is not None:
+            self._add_segment(self.points[-1], point)
+        self.points.append(point)
+
+    def _add_segment(self, p1, p2):
+        x0, y0, x1, y1 = _line_roi(self._coverage.shape, p1, p2, self.thickness)
+        if x0 >= x1 or y0 >= y1:
+            return
+        mask = np.zeros((y1 - y0, x1 - x0), np.uint8)
+        cv2.line(mask, (p1[0] - x0, p1[1] - y0), (p2[0] - x0, p2[1] - y0), 1, self.thickness)
+        roi = self._coverage[y0:y1, x0:x1]
+        np.minimum(roi + mask, self.MAX_COVERAGE, out=roi)
+        if self._bbox is None:
+            self._bbox = (x0, y0, x1, y1)
+        else:
+            bx0, by0, bx1, by1 = self._bbox
+            self._bbox = (min(bx0, x0), min(by0, y0), max(bx1, x1), max(by1, y1))
+
+    def render(self, frame):
+        """Composites the trajectory onto ``frame`` in place and returns it."""
+        if self._coverage is None or self._coverage.shape != frame.shape[:2]:
+            # First frame (or new frame size): rasterise the segments we already have
+            self._coverage = np.zeros(frame.shape[:2], np.uint16)
+            self.reset(list(self.points))
+        if self._bbox is None:
+            return frame
+        x0, y0, x1, y1 = self._bbox
+        roi = frame[y0:y1, x0:x1]
+        coverage = self._coverage[y0:y1, x0:x1]
+        covered = coverage > 0
+        k = coverage[covered][:, None]
+        roi[covered] = self._table[k, roi[covered], np.arange(3)]
+        return frame
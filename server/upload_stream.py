@@ -0,0 +1,157 @@
+import io
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# A video upload in progress is a spool file that grows as the request body
+# arrives, next to marker files written by the server once it is over. The
+# worker decoding it may live in another process, so the file system is the
+# only thing both sides share.
+_COMPLETE = ".done"
+_FAILED = ".failed"
+_SIZE = ".size"
+
+
+class UploadFailed(Exception):
+    pass
+
+
+def mark_complete(path):
+    with open(path + _COMPLETE, "w"):
+        pass
+
+
+def mark_failed(path, reason=""):
+    with open(path + _FAILED, "w") as f:
+        f.write(reason)
+
+
+def declare_size(path, size):
+    with open(path + _SIZE, "w") as f:
+        f.write(str(int(size)))
+
+
+def declared_size(path):
+    try:
+        with open(path + _SIZE) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def upload_state(path):
+    """'complete', 'failed' or 'pending'."""
+    if os.path.exists(path + _COMPLETE):
+        return "complete"
+    if os.path.exists(path + _FAILED):
+        return "failed"
+    return "pending"
+
+
+class UploadStream(io.BufferedIOBase):
+    """Blocking reader over a spool file that is still being written.
+
+    Reads past the bytes received so far wait for more to arrive, so a
+    decoder handed this stream works through the video as it is uploaded.
+    Seeks relative to the end wait for the whole upload unless its length is
+    known, from ``size`` or from the server (declare_size). ``timeout``
+    bounds how long the stream waits without the file growing.
+
+    A failed or stalled upload reads as the end of the stream, the reason is
+    kept in ``error`` since the decoder calling us cannot pass it on.
+    """
+
+    def __init__(self, path, size=None, timeout=60.0, poll=0.01):
+        super().__init__()
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.poll = poll
+        self._file = open(path, "rb")
+        self._pos = 0
+        self.waited = 0.0  # seconds spent waiting on the upload
+        self.error = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def _received(self):
+        return os.fstat(self._file.fileno()).st_size
+
+    def _wait(self, needed=None, ready=None):
+        """Waits until ``needed`` bytes are on disk, ``ready()`` is true or the
+        upload is over, returns the bytes on disk."""
+        start = last_growth = time.perf_counter()
+        received = self._received()
+        while needed is None or received < needed:
+            if ready is not None and ready():
+                break
+            state = upload_state(self.path)
+            if state == "failed":
+                raise UploadFailed(f"Upload of {os.path.basename(self.path)} was aborted")
+            if state == "complete":
+                received = self._received()
+                break
+            time.sleep(self.poll)
+            now = time.perf_counter()
+            grown = self._received()
+            if grown != received:
+                received, last_growth = grown, now
+            elif now - last_growth > self.timeout:
+                raise UploadFailed(f"Upload of {os.path.basename(self.path)} stalled for {self.timeout:.0f}s")
+        self.waited += time.perf_counter() - start
+        return received
+
+    def wait_complete(self):
+        """Blocks until the whole upload is on disk, returns its size."""
+        return self._wait()
+
+    def _length(self):
+        if self.size is None:
+            self.size = declared_size(self.path)
+        return self.size
+
+    def read(self, n=-1):
+        try:
+            if n is None or n < 0:
+                self._wait()
+            else:
+                self._wait(self._pos + n)
+        except UploadFailed as e:
+            logger.warning("%s", e)
+            self.error = e
+            return b""
+        self._file.seek(self._pos)
+        data = self._file.read(n)
+        self._pos += len(data)
+        return data
+
+    def read1(self, n=-1):
+        return self.read(n)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        else:
+            try:
+                received = self._wait(ready=lambda: self._length() is not None)
+            except UploadFailed as e:
+                self.error = e
+                received = self._received()
+            end = self._length()
+            self._pos = (end if end is not None else received) + offset
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        self._file.close()
+        super().close()
@@ -0,0 +1,54 @@
+import time
+
+import cv2
+
+
+def read_frames(cap, size=None, timer=None):
+    """Decode frames from an open capture, resizing them in memory to ``size``.
+
+    ``size`` is ``(width, height)``; frames already at that size are passed
+    through untouched. Decode and resize time go to ``timer`` when given.
+    """
+    clock = time.perf_counter
+    while True:
+        start = clock()
+        ret, frame = cap.read()
+        if timer is not None:
+            timer.add("decode", clock() - start)
+        if not ret or frame is None:
+            return
+        if size is not None and (frame.shape[1], frame.shape[0]) != tuple(size):
+            start = clock()
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            if timer is not None:
+                timer.add("resize", clock() - start)
+        yield frame
+
+
+class VideoSink:
+    """Optional writer for the annotated video.
+
+    The writer is opened on the first frame so it always matches the size of
+    the frames it is given. Encode time goes to ``timer`` when given.
+    """
+
+    def __init__(self, path, fps, fourcc='mp4v', timer=None):
+        self.path = path
+        self.fps = fps
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self.timer = timer
+        self._writer = None
+
+    def write(self, frame):
+        start = time.perf_counter()
+        if self._writer is None:
+            height, width = frame.shape[:2]
+            self._writer = cv2.VideoWriter(self.path, self.fourcc, self.fps, (width, height))
+        self._writer.write(frame)
+        if self.timer is not None:
+            self.timer.add("encode", time.perf_counter() - start)
+
+    def release(self):
+        if self._writer is not None:
+            self._writer.release()
+            self._writer = None